@@ -0,0 +1,101 @@
+#!/usr/bin/python
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import optparse, time
+from proton import *
+
+parser = optparse.OptionParser(usage="usage: %prog [options]",
+                               description="sends messages to an echo server "
+                               "over many connections and reports the rate "
+                               "at which the echoes come back")
+parser.add_option("-H", "--host", default="127.0.0.1",
+                  help="host to connect to (default %default)")
+parser.add_option("-p", "--port", type="int", default=5672,
+                  help="port to connect to (default %default)")
+parser.add_option("-c", "--connections", type="int", default=100,
+                  help="number of connections (default %default)")
+parser.add_option("-m", "--messages", type="int", default=1000,
+                  help="messages sent on each connection (default %default)")
+parser.add_option("-s", "--size", type="int", default=64,
+                  help="message size in bytes (default %default)")
+
+opts, args = parser.parse_args()
+
+class EchoClient(Handler):
+  """
+  Sends a fixed number of messages on each connection and closes the
+  connection once all of them have been echoed back.
+  """
+
+  def __init__(self, size):
+    self.body = "x"*size
+    self.remaining = {}
+    self.received = 0
+
+  def start(self, connection, count):
+    ssn = connection.session()
+    snd = ssn.sender("echo-in")
+    snd.target.address = "echo"
+    rcv = ssn.receiver("echo-out")
+    rcv.source.address = "echo"
+    connection.open()
+    ssn.open()
+    snd.open()
+    rcv.open()
+    rcv.flow(count)
+    self.remaining[connection] = count
+
+  def on_link_flow(self, event):
+    snd = event.link
+    if not snd.is_sender:
+      return
+    conn = snd.connection
+    remaining = self.remaining[conn]
+    while snd.credit > 0 and remaining > 0:
+      remaining -= 1
+      dlv = snd.delivery(str(remaining))
+      snd.send(self.body)
+      snd.advance()
+      dlv.settle()
+    self.remaining[conn] = remaining
+
+  def on_delivery(self, event):
+    dlv = event.delivery
+    rcv = dlv.link
+    if not rcv.is_receiver or dlv.partial:
+      return
+    rcv.recv(dlv.pending)
+    rcv.advance()
+    dlv.settle()
+    self.received += 1
+    if rcv.credit == 0:
+      rcv.connection.close()
+
+client = EchoClient(opts.size)
+reactor = Reactor(client)
+for i in range(opts.connections):
+  client.start(reactor.connect(opts.host, opts.port), opts.messages)
+
+start = time.time()
+reactor.run()
+elapsed = time.time() - start
+reactor.close()
+
+print "%d connections, %d messages echoed in %.2fs (%.0f msgs/s)" % \
+    (opts.connections, client.received, elapsed, client.received/elapsed)
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import optparse
+from proton import *
+
+parser = optparse.OptionParser(usage="usage: %prog [options]",
+                               description="echoes every message it receives")
+parser.add_option("-H", "--host", default="0.0.0.0",
+                  help="host to listen on (default %default)")
+parser.add_option("-p", "--port", type="int", default=5672,
+                  help="port to listen on (default %default)")
+parser.add_option("-c", "--credit", type="int", default=100,
+                  help="credit granted to each sender (default %default)")
+
+opts, args = parser.parse_args()
+
+class EchoServer(Handler):
+  """
+  Opens everything the client opens, and sends each message that arrives
+  on a connection back over the sending link of that connection.
+  """
+
+  def __init__(self, credit):
+    self.credit = credit
+    self.senders = {}
+
+  def on_connection_remote_open(self, event):
+    event.connection.open()
+
+  def on_connection_remote_close(self, event):
+    self.senders.pop(event.connection, None)
+    event.connection.close()
+
+  def on_session_remote_open(self, event):
+    event.session.open()
+
+  def on_link_remote_open(self, event):
+    link = event.link
+    link.source.copy(link.remote_source)
+    link.target.copy(link.remote_target)
+    link.open()
+    if link.is_receiver:
+      link.flow(self.credit)
+    else:
+      self.senders[link.connection] = link
+
+  def on_delivery(self, event):
+    dlv = event.delivery
+    rcv = dlv.link
+    if not rcv.is_receiver or dlv.partial:
+      return
+    body = rcv.recv(dlv.pending)
+    rcv.advance()
+    dlv.settle()
+    rcv.flow(1)
+    snd = self.senders.get(rcv.connection)
+    if snd is not None:
+      reply = snd.delivery(dlv.tag)
+      snd.send(body)
+      snd.advance()
+      reply.settle()
+
+reactor = Reactor(EchoServer(opts.credit))
+reactor.listen(opts.host, opts.port)
+try:
+  reactor.run()
+except KeyboardInterrupt:
+  pass
+reactor.close()
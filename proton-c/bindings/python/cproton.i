@@ -85,6 +85,109 @@
 
 %apply pn_uuid_t { pn_decimal128_t };
 
+%typemap(in) (pn_message_t **MESSAGES, size_t COUNT) {
+  PyObject *seq = PySequence_Fast($input, "expected a sequence of messages");
+  if (!seq) {
+    return NULL;
+  }
+  $2 = PySequence_Fast_GET_SIZE(seq);
+  $1 = (pn_message_t **) malloc(($2 ? $2 : 1)*sizeof(pn_message_t *));
+  for (size_t i = 0; i < $2; i++) {
+    void *msg = NULL;
+    if (!SWIG_IsOK(SWIG_ConvertPtr(PySequence_Fast_GET_ITEM(seq, i), &msg,
+                                   $descriptor(pn_message_t *), 0)) || !msg) {
+      free($1);
+      Py_DECREF(seq);
+      PyErr_SetString(PyExc_TypeError, "expected a sequence of messages");
+      return NULL;
+    }
+    $1[i] = (pn_message_t *) msg;
+  }
+  Py_DECREF(seq);
+}
+
+%typemap(freearg) (pn_message_t **MESSAGES, size_t COUNT) {
+  free($1);
+}
+
+// the sequence is held until the call returns, which keeps the
+// address strings it refers to alive
+%typemap(in) (const char **ADDRESSES, size_t COUNT) (PyObject *seq = NULL) {
+  seq = PySequence_Fast($input, "expected a sequence of addresses");
+  if (!seq) {
+    return NULL;
+  }
+  $2 = PySequence_Fast_GET_SIZE(seq);
+  $1 = ($1_ltype) malloc(($2 ? $2 : 1)*sizeof(*$1));
+  for (size_t i = 0; i < $2; i++) {
+    $1[i] = PyString_AsString(PySequence_Fast_GET_ITEM(seq, i));
+    if (!$1[i]) {
+      free($1);
+      Py_DECREF(seq);
+      return NULL;
+    }
+  }
+}
+
+%typemap(freearg) (const char **ADDRESSES, size_t COUNT) {
+  free($1);
+  Py_XDECREF(seq$argnum);
+}
+
+// Accepts any object supporting the buffer protocol (str, bytearray,
+// memoryview, buffer, mmap) without copying its contents.
+%typemap(in) (const char *INPUT_BUFFER, size_t INPUT_LENGTH) (Py_buffer view) {
+  view.obj = NULL;
+  if (PyObject_CheckBuffer($input)) {
+    if (PyObject_GetBuffer($input, &view, PyBUF_SIMPLE) < 0) {
+      return NULL;
+    }
+    $1 = ($1_ltype) view.buf;
+    $2 = view.len;
+  } else {
+    const void *buf;
+    Py_ssize_t len;
+    if (PyObject_AsReadBuffer($input, &buf, &len) < 0) {
+      return NULL;
+    }
+    $1 = ($1_ltype) buf;
+    $2 = len;
+  }
+}
+
+%typemap(freearg) (const char *INPUT_BUFFER, size_t INPUT_LENGTH) {
+  if (view$argnum.obj) {
+    PyBuffer_Release(&view$argnum);
+  }
+}
+
+// Accepts any object supporting the writable buffer protocol
+// (bytearray, writable memoryview, mmap) and writes into it directly.
+%typemap(in) (char *OUTPUT_BUFFER, size_t OUTPUT_LENGTH) (Py_buffer view) {
+  view.obj = NULL;
+  if (PyObject_CheckBuffer($input)) {
+    if (PyObject_GetBuffer($input, &view, PyBUF_WRITABLE) < 0) {
+      return NULL;
+    }
+    $1 = (char *) view.buf;
+    $2 = view.len;
+  } else {
+    void *buf;
+    Py_ssize_t len;
+    if (PyObject_AsWriteBuffer($input, &buf, &len) < 0) {
+      return NULL;
+    }
+    $1 = (char *) buf;
+    $2 = len;
+  }
+}
+
+%typemap(freearg) (char *OUTPUT_BUFFER, size_t OUTPUT_LENGTH) {
+  if (view$argnum.obj) {
+    PyBuffer_Release(&view$argnum);
+  }
+}
+
 int pn_message_load(pn_message_t *msg, char *STRING, size_t LENGTH);
 %ignore pn_message_load;
 
@@ -103,6 +206,24 @@ int pn_message_load_json(pn_message_t *msg, char *STRING, size_t LENGTH);
 int pn_message_encode(pn_message_t *msg, char *OUTPUT, size_t *OUTPUT_SIZE);
 %ignore pn_message_encode;
 
+int pn_message_decode(pn_message_t *msg, const char *INPUT_BUFFER, size_t INPUT_LENGTH);
+%ignore pn_message_decode;
+
+%rename(pn_message_encode_into) wrap_pn_message_encode_into;
+%inline %{
+  int wrap_pn_message_encode_into(pn_message_t *msg, char *OUTPUT_BUFFER, size_t OUTPUT_LENGTH, size_t offset) {
+    if (offset > OUTPUT_LENGTH) {
+      return PN_ARG_ERR;
+    }
+    size_t size = OUTPUT_LENGTH - offset;
+    int err = pn_message_encode(msg, OUTPUT_BUFFER + offset, &size);
+    if (err) {
+      return err;
+    }
+    return size;
+  }
+%}
+
 int pn_message_save(pn_message_t *msg, char *OUTPUT, size_t *OUTPUT_SIZE);
 %ignore pn_message_save;
 
@@ -118,6 +239,41 @@ int pn_message_save_amqp(pn_message_t *msg, char *OUTPUT, size_t *OUTPUT_SIZE);
 int pn_message_save_json(pn_message_t *msg, char *OUTPUT, size_t *OUTPUT_SIZE);
 %ignore pn_message_save_json;
 
+int pn_messenger_put_many(pn_messenger_t *messenger, pn_message_t **MESSAGES, size_t COUNT);
+%ignore pn_messenger_put_many;
+
+int pn_messenger_put_fanout(pn_messenger_t *messenger, pn_message_t *msg, const char **ADDRESSES, size_t COUNT);
+%ignore pn_messenger_put_fanout;
+
+int pn_message_decode_headers(pn_message_t *msg, const char *INPUT_BUFFER, size_t INPUT_LENGTH);
+%ignore pn_message_decode_headers;
+
+int pn_messenger_put_raw(pn_messenger_t *messenger, const char *address, const char *INPUT_BUFFER, size_t INPUT_LENGTH);
+%ignore pn_messenger_put_raw;
+
+// returns (code, encoded) where encoded is None unless a message was
+// popped, builds a python string so it must hold the GIL
+%nothread pn_messenger_get_raw;
+%rename(pn_messenger_get_raw) wrap_pn_messenger_get_raw;
+%inline %{
+  PyObject *wrap_pn_messenger_get_raw(pn_messenger_t *messenger) {
+    size_t size = 0;
+    int err = pn_messenger_get_raw(messenger, NULL, &size);
+    if (err != PN_OVERFLOW) {
+      return Py_BuildValue("(iO)", err, Py_None);
+    }
+    PyObject *encoded = PyString_FromStringAndSize(NULL, size);
+    if (!encoded) return NULL;
+    err = pn_messenger_get_raw(messenger, PyString_AS_STRING(encoded), &size);
+    if (err) {
+      Py_DECREF(encoded);
+      return Py_BuildValue("(iO)", err, Py_None);
+    }
+    return Py_BuildValue("(iN)", err, encoded);
+  }
+%}
+%ignore pn_messenger_get_raw;
+
 ssize_t pn_link_send(pn_link_t *transport, char *STRING, size_t LENGTH);
 %ignore pn_link_send;
 
@@ -135,6 +291,73 @@ ssize_t pn_link_send(pn_link_t *transport, char *STRING, size_t LENGTH);
 %}
 %ignore pn_link_recv;
 
+// reads the current delivery into a buffer shared by all calls, which is
+// only safe while the GIL is held
+%nothread pn_link_recv_message;
+
+%{
+  // a scratch buffer grown past PNI_SCRATCH_RETAIN for one large
+  // message is released once that message is done with
+  #define PNI_SCRATCH_INITIAL (1024)
+  #define PNI_SCRATCH_RETAIN (64*1024)
+
+  typedef struct {
+    char *bytes;
+    size_t capacity;
+  } pni_scratch_t;
+
+  static int pni_scratch_reserve(pni_scratch_t *scratch, size_t size) {
+    if (size <= scratch->capacity) return 0;
+    size_t capacity = scratch->capacity ? scratch->capacity : PNI_SCRATCH_INITIAL;
+    while (capacity < size) capacity *= 2;
+    char *bytes = (char *) realloc(scratch->bytes, capacity);
+    if (!bytes) return PN_ERR;
+    scratch->bytes = bytes;
+    scratch->capacity = capacity;
+    return 0;
+  }
+
+  static void pni_scratch_trim(pni_scratch_t *scratch) {
+    if (scratch->capacity > PNI_SCRATCH_RETAIN) {
+      free(scratch->bytes);
+      scratch->bytes = NULL;
+      scratch->capacity = 0;
+    }
+  }
+
+  static pni_scratch_t pni_recv_scratch = {NULL, 0};
+%}
+
+%inline %{
+  // returns 1 once a message is decoded and the link advanced, 0 if the
+  // current delivery is missing, unreadable or incomplete, or an error
+  // recorded on the message's error
+  int pn_link_recv_message(pn_link_t *link, pn_message_t *msg) {
+    pn_delivery_t *dlv = pn_link_current(link);
+    if (!dlv || !pn_delivery_readable(dlv) || pn_delivery_partial(dlv)) {
+      return 0;
+    }
+    size_t pending = pn_delivery_pending(dlv);
+    if (pni_scratch_reserve(&pni_recv_scratch, pending)) {
+      return pn_error_format(pn_message_error(msg), PN_ERR,
+                             "unable to allocate %lu bytes for the message",
+                             (unsigned long) pending);
+    }
+    ssize_t n = pn_link_recv(link, pni_recv_scratch.bytes, pending);
+    int err;
+    if (n < 0) {
+      err = pn_error_format(pn_message_error(msg), n,
+                            "unable to read the delivery: %s", pn_code(n));
+    } else {
+      err = pn_message_decode(msg, pni_recv_scratch.bytes, n);
+    }
+    pni_scratch_trim(&pni_recv_scratch);
+    if (err) return err;
+    pn_link_advance(link);
+    return 1;
+  }
+%}
+
 ssize_t pn_transport_push(pn_transport_t *transport, char *STRING, size_t LENGTH);
 %ignore pn_transport_push;
 
@@ -152,6 +375,58 @@ ssize_t pn_transport_push(pn_transport_t *transport, char *STRING, size_t LENGTH
 %}
 %ignore pn_transport_peek;
 
+%inline %{
+  ssize_t pn_transport_push_from(pn_transport_t *transport, const char *INPUT_BUFFER, size_t INPUT_LENGTH,
+                                 size_t offset, size_t length) {
+    if (offset > INPUT_LENGTH || length > INPUT_LENGTH - offset) {
+      return PN_ARG_ERR;
+    }
+    return pn_transport_push(transport, INPUT_BUFFER + offset, length);
+  }
+
+  ssize_t pn_transport_peek_into(pn_transport_t *transport, char *OUTPUT_BUFFER, size_t OUTPUT_LENGTH,
+                                 size_t offset) {
+    if (offset > OUTPUT_LENGTH) {
+      return PN_ARG_ERR;
+    }
+    return pn_transport_peek(transport, OUTPUT_BUFFER + offset, OUTPUT_LENGTH - offset);
+  }
+%}
+
+// memoryviews over the transport's own input and output buffers, for
+// socket I/O without intermediate strings; a view is only valid until
+// the next call to pn_transport_process or pn_transport_pop
+%nothread pn_transport_tail_view;
+%nothread pn_transport_head_view;
+
+%{
+  static PyObject *pni_memoryview(char *start, size_t size, int readonly) {
+    Py_buffer view;
+    if (PyBuffer_FillInfo(&view, NULL, start, size, readonly, PyBUF_FULL_RO) < 0) {
+      return NULL;
+    }
+    return PyMemoryView_FromBuffer(&view);
+  }
+%}
+
+%inline %{
+  PyObject *pn_transport_tail_view(pn_transport_t *transport) {
+    ssize_t capacity = pn_transport_capacity(transport);
+    if (capacity <= 0) {
+      Py_RETURN_NONE;
+    }
+    return pni_memoryview(pn_transport_tail(transport), capacity, 0);
+  }
+
+  PyObject *pn_transport_head_view(pn_transport_t *transport) {
+    ssize_t pending = pn_transport_pending(transport);
+    if (pending <= 0) {
+      Py_RETURN_NONE;
+    }
+    return pni_memoryview((char *) pn_transport_head(transport), pending, 1);
+  }
+%}
+
 %rename(pn_delivery) wrap_pn_delivery;
 %inline %{
   pn_delivery_t *wrap_pn_delivery(pn_link_t *link, char *STRING, size_t LENGTH) {
@@ -160,6 +435,63 @@ ssize_t pn_transport_push(pn_transport_t *transport, char *STRING, size_t LENGTH
 %}
 %ignore pn_delivery;
 
+// encodes msg into a buffer shared by all calls, which is only safe
+// while the GIL is held
+%nothread pn_link_send_message;
+
+%{
+  static pni_scratch_t pni_send_scratch = {NULL, 0};
+
+  static int pni_send_encode(pn_link_t *link, pn_message_t *msg, size_t *size) {
+    size_t needed = PNI_SCRATCH_INITIAL;
+    while (true) {
+      if (pni_scratch_reserve(&pni_send_scratch, needed)) {
+        return pn_error_format(pn_link_error(link), PN_ERR,
+                               "unable to allocate %lu bytes for the message",
+                               (unsigned long) needed);
+      }
+      *size = pni_send_scratch.capacity;
+      int err = pn_message_encode(msg, pni_send_scratch.bytes, size);
+      if (err != PN_OVERFLOW) {
+        if (err && !pn_error_code(pn_message_error(msg))) {
+          pn_error_format(pn_message_error(msg), err, "%s", pn_code(err));
+        }
+        return err;
+      }
+      needed = 2*pni_send_scratch.capacity;
+    }
+  }
+%}
+
+%inline %{
+  // returns the new delivery, or NULL with the cause recorded on the
+  // message's error if it cannot be encoded, and on the link's otherwise
+  pn_delivery_t *pn_link_send_message(pn_link_t *link, pn_message_t *msg, char *STRING, size_t LENGTH) {
+    pn_error_clear(pn_message_error(msg));
+    if (pn_link_current(link)) {
+      pn_error_format(pn_link_error(link), PN_STATE_ERR,
+                      "the link already has a current delivery");
+      return NULL;
+    }
+    size_t size;
+    int err = pni_send_encode(link, msg, &size);
+    if (err) {
+      pni_scratch_trim(&pni_send_scratch);
+      return NULL;
+    }
+    pn_delivery_t *dlv = pn_delivery(link, pn_dtag(STRING, LENGTH));
+    ssize_t n = pn_link_send(link, pni_send_scratch.bytes, size);
+    pni_scratch_trim(&pni_send_scratch);
+    if (n != (ssize_t) size) {
+      pn_error_format(pn_link_error(link), n < 0 ? n : PN_ERR,
+                      "unable to send the message: %s", pn_code(n < 0 ? n : PN_ERR));
+      return NULL;
+    }
+    pn_link_advance(link);
+    return dlv;
+  }
+%}
+
 %rename(pn_delivery_tag) wrap_pn_delivery_tag;
 %inline %{
   void wrap_pn_delivery_tag(pn_delivery_t *delivery, char **ALLOC_OUTPUT, size_t *ALLOC_SIZE) {
@@ -185,7 +517,7 @@ ssize_t pn_transport_push(pn_transport_t *transport, char *STRING, size_t LENGTH
 %}
 %ignore pn_message_data;
 
-ssize_t pn_data_decode(pn_data_t *data, char *STRING, size_t LENGTH);
+ssize_t pn_data_decode(pn_data_t *data, const char *INPUT_BUFFER, size_t INPUT_LENGTH);
 %ignore pn_data_decode;
 
 %rename(pn_data_encode) wrap_pn_data_encode;
@@ -228,6 +560,1017 @@ bool pn_ssl_get_protocol_name(pn_ssl_t *ssl, char *OUTPUT, size_t MAX_OUTPUT_SIZ
 int pn_ssl_get_peer_hostname(pn_ssl_t *ssl, char *OUTPUT, size_t *OUTPUT_SIZE);
 %ignore pn_ssl_get_peer_hostname;
 
+// Native conversion of python objects to and from pn_data_t trees.
+// The python classes used for the AMQP types are supplied once by the
+// python binding through pn_pycodec_init.
+%{
+  static PyObject *pni_py_undescribed = NULL;
+  static PyObject *pni_py_symbol = NULL;
+  static PyObject *pni_py_ulong = NULL;
+  static PyObject *pni_py_timestamp = NULL;
+  static PyObject *pni_py_char = NULL;
+  static PyObject *pni_py_described = NULL;
+  static PyObject *pni_py_array = NULL;
+  static PyObject *pni_py_uuid = NULL;
+  static PyObject *pni_py_array_class = NULL;
+  // the typecodes of the array types decoded into an array.array by the
+  // current pn_data_get_pyobject call, NULL to decode element by element
+  static PyObject *pni_py_array_typecodes = NULL;
+
+  static int pni_data_put_pyobject(pn_data_t *data, PyObject *obj,
+                                   PyObject *types, PyObject *fallback);
+
+  static int pni_data_put_pyattr(pn_data_t *data, PyObject *obj, const char *name,
+                                 PyObject *types, PyObject *fallback)
+  {
+    PyObject *attr = PyObject_GetAttrString(obj, name);
+    if (!attr) return PN_ERR;
+    int err = pni_data_put_pyobject(data, attr, types, fallback);
+    Py_DECREF(attr);
+    return err;
+  }
+
+  static int pni_data_put_pyitems(pn_data_t *data, PyObject *items,
+                                  PyObject *types, PyObject *fallback)
+  {
+    PyObject *seq = PySequence_Fast(items, "expected a sequence");
+    if (!seq) return PN_ERR;
+    int err = 0;
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(seq);
+    for (Py_ssize_t i = 0; i < size && !err; i++) {
+      err = pni_data_put_pyobject(data, PySequence_Fast_GET_ITEM(seq, i), types, fallback);
+    }
+    Py_DECREF(seq);
+    return err;
+  }
+
+  static int pni_data_put_pymap(pn_data_t *data, PyObject *obj,
+                                PyObject *types, PyObject *fallback)
+  {
+    int err = pn_data_put_map(data);
+    if (err) return err;
+    pn_data_enter(data);
+    if (PyDict_Check(obj)) {
+      Py_ssize_t pos = 0;
+      PyObject *key, *value;
+      while (!err && PyDict_Next(obj, &pos, &key, &value)) {
+        err = pni_data_put_pyobject(data, key, types, fallback);
+        if (!err) err = pni_data_put_pyobject(data, value, types, fallback);
+      }
+    } else {
+      PyObject *items = PyMapping_Items(obj);
+      if (!items) {
+        err = PN_ERR;
+      } else {
+        Py_ssize_t size = PyList_GET_SIZE(items);
+        for (Py_ssize_t i = 0; i < size && !err; i++) {
+          PyObject *item = PyList_GET_ITEM(items, i);
+          err = pni_data_put_pyobject(data, PyTuple_GET_ITEM(item, 0), types, fallback);
+          if (!err) err = pni_data_put_pyobject(data, PyTuple_GET_ITEM(item, 1), types, fallback);
+        }
+        Py_DECREF(items);
+      }
+    }
+    pn_data_exit(data);
+    return err;
+  }
+
+  // the size of the fixed width array element types, these may be
+  // supplied in bulk from (and are returned in) python buffers
+  static size_t pni_array_item_size(long type) {
+    switch (type) {
+    case PN_BYTE:
+    case PN_UBYTE:
+      return 1;
+    case PN_SHORT:
+    case PN_USHORT:
+      return 2;
+    case PN_INT:
+    case PN_UINT:
+    case PN_FLOAT:
+      return 4;
+    case PN_LONG:
+    case PN_ULONG:
+    case PN_TIMESTAMP:
+    case PN_DOUBLE:
+      return 8;
+    default:
+      return 0;
+    }
+  }
+
+  typedef union {
+    int8_t b;
+    uint8_t ub;
+    int16_t s;
+    uint16_t us;
+    int32_t i;
+    uint32_t ui;
+    int64_t l;
+    uint64_t ul;
+    float f;
+    double d;
+  } pni_array_item_t;
+
+  // puts a native element read from a possibly unaligned buffer
+  static int pni_data_put_item(pn_data_t *data, long type, const char *bytes) {
+    pni_array_item_t item;
+    memcpy(&item, bytes, pni_array_item_size(type));
+    switch (type) {
+    case PN_BYTE: return pn_data_put_byte(data, item.b);
+    case PN_UBYTE: return pn_data_put_ubyte(data, item.ub);
+    case PN_SHORT: return pn_data_put_short(data, item.s);
+    case PN_USHORT: return pn_data_put_ushort(data, item.us);
+    case PN_INT: return pn_data_put_int(data, item.i);
+    case PN_UINT: return pn_data_put_uint(data, item.ui);
+    case PN_FLOAT: return pn_data_put_float(data, item.f);
+    case PN_LONG: return pn_data_put_long(data, item.l);
+    case PN_ULONG: return pn_data_put_ulong(data, item.ul);
+    case PN_TIMESTAMP: return pn_data_put_timestamp(data, item.l);
+    case PN_DOUBLE: return pn_data_put_double(data, item.d);
+    default: return PN_ARG_ERR;
+    }
+  }
+
+  static void pni_data_get_item(pn_data_t *data, long type, char *bytes) {
+    pni_array_item_t item;
+    switch (type) {
+    case PN_BYTE: item.b = pn_data_get_byte(data); break;
+    case PN_UBYTE: item.ub = pn_data_get_ubyte(data); break;
+    case PN_SHORT: item.s = pn_data_get_short(data); break;
+    case PN_USHORT: item.us = pn_data_get_ushort(data); break;
+    case PN_INT: item.i = pn_data_get_int(data); break;
+    case PN_UINT: item.ui = pn_data_get_uint(data); break;
+    case PN_FLOAT: item.f = pn_data_get_float(data); break;
+    case PN_LONG: item.l = pn_data_get_long(data); break;
+    case PN_ULONG: item.ul = pn_data_get_ulong(data); break;
+    case PN_TIMESTAMP: item.l = pn_data_get_timestamp(data); break;
+    case PN_DOUBLE: item.d = pn_data_get_double(data); break;
+    default: item.ul = 0; break;
+    }
+    memcpy(bytes, &item, pni_array_item_size(type));
+  }
+
+  // puts a sequence of python numbers as array elements of the given type
+  static int pni_data_put_pynumbers(pn_data_t *data, long type, PyObject *items) {
+    PyObject *seq = PySequence_Fast(items, "expected a sequence");
+    if (!seq) return PN_ERR;
+    int err = 0;
+    Py_ssize_t size = PySequence_Fast_GET_SIZE(seq);
+    for (Py_ssize_t i = 0; i < size && !err; i++) {
+      PyObject *obj = PySequence_Fast_GET_ITEM(seq, i);
+      pni_array_item_t item;
+      if (type == PN_FLOAT || type == PN_DOUBLE) {
+        item.d = PyFloat_AsDouble(obj);
+        if (type == PN_FLOAT) item.f = (float) item.d;
+      } else if (type == PN_ULONG) {
+        PyObject *l = PyNumber_Long(obj);
+        item.ul = l ? PyLong_AsUnsignedLongLong(l) : 0;
+        Py_XDECREF(l);
+      } else {
+        PY_LONG_LONG l = PyLong_AsLongLong(obj);
+        switch (type) {
+        case PN_BYTE: item.b = (int8_t) l; break;
+        case PN_UBYTE: item.ub = (uint8_t) l; break;
+        case PN_SHORT: item.s = (int16_t) l; break;
+        case PN_USHORT: item.us = (uint16_t) l; break;
+        case PN_INT: item.i = (int32_t) l; break;
+        case PN_UINT: item.ui = (uint32_t) l; break;
+        default: item.l = l; break;
+        }
+      }
+      if (PyErr_Occurred()) {
+        err = PN_ERR;
+      } else {
+        err = pni_data_put_item(data, type, (const char *) &item);
+      }
+    }
+    Py_DECREF(seq);
+    return err;
+  }
+
+  // puts the contents of a buffer of native elements (e.g. array.array
+  // or numpy) as array elements of the given type
+  static int pni_data_put_pybuffer(pn_data_t *data, long type, PyObject *obj) {
+    size_t size = pni_array_item_size(type);
+    Py_buffer view;
+    const void *buf;
+    Py_ssize_t len;
+    bool release = false;
+    if (PyObject_CheckBuffer(obj)) {
+      if (PyObject_GetBuffer(obj, &view, PyBUF_SIMPLE) < 0) return PN_ERR;
+      buf = view.buf;
+      len = view.len;
+      release = true;
+    } else if (PyObject_AsReadBuffer(obj, &buf, &len) < 0) {
+      return PN_ERR;
+    }
+    int err = 0;
+    if (len % size) {
+      PyErr_SetString(PyExc_ValueError, "buffer size is not a multiple of the element size");
+      err = PN_ERR;
+    }
+    const char *end = (const char *) buf + len;
+    for (const char *item = (const char *) buf; item < end && !err; item += size) {
+      err = pni_data_put_item(data, type, item);
+    }
+    if (release) PyBuffer_Release(&view);
+    return err;
+  }
+
+  static int pni_data_put_pyarray(pn_data_t *data, PyObject *obj,
+                                  PyObject *types, PyObject *fallback)
+  {
+    PyObject *descriptor = PyObject_GetAttrString(obj, "descriptor");
+    if (!descriptor) return PN_ERR;
+    int described = PyObject_RichCompareBool(descriptor, pni_py_undescribed, Py_NE);
+    PyObject *type = described < 0 ? NULL : PyObject_GetAttrString(obj, "type");
+    long atype = type ? PyInt_AsLong(type) : -1;
+    Py_XDECREF(type);
+    if (PyErr_Occurred()) {
+      Py_DECREF(descriptor);
+      return PN_ERR;
+    }
+    int err = pn_data_put_array(data, described, (pn_type_t) atype);
+    if (!err) {
+      pn_data_enter(data);
+      if (described) {
+        err = pni_data_put_pyobject(data, descriptor, types, fallback);
+      }
+      if (!err) {
+        PyObject *elements = PyObject_GetAttrString(obj, "elements");
+        if (!elements) {
+          err = PN_ERR;
+        } else if (!pni_array_item_size(atype)) {
+          err = pni_data_put_pyitems(data, elements, types, fallback);
+          Py_DECREF(elements);
+        } else if (PyTuple_Check(elements) || PyList_Check(elements)) {
+          err = pni_data_put_pynumbers(data, atype, elements);
+          Py_DECREF(elements);
+        } else {
+          err = pni_data_put_pybuffer(data, atype, elements);
+          Py_DECREF(elements);
+        }
+      }
+      pn_data_exit(data);
+    }
+    Py_DECREF(descriptor);
+    return err;
+  }
+
+  static int pni_data_put_pyvalue(pn_data_t *data, PyObject *obj, long type,
+                                  PyObject *types, PyObject *fallback)
+  {
+    switch (type) {
+    case PN_NULL:
+      return pn_data_put_null(data);
+    case PN_BOOL:
+      {
+        int b = PyObject_IsTrue(obj);
+        if (b < 0) return PN_ERR;
+        return pn_data_put_bool(data, b);
+      }
+    case PN_LONG:
+    case PN_TIMESTAMP:
+      {
+        PY_LONG_LONG l = PyLong_AsLongLong(obj);
+        if (l == -1 && PyErr_Occurred()) return PN_ERR;
+        return type == PN_LONG ? pn_data_put_long(data, l) : pn_data_put_timestamp(data, l);
+      }
+    case PN_ULONG:
+      {
+        unsigned PY_LONG_LONG ul;
+        if (PyLong_Check(obj)) {
+          ul = PyLong_AsUnsignedLongLong(obj);
+        } else {
+          PyObject *l = PyNumber_Long(obj);
+          if (!l) return PN_ERR;
+          ul = PyLong_AsUnsignedLongLong(l);
+          Py_DECREF(l);
+        }
+        if (ul == (unsigned PY_LONG_LONG) -1 && PyErr_Occurred()) return PN_ERR;
+        return pn_data_put_ulong(data, ul);
+      }
+    case PN_DOUBLE:
+      {
+        double d = PyFloat_AsDouble(obj);
+        if (d == -1.0 && PyErr_Occurred()) return PN_ERR;
+        return pn_data_put_double(data, d);
+      }
+    case PN_CHAR:
+      {
+        if (!PyUnicode_Check(obj) || PyUnicode_GET_SIZE(obj) != 1) {
+          PyErr_SetString(PyExc_TypeError, "ord() expected a character");
+          return PN_ERR;
+        }
+        return pn_data_put_char(data, PyUnicode_AS_UNICODE(obj)[0]);
+      }
+    case PN_BINARY:
+    case PN_SYMBOL:
+      {
+        char *bytes;
+        Py_ssize_t size;
+        if (PyString_AsStringAndSize(obj, &bytes, &size) < 0) return PN_ERR;
+        pn_bytes_t b = pn_bytes(size, bytes);
+        return type == PN_BINARY ? pn_data_put_binary(data, b) : pn_data_put_symbol(data, b);
+      }
+    case PN_STRING:
+      {
+        PyObject *utf8 = PyUnicode_AsUTF8String(obj);
+        if (!utf8) return PN_ERR;
+        int err = pn_data_put_string(data, pn_bytes(PyString_GET_SIZE(utf8),
+                                                    PyString_AS_STRING(utf8)));
+        Py_DECREF(utf8);
+        return err;
+      }
+    case PN_UUID:
+      {
+        PyObject *bytes = PyObject_GetAttrString(obj, "bytes");
+        if (!bytes) return PN_ERR;
+        if (!PyString_Check(bytes)) {
+          Py_DECREF(bytes);
+          PyErr_SetString(PyExc_TypeError, "expected uuid bytes");
+          return PN_ERR;
+        }
+        pn_uuid_t u;
+        memset(u.bytes, 0, 16);
+        Py_ssize_t size = PyString_GET_SIZE(bytes);
+        memmove(u.bytes, PyString_AS_STRING(bytes), size < 16 ? size : 16);
+        Py_DECREF(bytes);
+        return pn_data_put_uuid(data, u);
+      }
+    case PN_LIST:
+      {
+        int err = pn_data_put_list(data);
+        if (err) return err;
+        pn_data_enter(data);
+        err = pni_data_put_pyitems(data, obj, types, fallback);
+        pn_data_exit(data);
+        return err;
+      }
+    case PN_MAP:
+      return pni_data_put_pymap(data, obj, types, fallback);
+    case PN_DESCRIBED:
+      {
+        int err = pn_data_put_described(data);
+        if (err) return err;
+        pn_data_enter(data);
+        err = pni_data_put_pyattr(data, obj, "descriptor", types, fallback);
+        if (!err) err = pni_data_put_pyattr(data, obj, "value", types, fallback);
+        pn_data_exit(data);
+        return err;
+      }
+    case PN_ARRAY:
+      return pni_data_put_pyarray(data, obj, types, fallback);
+    default:
+      PyErr_Format(PyExc_ValueError, "unsupported type: %ld", type);
+      return PN_ERR;
+    }
+  }
+
+  static int pni_data_put_pyobject(pn_data_t *data, PyObject *obj,
+                                   PyObject *types, PyObject *fallback)
+  {
+    PyObject *type = PyDict_GetItem(types, (PyObject *) Py_TYPE(obj));
+    if (!type) {
+      // not a natively supported class, let the binding handle it
+      PyObject *result = PyObject_CallFunctionObjArgs(fallback, obj, NULL);
+      if (!result) return PN_ERR;
+      Py_DECREF(result);
+      return 0;
+    }
+    if (Py_EnterRecursiveCall(" while encoding a python object")) return PN_ERR;
+    int err = pni_data_put_pyvalue(data, obj, PyInt_AsLong(type), types, fallback);
+    Py_LeaveRecursiveCall();
+    return err;
+  }
+
+  static PyObject *pni_py_from_long(int64_t l) {
+    if (l >= LONG_MIN && l <= LONG_MAX) {
+      return PyInt_FromLong((long) l);
+    } else {
+      return PyLong_FromLongLong(l);
+    }
+  }
+
+  static PyObject *pni_py_from_ulong(uint64_t ul) {
+    if (ul <= LONG_MAX) {
+      return PyInt_FromLong((long) ul);
+    } else {
+      return PyLong_FromUnsignedLongLong(ul);
+    }
+  }
+
+  // wraps value in an instance of cls, stealing the reference to value
+  static PyObject *pni_py_wrap(PyObject *cls, PyObject *value) {
+    if (!value) return NULL;
+    PyObject *result = PyObject_CallFunctionObjArgs(cls, value, NULL);
+    Py_DECREF(value);
+    return result;
+  }
+
+  static PyObject *pni_data_get_pyobject(pn_data_t *data, PyObject *fallback);
+
+  static PyObject *pni_data_get_pymap(pn_data_t *data, PyObject *fallback) {
+    if (!pn_data_enter(data)) Py_RETURN_NONE;
+    PyObject *result = PyDict_New();
+    while (result && pn_data_next(data)) {
+      PyObject *key = pni_data_get_pyobject(data, fallback);
+      PyObject *value = NULL;
+      if (key) {
+        if (pn_data_next(data)) {
+          value = pni_data_get_pyobject(data, fallback);
+        } else {
+          Py_INCREF(Py_None);
+          value = Py_None;
+        }
+      }
+      if (!value || PyDict_SetItem(result, key, value) < 0) {
+        Py_CLEAR(result);
+      }
+      Py_XDECREF(key);
+      Py_XDECREF(value);
+    }
+    pn_data_exit(data);
+    return result;
+  }
+
+  static PyObject *pni_data_get_pylist(pn_data_t *data, PyObject *fallback) {
+    if (!pn_data_enter(data)) Py_RETURN_NONE;
+    PyObject *result = PyList_New(0);
+    while (result && pn_data_next(data)) {
+      PyObject *item = pni_data_get_pyobject(data, fallback);
+      if (!item || PyList_Append(result, item) < 0) {
+        Py_CLEAR(result);
+      }
+      Py_XDECREF(item);
+    }
+    pn_data_exit(data);
+    return result;
+  }
+
+  static PyObject *pni_data_get_pydescribed(pn_data_t *data, PyObject *fallback) {
+    if (!pn_data_enter(data)) Py_RETURN_NONE;
+    PyObject *result = NULL;
+    pn_data_next(data);
+    PyObject *descriptor = pni_data_get_pyobject(data, fallback);
+    if (descriptor) {
+      pn_data_next(data);
+      PyObject *value = pni_data_get_pyobject(data, fallback);
+      if (value) {
+        result = PyObject_CallFunctionObjArgs(pni_py_described, descriptor, value, NULL);
+        Py_DECREF(value);
+      }
+      Py_DECREF(descriptor);
+    }
+    pn_data_exit(data);
+    return result;
+  }
+
+  static PyObject *pni_data_get_pyarray(pn_data_t *data, PyObject *fallback) {
+    size_t count = pn_data_get_array(data);
+    bool described = pn_data_is_array_described(data);
+    int type = pn_data_get_array_type(data);
+    if (type == -1 || !pn_data_enter(data)) Py_RETURN_NONE;
+    // the arguments to Array: descriptor, type, *elements
+    PyObject *args = PyList_New(2);
+    if (args) {
+      PyList_SET_ITEM(args, 1, PyInt_FromLong(type));
+      if (described) {
+        pn_data_next(data);
+        PyList_SET_ITEM(args, 0, pni_data_get_pyobject(data, fallback));
+      } else {
+        Py_INCREF(pni_py_undescribed);
+        PyList_SET_ITEM(args, 0, pni_py_undescribed);
+      }
+      if (!PyList_GET_ITEM(args, 0) || !PyList_GET_ITEM(args, 1)) {
+        Py_CLEAR(args);
+      }
+    }
+    PyObject *typecode = NULL;
+    size_t size = pni_array_item_size(type);
+    if (args && size && pni_py_array_typecodes) {
+      PyObject *key = PyInt_FromLong(type);
+      if (key) {
+        typecode = PyDict_GetItem(pni_py_array_typecodes, key);
+        Py_DECREF(key);
+      } else {
+        Py_CLEAR(args);
+      }
+    }
+    if (typecode) {
+      // copy the elements into a single array.array
+      PyObject *bytes = PyString_FromStringAndSize(NULL, count * size);
+      if (bytes) {
+        char *item = PyString_AS_STRING(bytes);
+        for (size_t i = 0; i < count && pn_data_next(data); i++) {
+          pni_data_get_item(data, type, item);
+          item += size;
+        }
+      }
+      PyObject *elements = bytes ? PyObject_CallFunctionObjArgs(pni_py_array_class, typecode, bytes, NULL) : NULL;
+      Py_XDECREF(bytes);
+      if (!elements || PyList_Append(args, elements) < 0) {
+        Py_CLEAR(args);
+      }
+      Py_XDECREF(elements);
+    }
+    while (args && !typecode && pn_data_next(data)) {
+      PyObject *item = pni_data_get_pyobject(data, fallback);
+      if (!item || PyList_Append(args, item) < 0) {
+        Py_CLEAR(args);
+      }
+      Py_XDECREF(item);
+    }
+    pn_data_exit(data);
+    if (!args) return NULL;
+    PyObject *tuple = PyList_AsTuple(args);
+    Py_DECREF(args);
+    if (!tuple) return NULL;
+    PyObject *result = PyObject_Call(pni_py_array, tuple, NULL);
+    Py_DECREF(tuple);
+    return result;
+  }
+
+  static PyObject *pni_data_get_pyvalue(pn_data_t *data, PyObject *fallback) {
+    pn_type_t type = pn_data_type(data);
+    switch ((int) type) {
+    case -1:
+    case PN_NULL:
+      Py_RETURN_NONE;
+    case PN_BOOL:
+      return PyBool_FromLong(pn_data_get_bool(data));
+    case PN_UBYTE:
+      return PyInt_FromLong(pn_data_get_ubyte(data));
+    case PN_BYTE:
+      return PyInt_FromLong(pn_data_get_byte(data));
+    case PN_USHORT:
+      return PyInt_FromLong(pn_data_get_ushort(data));
+    case PN_SHORT:
+      return PyInt_FromLong(pn_data_get_short(data));
+    case PN_UINT:
+      return pni_py_from_ulong(pn_data_get_uint(data));
+    case PN_INT:
+      return PyInt_FromLong(pn_data_get_int(data));
+    case PN_CHAR:
+      return pni_py_wrap(pni_py_char, PyUnicode_FromOrdinal(pn_data_get_char(data)));
+    case PN_ULONG:
+      return pni_py_wrap(pni_py_ulong, pni_py_from_ulong(pn_data_get_ulong(data)));
+    case PN_LONG:
+      return pni_py_from_long(pn_data_get_long(data));
+    case PN_TIMESTAMP:
+      return pni_py_wrap(pni_py_timestamp, pni_py_from_long(pn_data_get_timestamp(data)));
+    case PN_FLOAT:
+      return PyFloat_FromDouble(pn_data_get_float(data));
+    case PN_DOUBLE:
+      return PyFloat_FromDouble(pn_data_get_double(data));
+    case PN_DECIMAL32:
+      return pni_py_from_ulong(pn_data_get_decimal32(data));
+    case PN_DECIMAL64:
+      return pni_py_from_ulong(pn_data_get_decimal64(data));
+    case PN_DECIMAL128:
+      return PyString_FromStringAndSize(pn_data_get_decimal128(data).bytes, 16);
+    case PN_UUID:
+      {
+        PyObject *bytes = PyString_FromStringAndSize(pn_data_get_uuid(data).bytes, 16);
+        if (!bytes) return NULL;
+        PyObject *kwargs = Py_BuildValue("{s:N}", "bytes", bytes);
+        if (!kwargs) return NULL;
+        PyObject *args = PyTuple_New(0);
+        PyObject *result = args ? PyObject_Call(pni_py_uuid, args, kwargs) : NULL;
+        Py_XDECREF(args);
+        Py_DECREF(kwargs);
+        return result;
+      }
+    case PN_BINARY:
+      {
+        pn_bytes_t b = pn_data_get_binary(data);
+        return PyString_FromStringAndSize(b.start, b.size);
+      }
+    case PN_STRING:
+      {
+        pn_bytes_t b = pn_data_get_string(data);
+        return PyUnicode_DecodeUTF8(b.start, b.size, NULL);
+      }
+    case PN_SYMBOL:
+      {
+        pn_bytes_t b = pn_data_get_symbol(data);
+        return pni_py_wrap(pni_py_symbol, PyString_FromStringAndSize(b.start, b.size));
+      }
+    case PN_DESCRIBED:
+      return pni_data_get_pydescribed(data, fallback);
+    case PN_ARRAY:
+      return pni_data_get_pyarray(data, fallback);
+    case PN_LIST:
+      return pni_data_get_pylist(data, fallback);
+    case PN_MAP:
+      return pni_data_get_pymap(data, fallback);
+    default:
+      // not a natively supported type, let the binding handle it
+      return PyObject_CallFunctionObjArgs(fallback, NULL);
+    }
+  }
+
+  static PyObject *pni_data_get_pyobject(pn_data_t *data, PyObject *fallback) {
+    if (Py_EnterRecursiveCall(" while decoding a python object")) return NULL;
+    PyObject *result = pni_data_get_pyvalue(data, fallback);
+    Py_LeaveRecursiveCall();
+    return result;
+  }
+
+  static int pni_pycodec_class(PyObject *classes, const char *name, PyObject **cls) {
+    PyObject *obj = PyDict_GetItemString(classes, name);
+    if (!obj) {
+      PyErr_SetString(PyExc_KeyError, name);
+      return -1;
+    }
+    Py_INCREF(obj);
+    Py_XDECREF(*cls);
+    *cls = obj;
+    return 0;
+  }
+%}
+
+// these manipulate python objects so must keep hold of the GIL
+%nothread pn_pycodec_init;
+%nothread pn_data_put_pyobject;
+%nothread pn_data_get_pyobject;
+
+%inline %{
+  PyObject *pn_pycodec_init(PyObject *classes) {
+    if (pni_pycodec_class(classes, "UNDESCRIBED", &pni_py_undescribed) ||
+        pni_pycodec_class(classes, "symbol", &pni_py_symbol) ||
+        pni_pycodec_class(classes, "ulong", &pni_py_ulong) ||
+        pni_pycodec_class(classes, "timestamp", &pni_py_timestamp) ||
+        pni_pycodec_class(classes, "char", &pni_py_char) ||
+        pni_pycodec_class(classes, "Described", &pni_py_described) ||
+        pni_pycodec_class(classes, "Array", &pni_py_array) ||
+        pni_pycodec_class(classes, "UUID", &pni_py_uuid) ||
+        pni_pycodec_class(classes, "array", &pni_py_array_class)) {
+      return NULL;
+    }
+    Py_RETURN_NONE;
+  }
+
+  PyObject *pn_data_put_pyobject(pn_data_t *data, PyObject *obj, PyObject *types, PyObject *fallback) {
+    if (!PyDict_Check(types)) {
+      PyErr_SetString(PyExc_TypeError, "types must be a dict");
+      return NULL;
+    }
+    int err = pni_data_put_pyobject(data, obj, types, fallback);
+    if (PyErr_Occurred()) {
+      return NULL;
+    }
+    return PyInt_FromLong(err);
+  }
+
+  PyObject *pn_data_get_pyobject(pn_data_t *data, PyObject *fallback, PyObject *typecodes) {
+    if (typecodes != Py_None && !PyDict_Check(typecodes)) {
+      PyErr_SetString(PyExc_TypeError, "typecodes must be a dict or None");
+      return NULL;
+    }
+    // restored on return, the fallback may decode other data meanwhile
+    PyObject *saved = pni_py_array_typecodes;
+    pni_py_array_typecodes = typecodes == Py_None ? NULL : typecodes;
+    PyObject *result = pni_data_get_pyobject(data, fallback);
+    pni_py_array_typecodes = saved;
+    return result;
+  }
+%}
+
+// encodes the changed sections of a batch of messages and puts each
+// message on the outgoing queue, all in a single call
+%nothread pn_messenger_put_pymessages;
+
+%{
+  // the sections of a message by the index the binding gives them
+  static pn_data_t *pni_message_section(pn_message_t *msg, long index) {
+    switch (index) {
+    case 0: return pn_message_instructions(msg);
+    case 1: return pn_message_annotations(msg);
+    case 2: return pn_message_properties(msg);
+    case 3: return pn_message_body(msg);
+    default: return NULL;
+    }
+  }
+
+  // self is a (fallback, data) pair, with data the address of a pn_data_t,
+  // and the call is passed on as fallback(data, obj)
+  static PyObject *pni_section_fallback(PyObject *self, PyObject *obj) {
+    pn_data_t *data = (pn_data_t *) PyLong_AsVoidPtr(PyTuple_GET_ITEM(self, 1));
+    PyObject *impl = SWIG_NewPointerObj(data, SWIGTYPE_p_pn_data_t, 0);
+    if (!impl) return NULL;
+    PyObject *result = PyObject_CallFunctionObjArgs(PyTuple_GET_ITEM(self, 0), impl, obj, NULL);
+    Py_DECREF(impl);
+    return result;
+  }
+
+  static PyMethodDef pni_section_fallback_def = {
+    "section_fallback", pni_section_fallback, METH_O, NULL
+  };
+
+  // section is an (index, value) pair
+  static int pni_message_put_pysection(pn_messenger_t *messenger, pn_message_t *msg,
+                                       PyObject *section, PyObject *types, PyObject *fallback) {
+    pn_data_t *data = NULL;
+    if (PyTuple_Check(section) && PyTuple_GET_SIZE(section) == 2) {
+      data = pni_message_section(msg, PyInt_AsLong(PyTuple_GET_ITEM(section, 0)));
+    }
+    if (!data) {
+      if (!PyErr_Occurred()) {
+        PyErr_SetString(PyExc_TypeError, "expected an (index, value) section");
+      }
+      return PN_ERR;
+    }
+    PyObject *value = PyTuple_GET_ITEM(section, 1);
+    pn_data_clear(data);
+    if (value == Py_None) return 0;
+    PyObject *self = Py_BuildValue("(ON)", fallback, PyLong_FromVoidPtr(data));
+    PyObject *bound = self ? PyCFunction_New(&pni_section_fallback_def, self) : NULL;
+    Py_XDECREF(self);
+    if (!bound) return PN_ERR;
+    int err = pni_data_put_pyobject(data, value, types, bound);
+    Py_DECREF(bound);
+    if (err && !PyErr_Occurred()) {
+      pn_error_format(pn_messenger_error(messenger), err, "unable to encode message: %s",
+                      pn_error_text(pn_data_error(data)));
+    }
+    return err;
+  }
+%}
+
+%inline %{
+  // batch is a list of (message, sections) pairs, where sections is a
+  // tuple of (index, value) pairs, and a section value is encoded as by
+  // pn_data_put_pyobject with fallback called as fallback(data, obj)
+  PyObject *pn_messenger_put_pymessages(pn_messenger_t *messenger, PyObject *batch,
+                                        PyObject *types, PyObject *fallback) {
+    if (!PyList_Check(batch) || !PyDict_Check(types)) {
+      PyErr_SetString(PyExc_TypeError, "batch must be a list and types a dict");
+      return NULL;
+    }
+    int err = 0;
+    for (Py_ssize_t i = 0; !err && i < PyList_GET_SIZE(batch); i++) {
+      PyObject *item = PyList_GET_ITEM(batch, i);
+      void *msg = NULL;
+      PyObject *sections = NULL;
+      if (PyTuple_Check(item) && PyTuple_GET_SIZE(item) == 2 &&
+          SWIG_IsOK(SWIG_ConvertPtr(PyTuple_GET_ITEM(item, 0), &msg, SWIGTYPE_p_pn_message_t, 0))) {
+        sections = PyTuple_GET_ITEM(item, 1);
+      }
+      if (!msg || !PyTuple_Check(sections)) {
+        PyErr_SetString(PyExc_TypeError, "expected a list of (message, sections) pairs");
+        return NULL;
+      }
+      for (Py_ssize_t j = 0; !err && j < PyTuple_GET_SIZE(sections); j++) {
+        err = pni_message_put_pysection(messenger, (pn_message_t *) msg,
+                                        PyTuple_GET_ITEM(sections, j), types, fallback);
+      }
+      if (!err) err = pn_messenger_put(messenger, (pn_message_t *) msg);
+    }
+    if (PyErr_Occurred()) return NULL;
+    return PyInt_FromLong(err);
+  }
+%}
+
+%nothread pn_messenger_get_pymessages;
+
+%inline %{
+  // moves the head of the incoming queue into each message of a list in
+  // turn, stopping at the first error, and returns (err, trackers) with a
+  // tracker for each message received
+  PyObject *pn_messenger_get_pymessages(pn_messenger_t *messenger, PyObject *messages) {
+    if (!PyList_Check(messages)) {
+      PyErr_SetString(PyExc_TypeError, "messages must be a list");
+      return NULL;
+    }
+    PyObject *trackers = PyList_New(0);
+    if (!trackers) return NULL;
+    int err = 0;
+    for (Py_ssize_t i = 0; !err && i < PyList_GET_SIZE(messages); i++) {
+      void *msg = NULL;
+      if (!SWIG_IsOK(SWIG_ConvertPtr(PyList_GET_ITEM(messages, i), &msg,
+                                     SWIGTYPE_p_pn_message_t, 0)) || !msg) {
+        Py_DECREF(trackers);
+        PyErr_SetString(PyExc_TypeError, "expected a list of messages");
+        return NULL;
+      }
+      err = pn_messenger_get(messenger, (pn_message_t *) msg);
+      if (!err) {
+        PyObject *tracker = pni_py_from_long(pn_messenger_incoming_tracker(messenger));
+        if (!tracker || PyList_Append(trackers, tracker)) {
+          Py_XDECREF(tracker);
+          Py_DECREF(trackers);
+          return NULL;
+        }
+        Py_DECREF(tracker);
+      }
+    }
+    return Py_BuildValue("(iN)", err, trackers);
+  }
+%}
+
+// reads or writes all the header and properties fields of a message in a
+// single call, producing and accepting the same values as the individual
+// getters and setters
+%nothread pn_message_get_header_fields;
+%nothread pn_message_set_header_fields;
+
+%{
+  static PyObject *pni_pyunsigned(unsigned long value) {
+    if (value > LONG_MAX) return PyLong_FromUnsignedLong(value);
+    return PyInt_FromLong((long) value);
+  }
+
+  static PyObject *pni_pytimestamp(pn_timestamp_t value) {
+    if (value < LONG_MIN || value > LONG_MAX) return PyLong_FromLongLong(value);
+    return PyInt_FromLong((long) value);
+  }
+
+  static int pni_pyarg_integer(PyObject *value, PY_LONG_LONG min, PY_LONG_LONG max,
+                               PY_LONG_LONG *result) {
+    if (!PyInt_Check(value) && !PyLong_Check(value)) {
+      PyErr_SetString(PyExc_TypeError, "expected an integer");
+      return -1;
+    }
+    PY_LONG_LONG n = PyLong_AsLongLong(value);
+    if (n == -1 && PyErr_Occurred()) return -1;
+    if (n < min || n > max) {
+      PyErr_SetString(PyExc_OverflowError, "integer out of range");
+      return -1;
+    }
+    *result = n;
+    return 0;
+  }
+
+  // accepts the same values as the pn_bytes_t typemap
+  static int pni_pyarg_bytes(PyObject *value, pn_bytes_t *result) {
+    if (value == Py_None) {
+      *result = pn_bytes(0, NULL);
+      return 0;
+    }
+    char *start = PyString_AsString(value);
+    if (!start) return -1;
+    *result = pn_bytes(PyString_Size(value), start);
+    return 0;
+  }
+
+  static const struct {
+    const char *name;
+    int (*set)(pn_message_t *, const char *);
+  } pni_message_string_fields[] = {
+    {"address", pn_message_set_address},
+    {"subject", pn_message_set_subject},
+    {"reply_to", pn_message_set_reply_to},
+    {"content_type", pn_message_set_content_type},
+    {"content_encoding", pn_message_set_content_encoding},
+    {"group_id", pn_message_set_group_id},
+    {"reply_to_group_id", pn_message_set_reply_to_group_id},
+    {NULL, NULL}
+  };
+%}
+
+%inline %{
+  PyObject *pn_message_get_header_fields(pn_message_t *msg, PyObject *id_fallback,
+                                         PyObject *correlation_id_fallback) {
+    PyObject *id = pni_data_get_pyobject(pn_message_id(msg), id_fallback);
+    if (!id) return NULL;
+    PyObject *correlation_id = pni_data_get_pyobject(pn_message_correlation_id(msg),
+                                                     correlation_id_fallback);
+    if (!correlation_id) {
+      Py_DECREF(id);
+      return NULL;
+    }
+    pn_bytes_t user_id = pn_message_get_user_id(msg);
+    return Py_BuildValue("{s:N,s:N,s:N,s:N,s:N,s:N,s:N,s:z,s:z,s:z,s:N,s:z,s:z,s:N,s:N,s:z,s:i,s:z}",
+                         "durable", PyBool_FromLong(pn_message_is_durable(msg)),
+                         "priority", PyInt_FromLong(pn_message_get_priority(msg)),
+                         "ttl", pni_pyunsigned(pn_message_get_ttl(msg)),
+                         "first_acquirer", PyBool_FromLong(pn_message_is_first_acquirer(msg)),
+                         "delivery_count", pni_pyunsigned(pn_message_get_delivery_count(msg)),
+                         "id", id,
+                         "user_id", PyString_FromStringAndSize(user_id.start, user_id.size),
+                         "address", pn_message_get_address(msg),
+                         "subject", pn_message_get_subject(msg),
+                         "reply_to", pn_message_get_reply_to(msg),
+                         "correlation_id", correlation_id,
+                         "content_type", pn_message_get_content_type(msg),
+                         "content_encoding", pn_message_get_content_encoding(msg),
+                         "expiry_time", pni_pytimestamp(pn_message_get_expiry_time(msg)),
+                         "creation_time", pni_pytimestamp(pn_message_get_creation_time(msg)),
+                         "group_id", pn_message_get_group_id(msg),
+                         "group_sequence", (int) pn_message_get_group_sequence(msg),
+                         "reply_to_group_id", pn_message_get_reply_to_group_id(msg));
+  }
+
+  // sets the fields named by the keys of a dict, except for the id and
+  // correlation id, stopping at the first error
+  PyObject *pn_message_set_header_fields(pn_message_t *msg, PyObject *fields) {
+    if (!PyDict_Check(fields)) {
+      PyErr_SetString(PyExc_TypeError, "fields must be a dict");
+      return NULL;
+    }
+    Py_ssize_t pos = 0;
+    PyObject *key, *value;
+    int err = 0;
+    while (!err && PyDict_Next(fields, &pos, &key, &value)) {
+      const char *name = PyString_Check(key) ? PyString_AS_STRING(key) : "";
+      PY_LONG_LONG n;
+      int b, i;
+      if (!strcmp(name, "durable")) {
+        if ((b = PyObject_IsTrue(value)) < 0) return NULL;
+        err = pn_message_set_durable(msg, b);
+      } else if (!strcmp(name, "first_acquirer")) {
+        if ((b = PyObject_IsTrue(value)) < 0) return NULL;
+        err = pn_message_set_first_acquirer(msg, b);
+      } else if (!strcmp(name, "priority")) {
+        if (pni_pyarg_integer(value, 0, UINT8_MAX, &n)) return NULL;
+        err = pn_message_set_priority(msg, (uint8_t) n);
+      } else if (!strcmp(name, "ttl")) {
+        if (pni_pyarg_integer(value, 0, UINT32_MAX, &n)) return NULL;
+        err = pn_message_set_ttl(msg, (pn_millis_t) n);
+      } else if (!strcmp(name, "delivery_count")) {
+        if (pni_pyarg_integer(value, 0, UINT32_MAX, &n)) return NULL;
+        err = pn_message_set_delivery_count(msg, (uint32_t) n);
+      } else if (!strcmp(name, "expiry_time")) {
+        if (pni_pyarg_integer(value, INT64_MIN, INT64_MAX, &n)) return NULL;
+        err = pn_message_set_expiry_time(msg, (pn_timestamp_t) n);
+      } else if (!strcmp(name, "creation_time")) {
+        if (pni_pyarg_integer(value, INT64_MIN, INT64_MAX, &n)) return NULL;
+        err = pn_message_set_creation_time(msg, (pn_timestamp_t) n);
+      } else if (!strcmp(name, "group_sequence")) {
+        if (pni_pyarg_integer(value, INT32_MIN, INT32_MAX, &n)) return NULL;
+        err = pn_message_set_group_sequence(msg, (pn_sequence_t) n);
+      } else if (!strcmp(name, "user_id")) {
+        pn_bytes_t user_id;
+        if (pni_pyarg_bytes(value, &user_id)) return NULL;
+        err = pn_message_set_user_id(msg, user_id);
+      } else {
+        for (i = 0; pni_message_string_fields[i].name; i++) {
+          if (!strcmp(name, pni_message_string_fields[i].name)) break;
+        }
+        if (!pni_message_string_fields[i].name) {
+          PyErr_SetObject(PyExc_KeyError, key);
+          return NULL;
+        }
+        if (value != Py_None && !PyString_Check(value)) {
+          PyErr_Format(PyExc_TypeError, "%s must be a string or None", name);
+          return NULL;
+        }
+        err = pni_message_string_fields[i].set(msg, value == Py_None ? NULL : PyString_AS_STRING(value));
+      }
+    }
+    return PyInt_FromLong(err);
+  }
+%}
+
+// pops events in bulk, stopping at the first event whose context has no
+// python wrapper yet; the caller must wrap that one before it is popped
+%nothread pn_collector_drain;
+
+%{
+  static void *pni_event_pycontext(pn_event_t *event) {
+    void *context = pn_event_context(event);
+    switch (pn_class_id(pn_event_class(event))) {
+    case CID_pn_void:
+      return context;
+    case CID_pn_connection:
+      return pn_connection_get_context((pn_connection_t *) context);
+    case CID_pn_session:
+      return pn_session_get_context((pn_session_t *) context);
+    case CID_pn_link:
+      return pn_link_get_context((pn_link_t *) context);
+    case CID_pn_delivery:
+      return pn_delivery_get_context((pn_delivery_t *) context);
+    default:
+      return NULL;
+    }
+  }
+%}
+
+%inline %{
+  PyObject *pn_collector_drain(pn_collector_t *collector, int max) {
+    PyObject *events = PyList_New(0);
+    if (!events) return NULL;
+    pn_event_t *event;
+    while ((max < 0 || PyList_GET_SIZE(events) < max) &&
+           (event = pn_collector_peek(collector))) {
+      PyObject *context = (PyObject *) pni_event_pycontext(event);
+      if (!context || context == Py_None) break;
+      PyObject *item = Py_BuildValue("(siO)", pn_class_name(pn_event_class(event)),
+                                     (int) pn_event_type(event), context);
+      if (!item || PyList_Append(events, item)) {
+        Py_XDECREF(item);
+        Py_DECREF(events);
+        return NULL;
+      }
+      Py_DECREF(item);
+      pn_collector_pop(collector);
+    }
+    return events;
+  }
+%}
+
 %immutable PN_PYREF;
 %inline %{
   extern const pn_class_t *PN_PYREF;
@@ -32,7 +32,9 @@ The proton APIs consist of the following classes:
 
 from cproton import *
 
-import weakref, re, socket
+import weakref, re, socket, array, heapq, select, time, types, inspect, \
+    errno, sys
+from collections import deque
 try:
   import uuid
 except ImportError:
@@ -103,6 +105,39 @@ class Constant(object):
   def __repr__(self):
     return self.name
 
+class _Finalizer(object):
+  """
+  Calls func(*args) exactly once: when the finalizer is called, or
+  when its owner is garbage collected, whichever comes first. Unlike
+  __del__ this does not make reference cycles through the owner
+  uncollectable. The arguments must not refer to the owner, or it will
+  never be collected.
+  """
+
+  _registry = set()
+
+  def __init__(self, owner, func, *args):
+    self._ref = weakref.ref(owner, self._collected)
+    self._func = func
+    self._args = args
+    self._registry.add(self)
+
+  def _collected(self, ref):
+    self()
+
+  def __call__(self):
+    func, args = self._func, self._args
+    if func is not None:
+      self._func = self._args = self._ref = None
+      self._registry.discard(self)
+      func(*args)
+
+  def detach(self):
+    """Cancels the call if it has not been made yet."""
+    if self._func is not None:
+      self._func = self._args = self._ref = None
+      self._registry.discard(self)
+
 class ProtonException(Exception):
   """
   The root of the proton exception hierarchy. All proton exception
@@ -254,26 +289,28 @@ class Messenger(object):
     """
     self._mng = pn_messenger(name)
     self._selectables = {}
-
-  def __del__(self):
-    """
-    Destroy the L{Messenger}.  This will close all connections that
-    are managed by the L{Messenger}.  Call the L{stop} method before
-    destroying the L{Messenger}.
-    """
-    if hasattr(self, "_mng"):
-      pn_messenger_free(self._mng)
-      del self._mng
+    self._get_error = None
+    # Destroying the L{Messenger} closes all the connections it
+    # manages. Call the L{stop} method before letting go of it.
+    self._finalizer = _Finalizer(self, pn_messenger_free, self._mng)
 
   def _check(self, err):
     if err < 0:
       if (err == PN_INPROGRESS):
         return
-      exc = EXCEPTIONS.get(err, MessengerException)
-      raise exc("[%s]: %s" % (err, pn_error_text(pn_messenger_error(self._mng))))
+      raise self._error(err)
     else:
       return err
 
+  def _error(self, err):
+    exc = EXCEPTIONS.get(err, MessengerException)
+    return exc("[%s]: %s" % (err, pn_error_text(pn_messenger_error(self._mng))))
+
+  def _outgoing_tracker(self):
+    if pn_messenger_is_at_most_once(self._mng):
+      return None
+    return pn_messenger_outgoing_tracker(self._mng)
+
   @property
   def name(self):
     """
@@ -384,6 +421,23 @@ When passive is set to true, Messenger will not attempt to perform I/O
 internally. In this mode it is necessary to use the selectables API to
 drive any I/O needed to perform requested actions. In this mode
 Messenger will never block.
+""")
+
+  def _is_at_most_once(self):
+    return pn_messenger_is_at_most_once(self._mng)
+
+  def _set_at_most_once(self, b):
+    self._check(pn_messenger_set_at_most_once(self._mng, b))
+
+  at_most_once = property(_is_at_most_once, _set_at_most_once,
+                          doc="""
+When at_most_once is set to true, the L{Messenger} sends every outgoing
+L{Message} pre-settled. The receiver sends no disposition for it, and
+a L{Message} is lost if its connection fails before it is delivered.
+Outgoing L{messages<Message>} are not tracked, so L{put} returns None,
+and each L{Message} is freed as soon as it has been written to its
+link. This is intended for high volume traffic, such as metrics, that
+does not need acknowledgements.
 """)
 
   def _get_incoming_window(self):
@@ -486,14 +540,109 @@ first message.
 
     This method returns an outgoing tracker for the L{Message}.  The tracker
     can be used to determine the delivery status of the L{Message}.
+    In L{at_most_once} mode messages are not tracked and None is
+    returned instead.
 
     @type message: Message
     @param message: the message to place in the outgoing queue
-    @return: a tracker
+    @return: a tracker, or None
     """
     message._pre_encode()
     self._check(pn_messenger_put(self._mng, message._msg))
-    return pn_messenger_outgoing_tracker(self._mng)
+    return self._outgoing_tracker()
+
+  def put_many(self, messages):
+    """
+    Places a batch of L{Messages<Message>} onto the outgoing queue of
+    the L{Messenger}. This behaves like calling L{put} for each
+    L{Message} in turn, but the whole batch is handed to the
+    L{Messenger} in a single call.
+
+    The messages are assigned a contiguous range of outgoing trackers.
+    This method returns the first and last tracker of that range, or
+    None if no messages were supplied or the L{Messenger} is in
+    L{at_most_once} mode. If an error occurs part way
+    through the batch, the messages preceding the failed message
+    remain on the outgoing queue.
+
+    @type messages: iterable of Message
+    @param messages: the messages to place in the outgoing queue
+    @return: a (first, last) tuple of trackers, or None
+    """
+    taken = []
+    batch = []
+    for message in messages:
+      sections = message._take_sections()
+      taken.append((message, sections))
+      batch.append((message._msg, sections))
+    if not batch:
+      return None
+    try:
+      self._check(pn_messenger_put_pymessages(self._mng, batch, Data.put_types,
+                                              _put_section_mapped))
+    except:
+      # sections of messages that were not put may not have been encoded
+      for message, sections in taken:
+        message._untake_sections(sections)
+      raise
+    last = self._outgoing_tracker()
+    if last is None:
+      return None
+    return last - (len(batch) - 1), last
+
+  def put_fanout(self, message, addresses):
+    """
+    Places a copy of the L{Message} onto the outgoing queue for each
+    of the given addresses. This behaves like setting the address of
+    the L{Message} and calling L{put} for each address in turn, except
+    that the header, annotations, application properties and body are
+    encoded only once rather than once per address. The address of the
+    L{Message} itself is left unchanged.
+
+    The copies are assigned a contiguous range of outgoing trackers in
+    the order of the addresses, which may be passed to L{status} and
+    L{settle}. This method returns the first and last tracker of that
+    range, or None if no addresses were supplied or the L{Messenger}
+    is in L{at_most_once} mode. If an error occurs
+    part way through, the copies preceding the failed address remain on
+    the outgoing queue.
+
+    @type message: Message
+    @param message: the message to send
+    @type addresses: sequence of string
+    @param addresses: the addresses to send the message to
+    @return: a (first, last) tuple of trackers, or None
+    """
+    addresses = list(addresses)
+    if not addresses:
+      return None
+    message._pre_encode()
+    self._check(pn_messenger_put_fanout(self._mng, message._msg, addresses))
+    last = self._outgoing_tracker()
+    if last is None:
+      return None
+    return last - (len(addresses) - 1), last
+
+  def put_raw(self, address, encoded):
+    """
+    Places an already encoded message onto the outgoing queue for the
+    given address. The encoded bytes are sent exactly as supplied,
+    without being decoded or re-encoded, which makes this the
+    counterpart of L{get_raw} for forwarding messages. Unlike L{put},
+    the address is not rewritten into the message, so the encoded
+    message keeps whatever address it was originally sent with.
+
+    This method returns an outgoing tracker for the message, or None in
+    L{at_most_once} mode.
+
+    @type address: string
+    @param address: the address to send the message to
+    @param encoded: the encoded message, a string or any other object
+    supporting the buffer protocol
+    @return: a tracker
+    """
+    self._check(pn_messenger_put_raw(self._mng, address, encoded))
+    return self._outgoing_tracker()
 
   def status(self, tracker):
     """
@@ -617,6 +766,77 @@ first message.
       message._post_decode()
     return pn_messenger_incoming_tracker(self._mng)
 
+  def get_many(self, n=-1, pool=None):
+    """
+    Moves up to n messages from the head of the incoming message queue
+    and returns them as a list of (L{Message}, tracker) pairs. If n is
+    negative, every message currently on the incoming queue is
+    returned.
+
+    If a pool is supplied it must be a list of L{Message} objects.
+    Messages are taken from the pool before any new L{Message} is
+    created, so an application that appends its messages back onto the
+    pool once it is done with them can receive without allocating a
+    new message for each delivery.
+
+    If a message fails to decode after others in the batch were
+    received, the messages received are returned and the error is
+    raised by the next call to get_many. Messages taken from the pool
+    but not returned are put back on it.
+
+    @type n: int
+    @param n: the maximum number of messages to return
+    @type pool: list
+    @param pool: spare L{Message} objects to receive into
+    @return: a list of (message, tracker) pairs
+    """
+    if self._get_error is not None:
+      exc, self._get_error = self._get_error, None
+      raise exc
+    count = pn_messenger_incoming(self._mng)
+    if n >= 0 and n < count:
+      count = n
+    messages = []
+    for i in range(count):
+      if pool:
+        messages.append(pool.pop())
+      else:
+        messages.append(Message())
+    err, trackers = pn_messenger_get_pymessages(self._mng, [m._msg for m in messages])
+    received = len(trackers)
+    # the message that failed was decoded into as well
+    for message in messages[:received + (err != 0)]:
+      message._post_decode()
+    if pool is not None:
+      pool.extend(reversed(messages[received:]))
+    if err:
+      if not received:
+        self._check(err)
+      self._get_error = self._error(err)
+    return zip(messages, trackers)
+
+  def get_raw(self, header=None):
+    """
+    Moves the message from the head of the incoming message queue and
+    returns it still encoded, without decoding the body. The encoded
+    message may be handed unchanged to L{put_raw} to forward it.
+
+    If a header L{Message} is supplied, only its header, annotations
+    and properties are decoded from the encoded message, as by
+    L{Message.decode_headers}, so routing decisions can be made
+    without paying to decode the body. The same header message may be
+    reused across calls.
+
+    @type header: Message
+    @param header: a message to decode the headers into, or None
+    @return: an (encoded, tracker) pair
+    """
+    err, encoded = pn_messenger_get_raw(self._mng)
+    self._check(err)
+    if header is not None:
+      header.decode_headers(encoded)
+    return encoded, pn_messenger_incoming_tracker(self._mng)
+
   def accept(self, tracker=None):
     """
     Signal the sender that you have acted on the L{Message}
@@ -763,9 +983,101 @@ first message.
     else:
       return None
 
+# marks a message section that has not yet been converted from the
+# underlying pn_message_t into a python object
+_UNDECODED = object()
+
+def _modifier(method):
+  def modify(self, *args, **kwargs):
+    self.modified = True
+    return method(self, *args, **kwargs)
+  modify.__name__ = method.__name__
+  modify.__doc__ = method.__doc__
+  return modify
+
+class _SectionDict(dict):
+  """
+  A dict held by a L{Message} section that records whether it has been
+  modified since the section was last encoded.
+  """
+
+  def __init__(self, *args, **kwargs):
+    dict.__init__(self, *args, **kwargs)
+    self.modified = True
+
+  __setitem__ = _modifier(dict.__setitem__)
+  __delitem__ = _modifier(dict.__delitem__)
+  clear = _modifier(dict.clear)
+  pop = _modifier(dict.pop)
+  popitem = _modifier(dict.popitem)
+  setdefault = _modifier(dict.setdefault)
+  update = _modifier(dict.update)
+
+class _SectionList(list):
+  """
+  A list held by a L{Message} section that records whether it has been
+  modified since the section was last encoded.
+  """
+
+  def __init__(self, *args):
+    list.__init__(self, *args)
+    self.modified = True
+
+  __setitem__ = _modifier(list.__setitem__)
+  __delitem__ = _modifier(list.__delitem__)
+  __setslice__ = _modifier(list.__setslice__)
+  __delslice__ = _modifier(list.__delslice__)
+  __iadd__ = _modifier(list.__iadd__)
+  __imul__ = _modifier(list.__imul__)
+  append = _modifier(list.append)
+  extend = _modifier(list.extend)
+  insert = _modifier(list.insert)
+  pop = _modifier(list.pop)
+  remove = _modifier(list.remove)
+  reverse = _modifier(list.reverse)
+  sort = _modifier(list.sort)
+
+_TRACKED = (_SectionDict, _SectionList)
+
+def _tracked(value):
+  # wraps a freshly decoded container so that changes to it are recorded
+  cls = value.__class__
+  if cls is dict:
+    return _SectionDict(value)
+  elif cls is list:
+    return _SectionList(value)
+  else:
+    return value
+
+def _is_volatile(value):
+  """
+  Returns true if value can be changed in place without the change
+  being recorded, i.e. it is, or it holds, an untracked container.
+  """
+  cls = value.__class__
+  if cls is _SectionDict:
+    items = value.itervalues()
+  elif cls is _SectionList:
+    items = value
+  else:
+    return isinstance(value, (dict, list, tuple, Described, Array))
+  for v in items:
+    if isinstance(v, (dict, list, tuple, Described, Array)):
+      return True
+  return False
+
 class Message(object):
   """The L{Message} class is a mutable holder of message content.
 
+  The instructions, annotations, properties and body of a received
+  message are only converted into python objects when they are first
+  accessed, and a section is only re-encoded when it has changed since
+  the message was last encoded or decoded. To make this possible a
+  decoded dict or list records its own modification. Changes to a
+  container assigned to one of these attributes, or nested within a
+  section, cannot be tracked, and such sections are always re-encoded
+  unless they are declared unchanging with L{mark_clean}.
+
   @ivar instructions: delivery instructions for the message
   @type instructions: dict
   @ivar annotations: infrastructure defined message annotations
@@ -783,74 +1095,174 @@ class Message(object):
 
   DEFAULT_PRIORITY = PN_DEFAULT_PRIORITY
 
+  # decode the arrays in the sections of the message as per
+  # Data.buffer_arrays
+  buffer_arrays = False
+
   def __init__(self, **kwargs):
     """
     @param kwargs: Message property name/value pairs to initialise the Message
     """
     self._msg = pn_message()
+    self._finalizer = _Finalizer(self, pn_message_free, self._msg)
     self._id = Data(pn_message_id(self._msg))
     self._correlation_id = Data(pn_message_correlation_id(self._msg))
-    self.instructions = None
-    self.annotations = None
-    self.properties = None
-    self.body = None
-    for k,v in kwargs.iteritems():
-      getattr(self, k)          # Raise exception if it's not a valid attribute.
-      setattr(self, k, v)
+    self._instructions = None
+    self._annotations = None
+    self._properties = None
+    self._body = None
+    self._dirty = set()
+    # the sections holding a value assigned rather than decoded
+    self._assigned = set()
+    # the sections whose containers are not changed in place
+    self._marked = set()
+    self.update(**kwargs)
+
+  # the fields update() sets with a single call into the library
+  _HEADER_FIELDS = frozenset(["durable", "priority", "ttl", "first_acquirer",
+                              "delivery_count", "user_id", "address",
+                              "subject", "reply_to", "content_type",
+                              "content_encoding", "expiry_time",
+                              "creation_time", "group_id", "group_sequence",
+                              "reply_to_group_id"])
+
+  def update(self, **fields):
+    """
+    Assigns several attributes of the message at once. Header and
+    properties fields are set together in a single call into the
+    underlying library.
+
+    @param fields: Message attribute name/value pairs
+    @raise AttributeError: if a name is not a Message attribute
+    """
+    header = {}
+    for k,v in fields.iteritems():
+      if k in self._HEADER_FIELDS:
+        header[k] = v
+      else:
+        getattr(self, k)          # Raise exception if it's not a valid attribute.
+        setattr(self, k, v)
+    if header:
+      self._check(pn_message_set_header_fields(self._msg, header))
 
-  def __del__(self):
-    if hasattr(self, "_msg"):
-      pn_message_free(self._msg)
-      del self._msg
+  def get_header_fields(self):
+    """
+    Returns the header and properties fields of the message, read in a
+    single call into the underlying library: durable, priority, ttl,
+    first_acquirer, delivery_count, id, user_id, address, subject,
+    reply_to, correlation_id, content_type, content_encoding,
+    expiry_time, creation_time, group_id, group_sequence and
+    reply_to_group_id.
+
+    @return: a dict of field values keyed by attribute name
+    """
+    return pn_message_get_header_fields(self._msg, self._id._get_mapped,
+                                        self._correlation_id._get_mapped)
 
   def _check(self, err):
     if err < 0:
       exc = EXCEPTIONS.get(err, MessageException)
-      raise exc("[%s]: %s" % (err, pn_message_error(self._msg)))
+      raise exc("[%s]: %s" % (err, pn_error_text(pn_message_error(self._msg))))
     else:
       return err
 
+  _SECTIONS = {"instructions": pn_message_instructions,
+               "annotations": pn_message_annotations,
+               "properties": pn_message_properties,
+               "body": pn_message_body}
+
+  def mark_clean(self, *names):
+    """
+    Declares that the containers held by the named sections will not
+    be changed in place, so each of these sections is encoded once and
+    then reused until it is assigned again. Changes made in place to a
+    marked section are not encoded.
+
+    @param names: any of "instructions", "annotations", "properties"
+    and "body", all of them if none are given
+    @raise KeyError: if a name is not a section
+    """
+    if not names:
+      names = self._SECTIONS.keys()
+    for name in names:
+      self._marked.add(self._SECTIONS[name])
+
+  def _clean(self, section, value):
+    # record that value matches what the section holds; an assigned
+    # container may be shared with another message that clears its flag
+    if section in self._marked:
+      self._dirty.discard(section)
+    elif _is_volatile(value) or \
+          (value.__class__ in _TRACKED and section in self._assigned):
+      self._dirty.add(section)
+    else:
+      self._dirty.discard(section)
+      if value.__class__ in _TRACKED:
+        value.modified = False
+
+  def _stale(self, section, value):
+    # true if the section does not hold value yet
+    if value is _UNDECODED:
+      return False
+    return section in self._dirty or (section not in self._marked and
+                                      value.__class__ in _TRACKED and
+                                      value.modified)
+
+  def _encode_section(self, section, value):
+    if self._stale(section, value):
+      data = Data(section(self._msg))
+      data.clear()
+      if value is not None:
+        data.put_object(value)
+      self._clean(section, value)
+
+  def _decode_section(self, section):
+    data = Data(section(self._msg))
+    data.buffer_arrays = self.buffer_arrays
+    data.rewind()
+    if data.next():
+      value = _tracked(data.get_object())
+    else:
+      value = None
+    self._assigned.discard(section)
+    self._clean(section, value)
+    return value
+
   def _pre_encode(self):
-    inst = Data(pn_message_instructions(self._msg))
-    ann = Data(pn_message_annotations(self._msg))
-    props = Data(pn_message_properties(self._msg))
-    body = Data(pn_message_body(self._msg))
-
-    inst.clear()
-    if self.instructions is not None:
-      inst.put_object(self.instructions)
-    ann.clear()
-    if self.annotations is not None:
-      ann.put_object(self.annotations)
-    props.clear()
-    if self.properties is not None:
-      props.put_object(self.properties)
-    body.clear()
-    if self.body is not None:
-      body.put_object(self.body)
+    self._encode_section(pn_message_instructions, self._instructions)
+    self._encode_section(pn_message_annotations, self._annotations)
+    self._encode_section(pn_message_properties, self._properties)
+    self._encode_section(pn_message_body, self._body)
+
+  # the sections in the order of the indexes used by _take_sections
+  _SECTION_ORDER = (pn_message_instructions, pn_message_annotations,
+                    pn_message_properties, pn_message_body)
+
+  def _take_sections(self):
+    # the sections _pre_encode would encode, as (index, value) pairs for
+    # pn_messenger_put_pymessages to encode natively; they are recorded
+    # as encoded
+    sections = []
+    for index, value in enumerate((self._instructions, self._annotations,
+                                   self._properties, self._body)):
+      section = self._SECTION_ORDER[index]
+      if self._stale(section, value):
+        sections.append((index, value))
+        self._clean(section, value)
+    return tuple(sections)
+
+  def _untake_sections(self, sections):
+    for index, value in sections:
+      self._dirty.add(self._SECTION_ORDER[index])
 
   def _post_decode(self):
-    inst = Data(pn_message_instructions(self._msg))
-    ann = Data(pn_message_annotations(self._msg))
-    props = Data(pn_message_properties(self._msg))
-    body = Data(pn_message_body(self._msg))
-
-    if inst.next():
-      self.instructions = inst.get_object()
-    else:
-      self.instructions = None
-    if ann.next():
-      self.annotations = ann.get_object()
-    else:
-      self.annotations = None
-    if props.next():
-      self.properties = props.get_object()
-    else:
-      self.properties = None
-    if body.next():
-      self.body = body.get_object()
-    else:
-      self.body = None
+    self._instructions = _UNDECODED
+    self._annotations = _UNDECODED
+    self._properties = _UNDECODED
+    self._body = _UNDECODED
+    self._dirty.clear()
+    self._assigned.clear()
+    self._marked.clear()
 
   def clear(self):
     """
@@ -858,10 +1270,77 @@ class Message(object):
     their default values.
     """
     pn_message_clear(self._msg)
-    self.instructions = None
-    self.annotations = None
-    self.properties = None
-    self.body = None
+    self._instructions = None
+    self._annotations = None
+    self._properties = None
+    self._body = None
+    self._dirty.clear()
+    self._assigned.clear()
+    self._marked.clear()
+
+  def _get_instructions(self):
+    if self._instructions is _UNDECODED:
+      self._instructions = self._decode_section(pn_message_instructions)
+    return self._instructions
+
+  def _set_instructions(self, value):
+    self._instructions = value
+    self._assigned.add(pn_message_instructions)
+    self._dirty.add(pn_message_instructions)
+    self._marked.discard(pn_message_instructions)
+
+  instructions = property(_get_instructions, _set_instructions,
+                          doc="""
+The delivery instructions for the message.
+""")
+
+  def _get_annotations(self):
+    if self._annotations is _UNDECODED:
+      self._annotations = self._decode_section(pn_message_annotations)
+    return self._annotations
+
+  def _set_annotations(self, value):
+    self._annotations = value
+    self._assigned.add(pn_message_annotations)
+    self._dirty.add(pn_message_annotations)
+    self._marked.discard(pn_message_annotations)
+
+  annotations = property(_get_annotations, _set_annotations,
+                         doc="""
+The infrastructure defined message annotations.
+""")
+
+  def _get_properties(self):
+    if self._properties is _UNDECODED:
+      self._properties = self._decode_section(pn_message_properties)
+    return self._properties
+
+  def _set_properties(self, value):
+    self._properties = value
+    self._assigned.add(pn_message_properties)
+    self._dirty.add(pn_message_properties)
+    self._marked.discard(pn_message_properties)
+
+  properties = property(_get_properties, _set_properties,
+                        doc="""
+The application defined message properties.
+""")
+
+  def _get_body(self):
+    if self._body is _UNDECODED:
+      self._body = self._decode_section(pn_message_body)
+    return self._body
+
+  def _set_body(self, value):
+    self._body = value
+    self._assigned.add(pn_message_body)
+    self._dirty.add(pn_message_body)
+    self._marked.discard(pn_message_body)
+
+  body = property(_get_body, _set_body,
+                  doc="""
+The message body.
+""")
 
   def _is_inferred(self):
     return pn_message_is_inferred(self._msg)
@@ -1106,12 +1585,50 @@ The format of the message.
         self._check(err)
         return data
 
+  def encode_into(self, buffer, offset=0):
+    """
+    Encodes the message directly into a caller supplied writable
+    buffer such as a bytearray or mmap, starting at the given offset.
+
+    @type buffer: writable buffer
+    @param buffer: the buffer to encode into
+    @type offset: int
+    @param offset: the position in the buffer to start writing at
+    @return: the number of bytes written
+    @raise MessageException: if the encoded message does not fit into
+    the remainder of the buffer
+    """
+    self._pre_encode()
+    return self._check(pn_message_encode_into(self._msg, buffer, offset))
+
   def decode(self, data):
-    self._check(pn_message_decode(self._msg, data, len(data)))
+    """
+    Decodes the message from data, which may be a string or any other
+    object supporting the buffer protocol such as a bytearray or
+    memoryview. The data is read in place without being copied.
+
+    @param data: the encoded message
+    """
+    self._check(pn_message_decode(self._msg, data))
+    self._post_decode()
+
+  def decode_headers(self, data):
+    """
+    Decodes only the header fields, L{instructions} and L{annotations}
+    of an encoded message. The application L{properties} and the
+    L{body} are skipped and left empty, so the cost of the call does
+    not depend on the size of the body. This is intended for routing
+    decisions on messages obtained from L{Messenger.get_raw}.
+
+    @param data: the encoded message
+    """
+    self._check(pn_message_decode_headers(self._msg, data))
     self._post_decode()
 
   def load(self, data):
     self._check(pn_message_load(self._msg, data))
+    self._body = _UNDECODED
+    self._dirty.discard(pn_message_body)
 
   def save(self):
     sz = 16
@@ -1126,12 +1643,16 @@ The format of the message.
 
   def __repr2__(self):
     props = []
+    header = self.get_header_fields()
     for attr in ("inferred", "address", "reply_to", "durable", "ttl",
                  "priority", "first_acquirer", "delivery_count", "id",
                  "correlation_id", "user_id", "group_id", "group_sequence",
                  "reply_to_group_id", "instructions", "annotations",
                  "properties", "body"):
-      value = getattr(self, attr)
+      if attr in header:
+        value = header[attr]
+      else:
+        value = getattr(self, attr)
       if value: props.append("%s=%r" % (attr, value))
     return "Message(%s)" % ", ".join(props)
 
@@ -1218,8 +1739,448 @@ indicate whether the fd has been registered or not.
       pn_selectable_free(self._impl)
       self._impl = None
 
-  def __del__(self):
-    self.free()
+class _TimerQueue(object):
+  """
+  Items ordered by deadline, for L{SelectLoop} and L{Reactor}. Items
+  with the same deadline come out in the order they were pushed.
+  """
+
+  def __init__(self):
+    self._heap = []
+    self._sequence = 0
+
+  def __len__(self):
+    return len(self._heap)
+
+  def push(self, deadline, item):
+    # the sequence number keeps timers with the same deadline in order
+    # without ever comparing the items themselves
+    self._sequence += 1
+    heapq.heappush(self._heap, (deadline, self._sequence, item))
+
+  def timeout(self, now, timeout=None):
+    """
+    Returns I{timeout} (None for no limit), shortened so that a wait
+    starting at I{now} ends by the earliest deadline.
+    """
+    if self._heap:
+      delay = max(0, self._heap[0][0] - now)
+      if timeout is None or delay < timeout:
+        return delay
+    return timeout
+
+  def expired(self, now):
+    """
+    Removes the items due at I{now} and returns them as a list of
+    (deadline, item) pairs, earliest first.
+    """
+    heap = self._heap
+    result = []
+    while heap and heap[0][0] <= now:
+      deadline, _, item = heapq.heappop(heap)
+      result.append((deadline, item))
+    return result
+
+  def clear(self):
+    del self._heap[:]
+
+class _Handle(object):
+
+  def __init__(self, callback, args):
+    self._callback = callback
+    self._args = args
+    self._cancelled = False
+
+  def cancel(self):
+    self._cancelled = True
+
+  def _run(self):
+    if not self._cancelled:
+      self._callback(*self._args)
+
+class SelectLoop(object):
+  """
+  A minimal select based event loop. It provides the subset of the
+  asyncio event loop interface used by L{AsyncMessenger} for use where
+  asyncio is unavailable.
+  """
+
+  def __init__(self):
+    self._readers = {}
+    self._writers = {}
+    self._ready = []
+    self._timers = _TimerQueue()
+    self._stopped = False
+
+  def time(self):
+    return time.time()
+
+  def call_soon(self, callback, *args):
+    handle = _Handle(callback, args)
+    self._ready.append(handle)
+    return handle
+
+  def call_later(self, delay, callback, *args):
+    return self.call_at(self.time() + delay, callback, *args)
+
+  def call_at(self, when, callback, *args):
+    handle = _Handle(callback, args)
+    self._timers.push(when, handle)
+    return handle
+
+  def add_reader(self, fd, callback, *args):
+    self._readers[fd] = _Handle(callback, args)
+
+  def remove_reader(self, fd):
+    return self._readers.pop(fd, None) is not None
+
+  def add_writer(self, fd, callback, *args):
+    self._writers[fd] = _Handle(callback, args)
+
+  def remove_writer(self, fd):
+    return self._writers.pop(fd, None) is not None
+
+  def create_future(self):
+    return _Future(self)
+
+  def run_once(self, timeout=None):
+    """
+    Waits up to I{timeout} seconds (forever if None) for I/O or a timer,
+    and runs the callbacks that are due.
+    """
+    if self._ready:
+      timeout = 0
+    else:
+      timeout = self._timers.timeout(self.time(), timeout)
+
+    if self._readers or self._writers:
+      readable, writable, _ = select.select(self._readers.keys(),
+                                            self._writers.keys(), [], timeout)
+    else:
+      readable, writable = [], []
+      if timeout: time.sleep(timeout)
+
+    for fd in readable:
+      handle = self._readers.get(fd)
+      if handle: self._ready.append(handle)
+    for fd in writable:
+      handle = self._writers.get(fd)
+      if handle: self._ready.append(handle)
+
+    for _, handle in self._timers.expired(self.time()):
+      self._ready.append(handle)
+
+    ready = self._ready
+    self._ready = []
+    for handle in ready:
+      handle._run()
+
+  def run_forever(self):
+    self._stopped = False
+    while not self._stopped:
+      self.run_once()
+
+  def run_until_complete(self, future, timeout=None):
+    """
+    Runs the loop until I{future} is done and returns its result. If
+    I{timeout} seconds pass first a L{Timeout} is raised.
+    """
+    if timeout is not None:
+      deadline = self.time() + timeout
+    while not future.done():
+      if timeout is None:
+        self.run_once()
+      else:
+        remaining = deadline - self.time()
+        if remaining <= 0:
+          raise Timeout("future not done after %ss" % timeout)
+        self.run_once(remaining)
+    return future.result()
+
+  def stop(self):
+    self._stopped = True
+
+class _Future(object):
+  """
+  A subset of asyncio.Future, used by L{SelectLoop}.
+  """
+
+  def __init__(self, loop):
+    self._loop = loop
+    self._callbacks = []
+    self._done = False
+    self._cancelled = False
+    self._result = None
+    self._exception = None
+
+  def done(self):
+    return self._done
+
+  def cancelled(self):
+    return self._cancelled
+
+  def cancel(self):
+    if self._done:
+      return False
+    self._cancelled = True
+    self._finish()
+    return True
+
+  def result(self):
+    if self._cancelled:
+      raise ProtonException("future cancelled")
+    if not self._done:
+      raise ProtonException("future not done")
+    if self._exception is not None:
+      raise self._exception
+    return self._result
+
+  def exception(self):
+    if not self._done:
+      raise ProtonException("future not done")
+    return self._exception
+
+  def set_result(self, result):
+    if self._done:
+      raise ProtonException("future already done")
+    self._result = result
+    self._finish()
+
+  def set_exception(self, exception):
+    if self._done:
+      raise ProtonException("future already done")
+    self._exception = exception
+    self._finish()
+
+  def add_done_callback(self, callback):
+    if self._done:
+      self._loop.call_soon(callback, self)
+    else:
+      self._callbacks.append(callback)
+
+  def _finish(self):
+    self._done = True
+    for callback in self._callbacks:
+      self._loop.call_soon(callback, self)
+    self._callbacks = []
+
+class AsyncMessenger(object):
+  """
+  Drives a passive L{Messenger} from an event loop. The selectables of
+  the messenger are registered with the loop's add_reader/add_writer,
+  and its deadlines are scheduled with call_later, so no thread needs
+  to block in L{Messenger.work}.
+
+  The loop may be an asyncio event loop (the default where asyncio is
+  available) or a L{SelectLoop}. Operations that complete later return
+  a future of the loop, which may be awaited under asyncio.
+
+  Outgoing messages are tracked until their final status is known, so
+  the messenger's outgoing window is widened to cover the number of
+  puts outstanding at any time; a messenger with no outgoing window
+  starts with L{WINDOW}. Statuses are reported in the order the
+  messages were put. Incoming messages are accepted as they are handed
+  to the application; senders only see the outcome when the incoming
+  window is non-zero.
+  """
+
+  WINDOW = 1024
+
+  def __init__(self, messenger=None, loop=None):
+    if messenger is None:
+      messenger = Messenger()
+    if loop is None:
+      import asyncio
+      loop = asyncio.get_event_loop()
+    messenger.passive = True
+    messenger.blocking = False
+    if messenger.outgoing_window == 0:
+      messenger.outgoing_window = self.WINDOW
+    self.messenger = messenger
+    self.loop = loop
+    self._selectables = {}
+    self._interest = {}
+    self._timer = None
+    self._deadline = None
+    self._trackers = deque()
+    self._getters = []
+    self._senders = []
+    self._stoppers = []
+
+  def _future(self):
+    create = getattr(self.loop, "create_future", None)
+    if create is None:
+      import asyncio
+      return asyncio.Future(loop=self.loop)
+    return create()
+
+  def start(self):
+    """
+    Starts the messenger, and asks for as many incoming messages as it
+    can buffer, see L{Messenger.recv}.
+    """
+    self.messenger.start()
+    self.messenger.recv()
+    self._update()
+
+  def stop(self):
+    """
+    Stops the messenger. Returns a future that is done once the
+    messenger has stopped.
+    """
+    future = self._future()
+    self._stoppers.append(future)
+    self.messenger.stop()
+    self._update()
+    return future
+
+  def subscribe(self, source):
+    subscription = self.messenger.subscribe(source)
+    self._update()
+    return subscription
+
+  def put(self, message):
+    """
+    Puts a message on the outgoing queue. The message is encoded
+    immediately so it may be reused. Returns a future whose result is
+    the final status of the message, e.g. L{ACCEPTED} or L{REJECTED}.
+    """
+    future = self._future()
+    messenger = self.messenger
+    window = messenger.outgoing_window
+    if window >= 0 and len(self._trackers) >= window:
+      messenger.outgoing_window = max(self.WINDOW, 2*len(self._trackers))
+    self._trackers.append((messenger.put(message), future))
+    self._update()
+    return future
+
+  def send(self):
+    """
+    Returns a future that is done once the outgoing queue is empty.
+    """
+    future = self._future()
+    self._senders.append(future)
+    self._update()
+    return future
+
+  def get(self):
+    """
+    Returns a future whose result is the next incoming L{Message}.
+    """
+    future = self._future()
+    self._getters.append(future)
+    self._update()
+    return future
+
+  def __aiter__(self):
+    return self
+
+  def __anext__(self):
+    return self.get()
+
+  def _readable(self, fd):
+    sel = self._selectables.get(fd)
+    if sel is not None and not sel.is_terminal:
+      sel.readable()
+    self._update()
+
+  def _writable(self, fd):
+    sel = self._selectables.get(fd)
+    if sel is not None and not sel.is_terminal:
+      sel.writable()
+    self._update()
+
+  def _expired(self):
+    self._timer = None
+    self._deadline = None
+    now = time.time()
+    for sel in self._selectables.values():
+      deadline = not sel.is_terminal and sel.deadline
+      if deadline and deadline <= now:
+        sel.expired()
+    self._update()
+
+  def _watch(self, fd, reading, writing):
+    was_reading, was_writing = self._interest.get(fd, (False, False))
+    if reading != was_reading:
+      if reading:
+        self.loop.add_reader(fd, self._readable, fd)
+      else:
+        self.loop.remove_reader(fd)
+    if writing != was_writing:
+      if writing:
+        self.loop.add_writer(fd, self._writable, fd)
+      else:
+        self.loop.remove_writer(fd)
+    if reading or writing:
+      self._interest[fd] = (reading, writing)
+    else:
+      self._interest.pop(fd, None)
+
+  def _update(self):
+    self._process()
+
+    while True:
+      sel = self.messenger.selectable()
+      if sel is None: break
+      self._selectables[sel.fileno()] = sel
+
+    deadline = self.messenger.deadline
+    for fd, sel in self._selectables.items():
+      if sel.is_terminal:
+        self._watch(fd, False, False)
+        del self._selectables[fd]
+        sel.free()
+      else:
+        self._watch(fd, sel.capacity > 0, sel.pending > 0)
+        if sel.deadline and (deadline is None or sel.deadline < deadline):
+          deadline = sel.deadline
+
+    if deadline != self._deadline:
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+      if deadline is not None:
+        self._timer = self.loop.call_later(max(0, deadline - time.time()),
+                                           self._expired)
+      self._deadline = deadline
+
+    self._notify()
+
+  def _process(self):
+    messenger = self.messenger
+    trackers = self._trackers
+    while trackers:
+      tracker, future = trackers[0]
+      status = messenger.status(tracker)
+      if status is PENDING: break
+      trackers.popleft()
+      messenger.settle(tracker)
+      if not future.done():
+        future.set_result(status)
+
+    while self._getters and messenger.incoming:
+      future = self._getters.pop(0)
+      if not future.done():
+        message = Message()
+        messenger.accept(messenger.get(message))
+        future.set_result(message)
+
+  def _notify(self):
+    messenger = self.messenger
+    if not messenger.outgoing:
+      senders = self._senders
+      self._senders = []
+      for future in senders:
+        if not future.done():
+          future.set_result(None)
+
+    if messenger.stopped:
+      stoppers = self._stoppers
+      self._stoppers = []
+      for future in stoppers:
+        if not future.done():
+          future.set_result(None)
 
 class DataException(ProtonException):
   """
@@ -1273,13 +2234,58 @@ class Described(object):
 
 UNDESCRIBED = Constant("UNDESCRIBED")
 
+def _array_typecode(size, codes):
+  for code in codes:
+    if array.array(code).itemsize == size:
+      return code
+  return None
+
+# the array.array typecodes used for the fixed width AMQP array element
+# types, C type sizes vary by platform so these are matched on item size
+_ARRAY_TYPECODES = {}
+for _type, _size, _codes in ((PN_BYTE, 1, "b"), (PN_UBYTE, 1, "B"),
+                             (PN_SHORT, 2, "h"), (PN_USHORT, 2, "H"),
+                             (PN_INT, 4, "il"), (PN_UINT, 4, "IL"),
+                             (PN_LONG, 8, "l"), (PN_ULONG, 8, "L"),
+                             (PN_TIMESTAMP, 8, "l"),
+                             (PN_FLOAT, 4, "f"), (PN_DOUBLE, 8, "d")):
+  _code = _array_typecode(_size, _codes)
+  if _code is not None:
+    _ARRAY_TYPECODES[_type] = _code
+del _type, _size, _codes, _code
+
+# the types decoded into an array.array when asked for; ulong and
+# timestamp elements keep their class so they encode to the same type
+_ARRAY_DECODE_TYPECODES = dict((t, c) for t, c in _ARRAY_TYPECODES.items()
+                               if t not in (PN_ULONG, PN_TIMESTAMP))
+
 class Array(object):
+  """
+  An AMQP array of elements of a single type. Arrays of the fixed width
+  numeric types may be given a single array.array or NumPy array in
+  place of the individual elements, these are encoded in bulk. Where
+  L{Data.buffer_arrays} is set, arrays of these types other than ulong
+  and timestamp are also decoded in bulk, into a single array.array.
+  """
 
   def __init__(self, descriptor, type, *elements):
     self.descriptor = descriptor
     self.type = type
+    if len(elements) == 1 and type in _ARRAY_TYPECODES:
+      elements = self._buffer(_ARRAY_TYPECODES[type], elements[0], elements)
     self.elements = elements
 
+  def _buffer(self, typecode, values, elements):
+    if isinstance(values, array.array):
+      if values.typecode != typecode:
+        values = array.array(typecode, values)
+      return values
+    elif hasattr(values, "__array_interface__"):
+      import numpy
+      return numpy.ascontiguousarray(values, dtype=typecode).ravel()
+    else:
+      return elements
+
   def __repr__(self):
     if self.elements:
       els = ", %s"  % (", ".join(map(repr, self.elements)))
@@ -1290,7 +2296,7 @@ class Array(object):
   def __eq__(self, o):
     if isinstance(o, Array):
       return self.descriptor == o.descriptor and \
-          self.type == o.type and self.elements == o.elements
+          self.type == o.type and tuple(self.elements) == tuple(o.elements)
     else:
       return False
 
@@ -1372,6 +2378,10 @@ class Data:
   LIST = PN_LIST; "A list value."
   MAP = PN_MAP; "A map value."
 
+  # whether arrays of fixed width numbers decode into an Array holding a
+  # single array.array rather than one python object per element
+  buffer_arrays = False
+
   type_names = {
     NULL: "null",
     BOOL: "bool",
@@ -1406,15 +2416,9 @@ class Data:
   def __init__(self, capacity=16):
     if type(capacity) in (int, long):
       self._data = pn_data(capacity)
-      self._free = True
+      self._finalizer = _Finalizer(self, pn_data_free, self._data)
     else:
       self._data = capacity
-      self._free = False
-
-  def __del__(self):
-    if self._free and hasattr(self, "_data"):
-      pn_data_free(self._data)
-      del self._data
 
   def _check(self, err):
     if err < 0:
@@ -2090,6 +3094,8 @@ class Data:
         elements = []
         while self.next():
           elements.append(self.get_object())
+        if self.buffer_arrays and type in _ARRAY_DECODE_TYPECODES:
+          elements = [array.array(_ARRAY_DECODE_TYPECODES[type], elements)]
       finally:
         self.exit()
       return Array(descriptor, type, *elements)
@@ -2101,8 +3107,13 @@ class Data:
     try:
       if described:
         self.put_object(a.descriptor)
-      for e in a.elements:
-        self.put_object(e)
+      put = self.put_array_mappings.get(a.type)
+      if put is None:
+        for e in a.elements:
+          self.put_object(e)
+      else:
+        for e in a.elements:
+          put(self, e)
     finally:
       self.exit()
 
@@ -2123,7 +3134,47 @@ class Data:
     float: put_double,
     uuid.UUID: put_uuid,
     Described: put_py_described,
-    Array: put_py_array
+    Array: put_py_array,
+    _SectionDict: put_dict,
+    _SectionList: put_sequence
+    }
+  # the fixed width array element types are written with the putter
+  # for the array type regardless of the class of each element
+  put_array_mappings = {
+    BYTE: put_byte,
+    UBYTE: put_ubyte,
+    SHORT: put_short,
+    USHORT: put_ushort,
+    INT: put_int,
+    UINT: put_uint,
+    LONG: put_long,
+    ULONG: put_ulong,
+    TIMESTAMP: put_timestamp,
+    FLOAT: put_float,
+    DOUBLE: put_double
+    }
+  # the AMQP type each natively encoded class is written as; objects of
+  # any other class are encoded through put_mappings
+  put_types = {
+    None.__class__: NULL,
+    bool: BOOL,
+    dict: MAP,
+    list: LIST,
+    tuple: LIST,
+    unicode: STRING,
+    bytes: BINARY,
+    symbol: SYMBOL,
+    int: LONG,
+    char: CHAR,
+    long: LONG,
+    ulong: ULONG,
+    timestamp: TIMESTAMP,
+    float: DOUBLE,
+    uuid.UUID: UUID,
+    Described: DESCRIBED,
+    Array: ARRAY,
+    _SectionDict: MAP,
+    _SectionList: LIST
     }
   get_mappings = {
     NULL: lambda s: None,
@@ -2155,10 +3206,33 @@ class Data:
 
 
   def put_object(self, obj):
+    """
+    Puts a python object, converting it to the corresponding AMQP
+    type. The whole object graph is encoded in a single call into the
+    underlying library, falling back to L{put_mappings} for any class
+    not listed in L{put_types}.
+    """
+    self._check(pn_data_put_pyobject(self._data, obj, self.put_types,
+                                     self._put_mapped))
+
+  def _put_mapped(self, obj):
     putter = self.put_mappings[obj.__class__]
     putter(self, obj)
 
   def get_object(self):
+    """
+    Gets the current node as a python object. A compound value is
+    converted, along with everything it contains, in a single call into
+    the underlying library, producing the same objects as the getters
+    in L{get_mappings}.
+    """
+    if self.buffer_arrays:
+      typecodes = _ARRAY_DECODE_TYPECODES
+    else:
+      typecodes = None
+    return pn_data_get_pyobject(self._data, self._get_mapped, typecodes)
+
+  def _get_mapped(self):
     type = self.type()
     if type is None: return None
     getter = self.get_mappings.get(type)
@@ -2167,9 +3241,73 @@ class Data:
     else:
       return UnmappedType(str(type))
 
+pn_pycodec_init({"UNDESCRIBED": UNDESCRIBED,
+                 "symbol": symbol,
+                 "ulong": ulong,
+                 "timestamp": timestamp,
+                 "char": char,
+                 "Described": Described,
+                 "Array": Array,
+                 "UUID": uuid.UUID,
+                 "array": array.array})
+
+def encode(obj):
+  """
+  Returns the AMQP encoding of a python object, converted to AMQP types
+  as per L{Data.put_object}.
+  """
+  data = Data()
+  data.put_object(obj)
+  return data.encode()
+
+def _put_section_mapped(impl, obj):
+  # the fallback of the sections encoded by pn_messenger_put_pymessages
+  Data(impl)._put_mapped(obj)
+
+def decode(encoded, buffer_arrays=False):
+  """
+  Returns the python object for the first AMQP value in encoded, which
+  may be a string or any other object supporting the buffer protocol.
+  Arrays are decoded as per L{Data.buffer_arrays}.
+  """
+  data = Data()
+  data.buffer_arrays = buffer_arrays
+  data.decode(encoded)
+  data.rewind()
+  data.next()
+  return data.get_object()
+
 class ConnectionException(ProtonException):
   pass
 
+def _releasing(collector, child):
+  coll = collector and collector()
+  if coll:
+    coll._contexts.add(child)
+  else:
+    child._released()
+
+def _release_connection(conn, collector):
+  # the wrapper of conn is gone, so release the wrappers of its children
+  # and free it as Connection._release would have
+  releasing = lambda child: _releasing(collector, child)
+  coll = collector and collector()
+  if coll:
+    # keep a stand-in context until the collector pops CONNECTION_FINAL
+    context = Connection(_conn=conn)
+    context._finalizer.detach()
+    context._release_invoked = True
+    coll._contexts.add(context)
+  else:
+    pn_connection_set_context(conn, pn_py2void(None))
+  ssn = pn_session_head(conn, 0)
+  while ssn:
+    py_ssn = pn_void2py(pn_session_get_context(ssn))
+    ssn = pn_session_next(ssn, 0)
+    if py_ssn:
+      py_ssn._release(releasing)
+  pn_connection_free(conn)
+
 class Endpoint(object):
 
   LOCAL_UNINIT = PN_LOCAL_UNINIT
@@ -2183,13 +3321,15 @@ class Endpoint(object):
     self.condition = None
     self._release_invoked = False
 
-  def _release(self):
+  def _release(self, releasing=None):
     """Release the underlying C Engine resource."""
     if not self._release_invoked:
+      if releasing is None:
+        releasing = self.connection._releasing
       for c in self._children:
-        c._release()
+        c._release(releasing)
       self._free_resource()
-      self.connection._releasing(self)
+      releasing(self)
       self._release_invoked = True
 
   def _update_cond(self):
@@ -2278,15 +3418,12 @@ class Connection(Endpoint):
     else:
       self._conn = pn_connection()
     pn_connection_set_context(self._conn, pn_py2void(self))
+    self._finalizer = _Finalizer(self, _release_connection, self._conn, None)
     self.offered_capabilities = None
     self.desired_capabilities = None
     self.properties = None
     self._sessions = set()
 
-  def __del__(self):
-    if hasattr(self, "_conn") and self._conn:
-      self._release()
-
   def free(self):
     self._release()
 
@@ -2299,18 +3436,14 @@ class Connection(Endpoint):
     return self
 
   def _free_resource(self):
+    self._finalizer.detach()
     pn_connection_free(self._conn)
 
   def _released(self):
     self._conn = None
 
   def _releasing(self, child):
-    coll = getattr(self, "_collector", None)
-    if coll: coll = coll()
-    if coll:
-      coll._contexts.add(child)
-    else:
-      child._released()
+    _releasing(getattr(self, "_collector", None), child)
 
   def _check(self, err):
     if err < 0:
@@ -2331,6 +3464,11 @@ class Connection(Endpoint):
     else:
       pn_connection_collect(self._conn, collector._impl)
     self._collector = weakref.ref(collector)
+    if not self._release_invoked:
+      # the wrapper may go before the events that refer to it are popped
+      self._finalizer.detach()
+      self._finalizer = _Finalizer(self, _release_connection, self._conn,
+                                   self._collector)
 
   def _get_container(self):
     return pn_connection_get_container(self._conn)
@@ -2520,11 +3658,14 @@ class Link(Endpoint):
     self._link = c_link
     pn_link_set_context(self._link, pn_py2void(self))
     self._deliveries = set()
+    # passed deliveries that stay usable while the application holds them
+    self._passed = weakref.WeakSet()
+    self._prune_at = 1024
     self.session._links.add(self)
 
   @property
   def _children(self):
-    return self._deliveries
+    return list(self._deliveries) + list(self._passed)
 
   def _free_resource(self):
     pn_link_free(self._link)
@@ -2592,7 +3733,36 @@ class Link(Endpoint):
     return Delivery._wrap_delivery(pn_link_current(self._link))
 
   def advance(self):
-    return pn_link_advance(self._link)
+    dlv = pn_link_current(self._link)
+    result = pn_link_advance(self._link)
+    if result and self.is_receiver and pn_delivery_settled(dlv):
+      self._pass(pn_void2py(pn_delivery_get_context(dlv)))
+    return result
+
+  def _pass(self, dlv):
+    # only the application may still want a delivery the peer settled
+    # and the receiver passed: the link stops holding it, and it settles
+    # once its wrapper is collected
+    if dlv:
+      self._deliveries.discard(dlv)
+      self._passed.add(dlv)
+
+  def _prune(self):
+    """
+    Stops holding the deliveries of a receiver that the peer has settled
+    and that have been read and passed, so that wrappers of deliveries
+    the application never settles do not accumulate. Called as the set
+    of deliveries doubles in size.
+    """
+    if self.is_receiver:
+      current = pn_link_current(self._link)
+      current = current and pn_void2py(pn_delivery_get_context(current))
+      for dlv in list(self._deliveries):
+        c_dlv = dlv._dlv
+        if dlv is not current and pn_delivery_settled(c_dlv) and \
+              not pn_delivery_pending(c_dlv):
+          self._pass(dlv)
+    self._prune_at = max(1024, 2*len(self._deliveries))
 
   @property
   def unsettled(self):
@@ -2741,6 +3911,7 @@ class Sender(Link):
 
   def __init__(self, c_link):
     super(Sender, self).__init__(c_link)
+    self._tag = 0
 
   def offered(self, n):
     pn_link_offered(self._link, n)
@@ -2748,14 +3919,101 @@ class Sender(Link):
   def send(self, bytes):
     return self._check(pn_link_send(self._link, bytes))
 
+  def send_message(self, message, tag=None, settled=False):
+    """
+    Encodes I{message} and sends it as a complete delivery, advancing
+    the link past it. The message is encoded in native code straight
+    into the buffer handed to the link, without an intermediate string.
+
+    @type message: Message
+    @param message: the message to send
+    @param tag: the delivery tag, or None to use the next tag of a
+    per-link counter
+    @type settled: bool
+    @param settled: whether to settle the delivery at once
+    @return: the L{Delivery}, already released if settled
+    @raise MessageException: if the message cannot be encoded
+    @raise LinkException: if the link already has a current delivery,
+    or the message cannot be sent
+    """
+    if tag is None:
+      self._tag += 1
+      tag = "%x" % self._tag
+    message._pre_encode()
+    dlv = pn_link_send_message(self._link, message._msg, tag)
+    if not dlv:
+      error = pn_message_error(message._msg)
+      if pn_error_code(error):
+        raise MessageException("unable to encode message: %s" %
+                               pn_error_text(error))
+      raise LinkException(pn_error_text(pn_link_error(self._link)))
+    dlv = Delivery._wrap_delivery(dlv)
+    if settled:
+      dlv.settle()
+    return dlv
+
 class Receiver(Link):
 
   def __init__(self, c_link):
     super(Receiver, self).__init__(c_link)
+    self._credit_policy = None
 
   def flow(self, n):
     pn_link_flow(self._link, n)
 
+  def _get_credit_policy(self):
+    return self._credit_policy
+
+  def _set_credit_policy(self, policy):
+    self._credit_policy = policy
+    self.replenish()
+
+  credit_policy = property(_get_credit_policy, _set_credit_policy,
+                           doc="""
+The L{CreditPolicy} that decides how much credit to grant, or None to
+leave credit to the application. The policy is consulted by
+L{replenish}, which L{CreditHandler} calls on the link's events and
+L{recv_message} calls as messages are consumed.
+""")
+
+  def replenish(self):
+    """
+    Grants the credit the link's credit policy asks for, if any.
+    """
+    policy = self._credit_policy
+    if policy is not None:
+      n = policy.credit(self)
+      if n > 0:
+        pn_link_flow(self._link, n)
+
+  def recv_message(self, message=None):
+    """
+    Reads the current delivery, decodes it into I{message} and advances
+    the link, all in one native call. The delivery must be readable and
+    complete; partial deliveries keep accumulating in the engine until
+    their last transfer arrives.
+
+    @type message: Message
+    @param message: the message to decode into, a new one if None
+    @return: a (message, delivery) pair, or None if the current
+    delivery is missing or not yet complete
+    @raise MessageException: if the delivery cannot be decoded; it
+    then stays current, so it may be rejected
+    """
+    dlv = self.current
+    if dlv is None:
+      return None
+    if message is None:
+      message = Message()
+    if not message._check(pn_link_recv_message(self._link, message._msg)):
+      return None
+    message._post_decode()
+    if dlv.settled:
+      self._pass(dlv)
+    if self._credit_policy is not None:
+      self.replenish()
+    return message, dlv
+
   def recv(self, limit):
     n, bytes = pn_link_recv(self._link, limit)
     if n == PN_EOS:
@@ -2770,6 +4028,107 @@ class Receiver(Link):
   def draining(self):
     return pn_link_draining(self._link)
 
+class CreditPolicy(object):
+  """
+  Decides how much credit a L{Receiver} grants. Subclasses implement
+  L{credit}, and may track message sizes with L{received}.
+  """
+
+  def credit(self, receiver):
+    """
+    Returns the credit to add to I{receiver} now.
+    """
+    return 0
+
+  def received(self, receiver, size):
+    """
+    Called by L{CreditHandler} with the size of each complete delivery.
+    """
+    pass
+
+class Prefetch(CreditPolicy):
+  """
+  Keeps up to I{window} messages outstanding, either as credit or
+  queued on the link, topping up once that drops to I{low_water}
+  (half the window by default).
+  """
+
+  def __init__(self, window, low_water=None):
+    self.window = window
+    if low_water is None:
+      low_water = window // 2
+    self.low_water = low_water
+
+  def credit(self, receiver):
+    # a receiver's credit only drops as deliveries are read and passed,
+    # so it already counts the queued ones
+    outstanding = receiver.credit
+    if outstanding <= self.low_water:
+      return self.window - outstanding
+    else:
+      return 0
+
+class BytePrefetch(Prefetch):
+  """
+  Keeps about I{budget} bytes of messages outstanding. The window is
+  derived from a moving average of the sizes of complete deliveries,
+  starting from I{estimate} bytes per message, and is never smaller
+  than I{min_window}.
+  """
+
+  def __init__(self, budget, estimate=1024, min_window=1):
+    Prefetch.__init__(self, 0)
+    self.budget = budget
+    self.min_window = min_window
+    self.average = float(estimate)
+    self._resize()
+
+  def _resize(self):
+    self.window = max(self.min_window, int(self.budget // self.average))
+    self.low_water = self.window // 2
+
+  def received(self, receiver, size):
+    self.average += (size - self.average) / 8
+    self._resize()
+
+class AdaptivePrefetch(Prefetch):
+  """
+  Sizes the window from the rate at which the application consumes
+  messages, so that about I{horizon} seconds worth of messages are
+  outstanding, within I{min_window} and I{max_window}.
+  """
+
+  def __init__(self, min_window=10, max_window=10000, horizon=0.1):
+    Prefetch.__init__(self, min_window)
+    self.min_window = min_window
+    self.max_window = max_window
+    self.horizon = horizon
+    self._read = 0
+    self._credit = 0
+    self._consumed = 0
+    self._time = None
+
+  def credit(self, receiver):
+    now = time.time()
+    credit = receiver.credit
+    # credit only drops as deliveries are read and passed
+    if credit < self._credit:
+      self._read += self._credit - credit
+    consumed = self._read
+    if self._time is None:
+      self._time = now
+      self._consumed = consumed
+    elif now > self._time and now - self._time >= self.horizon:
+      rate = (consumed - self._consumed) / (now - self._time)
+      self.window = int(max(self.min_window,
+                            min(self.max_window, rate*self.horizon)))
+      self.low_water = self.window // 2
+      self._time = now
+      self._consumed = consumed
+    n = Prefetch.credit(self, receiver)
+    self._credit = credit + n
+    return n
+
 class NamedInt(int):
 
   values = {}
@@ -2874,8 +4233,15 @@ class Disposition(object):
       raise AttributeError("condition attribute is read-only")
   condition = property(_get_condition, _set_condition)
 
+def _release_delivery(dlv):
+  pn_delivery_set_context(dlv, pn_py2void(None))
+  pn_delivery_settle(dlv)
+
 class Delivery(object):
 
+  __slots__ = ("_dlv", "_finalizer", "_states", "local", "remote",
+               "__weakref__")
+
   RECEIVED = Disposition.RECEIVED
   ACCEPTED = Disposition.ACCEPTED
   REJECTED = Disposition.REJECTED
@@ -2896,18 +4262,20 @@ class Delivery(object):
   def __init__(self, dlv):
     self._dlv = dlv
     pn_delivery_set_context(self._dlv, pn_py2void(self))
+    self._finalizer = _Finalizer(self, _release_delivery, self._dlv)
     self.local = Disposition(pn_delivery_local(self._dlv), True)
     self.remote = Disposition(pn_delivery_remote(self._dlv), False)
-    self.link._deliveries.add(self)
+    link = self.link
+    link._deliveries.add(self)
+    if len(link._deliveries) > link._prune_at:
+      link._prune()
 
-  def __del__(self):
-    self._release()
-
-  def _release(self):
+  def _release(self, releasing=None):
     """Release the underlying C Engine resource."""
     if self._dlv:
-      pn_delivery_set_context(self._dlv, pn_py2void(None))
-      pn_delivery_settle(self._dlv)
+      # the outcome can still be asked for once released
+      self._states = (self.local_state, self.remote_state)
+      self._finalizer()
       self._dlv = None
 
   @property
@@ -2946,20 +4314,27 @@ class Delivery(object):
 
   @property
   def local_state(self):
+    if self._dlv is None:
+      return self._states[0]
     return DispositionType.get(pn_delivery_local_state(self._dlv))
 
   @property
   def remote_state(self):
+    if self._dlv is None:
+      return self._states[1]
     return DispositionType.get(pn_delivery_remote_state(self._dlv))
 
   @property
   def settled(self):
-    return pn_delivery_settled(self._dlv)
+    return self._dlv is None or pn_delivery_settled(self._dlv)
 
   def settle(self):
     """Release the delivery"""
-    self.link._deliveries.remove(self)
-    self._release()
+    if self._dlv:
+      link = self.link
+      link._deliveries.discard(self)
+      link._passed.discard(self)
+      self._release()
 
   @property
   def work_next(self):
@@ -2972,6 +4347,15 @@ class Delivery(object):
 class TransportException(ProtonException):
   pass
 
+def _free_transport(trans, layers):
+  pn_transport_free(trans)
+  # pn_transport_free deallocs the C sasl and ssl associated with the
+  # transport, so erase the references held by their python objects
+  for ref in layers:
+    layer = ref()
+    if layer:
+      layer._released()
+
 class Transport(object):
 
   TRACE_OFF = PN_TRACE_OFF
@@ -2980,28 +4364,17 @@ class Transport(object):
   TRACE_RAW = PN_TRACE_RAW
 
   def __init__(self, _trans=None):
+    self._sasl = None
+    self._ssl = None
+    # weak references to the SASL and SSL objects whose C counterparts
+    # the transport owns
+    self._layers = []
     if not _trans:
       self._trans = pn_transport()
+      self._finalizer = _Finalizer(self, _free_transport, self._trans,
+                                   self._layers)
     else:
-      self._shared_trans = True
       self._trans = _trans
-    self._sasl = None
-    self._ssl = None
-
-  def __del__(self):
-    if hasattr(self, "_trans"):
-      if not hasattr(self, "_shared_trans"):
-        pn_transport_free(self._trans)
-        if hasattr(self, "_sasl") and self._sasl:
-            # pn_transport_free deallocs the C sasl associated with the
-            # transport, so erase the reference if a SASL object was used.
-            self._sasl._sasl = None
-            self._sasl = None
-        if hasattr(self, "_ssl") and self._ssl:
-            # ditto the owned c SSL object
-            self._ssl._ssl = None
-            self._ssl = None
-      del self._trans
 
   def _check(self, err):
     if err < 0:
@@ -3043,6 +4416,42 @@ class Transport(object):
     if n != len(bytes):
       raise OverflowError("unable to process all bytes")
 
+  def push_from(self, buffer, offset=0, length=None):
+    """
+    Pushes I{length} bytes (the rest of the buffer if None) starting at
+    I{offset} of any object supporting the buffer protocol, such as a
+    bytearray, memoryview or mmap, without copying them into a string.
+
+    @raise OverflowError: if the transport does not have the capacity
+    for all the bytes
+    """
+    if length is None:
+      length = len(buffer) - offset
+    n = self._check(pn_transport_push_from(self._trans, buffer, offset, length))
+    if n != length:
+      raise OverflowError("unable to process all bytes")
+
+  def recv_from_socket(self, sock):
+    """
+    Reads from I{sock} directly into the transport's input buffer, as
+    much as its capacity allows. Closes the tail of the transport when
+    the socket reaches end of file.
+
+    @return: the number of bytes read, or None if the tail is closed
+    @raise socket.error: if the read fails
+    """
+    capacity = self.capacity()
+    if capacity < 0:
+      return None
+    elif capacity == 0:
+      return 0
+    n = sock.recv_into(pn_transport_tail_view(self._trans))
+    if n == 0:
+      self.close_tail()
+      return None
+    self._check(pn_transport_process(self._trans, n))
+    return n
+
   def close_tail(self):
     self._check(pn_transport_close_tail(self._trans))
 
@@ -3061,9 +4470,39 @@ class Transport(object):
       self._check(cd)
       return out
 
+  def peek_into(self, buffer, offset=0):
+    """
+    Copies pending output into a writable buffer such as a bytearray,
+    starting at I{offset}, without popping it.
+
+    @return: the number of bytes copied, or None if the head is closed
+    """
+    n = pn_transport_peek_into(self._trans, buffer, offset)
+    if n == PN_EOS:
+      return None
+    else:
+      return self._check(n)
+
   def pop(self, size):
     pn_transport_pop(self._trans, size)
 
+  def send_to_socket(self, sock):
+    """
+    Writes pending output to I{sock} directly from the transport's
+    output buffer, and pops what was written.
+
+    @return: the number of bytes written, or None if the head is closed
+    @raise socket.error: if the write fails
+    """
+    pending = self.pending()
+    if pending < 0:
+      return None
+    elif pending == 0:
+      return 0
+    n = sock.send(pn_transport_head_view(self._trans))
+    pn_transport_pop(self._trans, n)
+    return n
+
   def close_head(self):
     self._check(pn_transport_close_head(self._trans))
 
@@ -3163,8 +4602,12 @@ class SASL(object):
       obj = super(SASL, cls).__new__(cls)
       obj._sasl = pn_sasl(transport._trans)
       transport._sasl = obj
+      transport._layers.append(weakref.ref(obj))
     return transport._sasl
 
+  def _released(self):
+    self._sasl = None
+
   def _check(self, err):
     if err < 0:
       exc = EXCEPTIONS.get(err, SASLException)
@@ -3297,8 +4740,12 @@ class SSL(object):
         raise SSLUnavailable()
       pn_ssl_init( obj._ssl, domain._domain, session_id )
       transport._ssl = obj
+      transport._layers.append(weakref.ref(obj))
     return transport._ssl
 
+  def _released(self):
+    self._ssl = None
+
   def cipher_name(self):
     rc, name = pn_ssl_get_cipher_name( self._ssl, 128 )
     if rc:
@@ -3356,30 +4803,73 @@ class Collector:
 
   def __init__(self):
     self._impl = pn_collector()
+    self._finalizer = _Finalizer(self, pn_collector_free, self._impl)
     self._contexts = set()
+    self._peeked = None
 
   def put(self, obj, etype):
     pn_collector_put(self._impl, PN_PYREF, pn_py2void(obj), etype)
 
   def peek(self):
+    if self._peeked is not None:
+      return self._peeked
+
     event = pn_collector_peek(self._impl)
     if event is None:
       return None
 
     clazz = pn_class_name(pn_event_class(event))
     context = wrappers[clazz](pn_event_context(event))
-    return Event(clazz, context, EventType.TYPES[pn_event_type(event)])
+    self._peeked = Event(clazz, context, EventType.TYPES[pn_event_type(event)])
+    return self._peeked
 
   def pop(self):
     ev = self.peek()
+    self._peeked = None
     if ev is not None:
       ev._popped(self)
     pn_collector_pop(self._impl)
 
-  def __del__(self):
-    pn_collector_free(self._impl)
+  def drain(self, max_events=None):
+    """
+    Pops up to max_events events (all of them if None) and returns them
+    as a list. Events whose context already has a python wrapper are
+    popped in bulk by a single native call.
+    """
+    types = EventType.TYPES
+    events = []
+    while max_events is None or len(events) < max_events:
+      if self._peeked is None:
+        if max_events is None:
+          limit = -1
+        else:
+          limit = max_events - len(events)
+        for clazz, etype, context in pn_collector_drain(self._impl, limit):
+          ev = Event(clazz, context, types[etype])
+          ev._popped(self)
+          events.append(ev)
+        if max_events is not None and len(events) == max_events:
+          break
+      # the head event, if any, needs a new wrapper for its context
+      ev = self.peek()
+      if ev is None:
+        break
+      self.pop()
+      events.append(ev)
+    return events
+
+  def __iter__(self):
+    """
+    Pops and yields events until the collector is empty.
+    """
+    while True:
+      ev = self.peek()
+      if ev is None:
+        return
+      self.pop()
+      yield ev
 
-class EventType:
+class EventType(object):
 
   TYPES = {}
 
@@ -3387,12 +4877,17 @@ class EventType:
     self.number = number
     self.name = pn_event_type_name(self.number)
     self.method = method
+    # dense position in handler dispatch tables; type numbers are not
+    # guaranteed to be small integers (proton-j uses enum constants)
+    self.index = len(self.TYPES)
     self.TYPES[number] = self
 
   def __repr__(self):
     return self.name
 
-class Event:
+class Event(object):
+
+  __slots__ = ("clazz", "context", "type")
 
   CONNECTION_INIT = EventType(PN_CONNECTION_INIT, "on_connection_init")
   CONNECTION_BOUND = EventType(PN_CONNECTION_BOUND, "on_connection_bound")
@@ -3436,11 +4931,27 @@ class Event:
   def _popped(self, collector):
     if self.type in (Event.LINK_FINAL, Event.SESSION_FINAL,
                      Event.CONNECTION_FINAL):
-      collector._contexts.remove(self.context)
+      # the context may be a new wrapper if the one released was collected
+      collector._contexts.discard(self.context)
       self.context._released()
 
   def dispatch(self, handler):
-    getattr(handler, self.type.method, handler.on_unhandled)(self)
+    """
+    Invokes the handler method for this event's type, or the handler's
+    on_unhandled method if it has none. Methods are looked up on the
+    handler's class once and cached, unless the class customizes
+    attribute access or the method is assigned to the handler itself.
+    Methods assigned to a class after it has dispatched events are not
+    seen.
+    """
+    try:
+      table = _DISPATCH_TABLES[handler.__class__]
+    except KeyError:
+      table = _dispatch_table(handler.__class__)
+    if _assigned_method(handler, self.type.method):
+      getattr(handler, self.type.method, handler.on_unhandled)(self)
+    else:
+      table[self.type.index](handler, self)
 
   @property
   def connection(self):
@@ -3506,6 +5017,667 @@ class Handler(object):
   def on_unhandled(self, event):
     pass
 
+_DISPATCH_TABLES = {}
+
+def _unhandled(handler, event):
+  handler.on_unhandled(event)
+
+def _lookup(name):
+  return lambda handler, event: getattr(handler, name)(event)
+
+def _lookup_or_unhandled(name):
+  return lambda handler, event: \
+      getattr(handler, name, handler.on_unhandled)(event)
+
+_OBJECT_GETATTRIBUTE = object.__dict__["__getattribute__"]
+
+def _dynamic(cls):
+  """
+  Returns true if instances of cls may have attributes that are not
+  found on the class, because it customizes attribute access.
+  """
+  return _class_attr(cls, "__getattr__") is not None or \
+      _class_attr(cls, "__getattribute__") not in (None, _OBJECT_GETATTRIBUTE)
+
+def _has_method(handler, name):
+  cls = handler.__class__
+  if _dynamic(cls):
+    return hasattr(handler, name)
+  return name in getattr(handler, "__dict__", ()) or \
+      _class_attr(cls, name) is not None
+
+def _assigned_method(handler, name):
+  # a method assigned to the handler itself shadows the dispatch table
+  attrs = getattr(handler, "__dict__", None)
+  return bool(attrs) and (name in attrs or "on_unhandled" in attrs)
+
+def _class_attr(cls, name):
+  for c in inspect.getmro(cls):
+    if name in c.__dict__:
+      return c.__dict__[name]
+  return None
+
+def _dispatch_table(cls):
+  """
+  Builds the list of functions, indexed by EventType.index, that
+  Event.dispatch calls with (handler, event) for instances of cls.
+  """
+  if _dynamic(cls):
+    table = [None]*len(EventType.TYPES)
+    for etype in EventType.TYPES.values():
+      table[etype.index] = _lookup_or_unhandled(etype.method)
+    _DISPATCH_TABLES[cls] = table
+    return table
+  composite = _class_attr(cls, "_dispatch_event")
+  default = _class_attr(cls, "on_unhandled")
+  if not isinstance(default, types.FunctionType):
+    default = _unhandled
+  table = [None]*len(EventType.TYPES)
+  for etype in EventType.TYPES.values():
+    if composite is not None:
+      name = "_dispatch_event"
+      method = composite
+    else:
+      name = etype.method
+      method = _class_attr(cls, name)
+    if method is None:
+      table[etype.index] = default
+    elif isinstance(method, types.FunctionType):
+      table[etype.index] = method
+    else:
+      # staticmethods, callable objects and the like
+      table[etype.index] = _lookup(name)
+  _DISPATCH_TABLES[cls] = table
+  return table
+
+class _CompositeHandler(Handler):
+
+  def __init__(self, *handlers):
+    self.handlers = handlers
+
+  @staticmethod
+  def _targets(handler):
+    # methods assigned to a handler after it is added are not seen
+    try:
+      table = _DISPATCH_TABLES[handler.__class__]
+    except KeyError:
+      table = _dispatch_table(handler.__class__)
+    targets = [(handler, f) for f in table]
+    for etype in EventType.TYPES.values():
+      if _assigned_method(handler, etype.method):
+        targets[etype.index] = (handler,
+                                _lookup_or_unhandled(etype.method))
+    return targets
+
+class FanoutHandler(_CompositeHandler):
+  """
+  Dispatches every event to each of its handlers in turn.
+  """
+
+  def __init__(self, *handlers):
+    _CompositeHandler.__init__(self, *handlers)
+    targets = [self._targets(h) for h in handlers]
+    self._table = [tuple(t[i] for t in targets)
+                   for i in range(len(EventType.TYPES))]
+
+  def _dispatch_event(self, event):
+    for handler, method in self._table[event.type.index]:
+      method(handler, event)
+
+class ChainHandler(_CompositeHandler):
+  """
+  Dispatches each event to the first of its handlers that has a method
+  for the event's type, or to on_unhandled if none of them has.
+  """
+
+  def __init__(self, *handlers):
+    _CompositeHandler.__init__(self, *handlers)
+    table = [(self, _unhandled)]*len(EventType.TYPES)
+    for etype in EventType.TYPES.values():
+      for h in handlers:
+        if isinstance(h, _CompositeHandler) or _has_method(h, etype.method):
+          table[etype.index] = self._targets(h)[etype.index]
+          break
+    self._table = table
+
+  def _dispatch_event(self, event):
+    handler, method = self._table[event.type.index]
+    method(handler, event)
+
+
+class CreditHandler(Handler):
+  """
+  Replenishes the credit of receivers that have a L{CreditPolicy} as
+  their links open, flow and receive deliveries. Combine it with the
+  application's handler using a L{FanoutHandler}.
+  """
+
+  def on_link_local_open(self, event):
+    self._replenish(event.receiver)
+
+  def on_link_flow(self, event):
+    self._replenish(event.receiver)
+
+  def on_delivery(self, event):
+    rcv = event.receiver
+    if rcv is not None and rcv._credit_policy is not None:
+      dlv = event.delivery
+      if not dlv.partial:
+        rcv._credit_policy.received(rcv, dlv.pending)
+      rcv.replenish()
+
+  def _replenish(self, rcv):
+    if rcv is not None and rcv._credit_policy is not None:
+      rcv.replenish()
+
+###
+# Reactor
+###
+
+try:
+  import selectors as _selectors
+except ImportError:
+  _selectors = None
+
+_READ = 1
+_WRITE = 2
+
+_WOULDBLOCK = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+_INPROGRESS = (0, errno.EINPROGRESS, errno.EWOULDBLOCK)
+
+class _Key(object):
+
+  def __init__(self, fileobj, fd, events, data):
+    self.fileobj = fileobj
+    self.fd = fd
+    self.events = events
+    self.data = data
+
+class _PollSelector(object):
+  """
+  The subset of selectors.DefaultSelector used by L{Reactor}, for
+  pythons without the selectors module. Uses epoll where available and
+  poll otherwise.
+  """
+
+  def __init__(self):
+    if hasattr(select, "epoll"):
+      self._poll = select.epoll()
+      self._in, self._out = select.EPOLLIN, select.EPOLLOUT
+      self._err = select.EPOLLERR | select.EPOLLHUP
+      self._scale = 1
+    else:
+      self._poll = select.poll()
+      self._in, self._out = select.POLLIN, select.POLLOUT
+      self._err = select.POLLERR | select.POLLHUP
+      self._scale = 1000
+    self._keys = {}
+
+  def _mask(self, events):
+    mask = 0
+    if events & _READ: mask |= self._in
+    if events & _WRITE: mask |= self._out
+    return mask
+
+  def register(self, fileobj, events, data=None):
+    key = _Key(fileobj, fileobj.fileno(), events, data)
+    self._poll.register(key.fd, self._mask(events))
+    self._keys[key.fd] = key
+    return key
+
+  def modify(self, fileobj, events, data=None):
+    key = self._keys[fileobj.fileno()]
+    if events != key.events:
+      self._poll.modify(key.fd, self._mask(events))
+      key.events = events
+    key.data = data
+    return key
+
+  def unregister(self, fileobj):
+    key = self._keys.pop(fileobj.fileno())
+    self._poll.unregister(key.fd)
+    return key
+
+  def select(self, timeout=None):
+    if timeout is None:
+      timeout = -1
+    else:
+      timeout = max(0, timeout)*self._scale
+    try:
+      ready = self._poll.poll(timeout)
+    except (IOError, OSError, select.error):
+      if sys.exc_info()[1].args[0] == errno.EINTR:
+        return []
+      raise
+    result = []
+    for fd, mask in ready:
+      key = self._keys.get(fd)
+      if key is None: continue
+      events = 0
+      if mask & (self._in | self._err): events |= _READ
+      if mask & (self._out | self._err): events |= _WRITE
+      result.append((key, events & key.events))
+    return result
+
+  def close(self):
+    self._keys.clear()
+    if hasattr(self._poll, "close"):
+      self._poll.close()
+
+class _Channel(object):
+
+  def __init__(self, sock, connection, transport):
+    self.socket = sock
+    self.connection = connection
+    self.transport = transport
+    self.events = 0
+    self.deadline = 0
+    self.head_closed = False
+
+class Reactor(object):
+  """
+  An event loop for the engine API. The reactor owns a selector (epoll
+  on Linux) and the sockets of its connections. It pushes the bytes
+  read from each socket into the connection's L{Transport}, writes the
+  transport's output back to the socket, ticks the transport when its
+  deadline expires, and dispatches the events of its L{Collector} to
+  its handlers.
+
+  Only connections touched by I/O, a deadline or an event are examined
+  on each pass, so the cost of a pass does not grow with the number of
+  idle connections.
+  """
+
+  def __init__(self, *handlers):
+    if len(handlers) == 1:
+      self.handler = handlers[0]
+    else:
+      self.handler = FanoutHandler(*handlers)
+    self.collector = Collector()
+    if _selectors is not None:
+      self._selector = _selectors.DefaultSelector()
+    else:
+      self._selector = _PollSelector()
+    self._channels = {}
+    self._listeners = set()
+    self._dirty = set()
+    self._timers = _TimerQueue()
+    self._stopped = False
+
+  def listen(self, host, port, backlog=1024):
+    """
+    Accepts connections on I{host} and I{port}. Each accepted socket
+    gets a new L{Connection} bound to a new L{Transport}. Returns the
+    listening socket.
+    """
+    family, socktype, proto, _, addr = \
+        socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(addr)
+    sock.listen(backlog)
+    sock.setblocking(0)
+    self._selector.register(sock, _READ, None)
+    self._listeners.add(sock)
+    return sock
+
+  def connect(self, host, port, connection=None):
+    """
+    Opens a socket to I{host} and I{port} and binds I{connection} (a new
+    L{Connection} if None) to a new L{Transport} over it. Returns the
+    connection. A failure to connect closes the transport, which is
+    reported by its events.
+    """
+    if connection is None:
+      connection = Connection()
+    if not connection.hostname:
+      connection.hostname = host
+    family, socktype, proto, _, addr = \
+        socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, socktype, proto)
+    sock.setblocking(0)
+    channel = self._attach(sock, connection)
+    if sock.connect_ex(addr) not in _INPROGRESS:
+      self._abort(channel)
+    return connection
+
+  def transport(self, connection):
+    """
+    Returns the L{Transport} the reactor bound to I{connection}, or None
+    once its socket has been closed.
+    """
+    channel = self._channels.get(connection)
+    return channel and channel.transport
+
+  def _attach(self, sock, connection):
+    if sock.family in (socket.AF_INET, getattr(socket, "AF_INET6", None)):
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    transport = Transport()
+    channel = _Channel(sock, connection, transport)
+    self._channels[connection] = channel
+    connection.collect(self.collector)
+    transport.bind(connection)
+    self._dirty.add(channel)
+    return channel
+
+  def _accept(self, listener):
+    while True:
+      try:
+        sock, _ = listener.accept()
+      except socket.error:
+        code = sys.exc_info()[1].args[0]
+        if code in _WOULDBLOCK:
+          return
+        if code == errno.ECONNABORTED:
+          continue
+        raise
+      sock.setblocking(0)
+      self._attach(sock, Connection())
+
+  def _readable(self, channel):
+    try:
+      channel.transport.recv_from_socket(channel.socket)
+    except socket.error:
+      if sys.exc_info()[1].args[0] not in _WOULDBLOCK:
+        self._abort(channel)
+      return
+    self._dirty.add(channel)
+
+  def _writable(self, channel):
+    try:
+      channel.transport.send_to_socket(channel.socket)
+    except socket.error:
+      if sys.exc_info()[1].args[0] not in _WOULDBLOCK:
+        self._abort(channel)
+      return
+    self._dirty.add(channel)
+
+  def _abort(self, channel):
+    # the socket is unusable: close both ends, even if an error has
+    # already ended the output, so that the transport reports it closed
+    transport = channel.transport
+    transport.close_head()
+    if transport.capacity() >= 0:
+      transport.close_tail()
+    self._dirty.add(channel)
+
+  def _close(self, channel):
+    if channel.events:
+      self._selector.unregister(channel.socket)
+      channel.events = 0
+    channel.deadline = 0
+    channel.socket.close()
+    del self._channels[channel.connection]
+    channel.transport.unbind()
+
+  def _update(self, channel, now):
+    transport = channel.transport
+    deadline = transport.tick(now)
+    capacity = transport.capacity()
+    pending = transport.pending()
+    if pending < 0:
+      if capacity < 0:
+        self._close(channel)
+        return
+      if not channel.head_closed:
+        # let the peer see the end of our output
+        channel.head_closed = True
+        try:
+          channel.socket.shutdown(socket.SHUT_WR)
+        except socket.error:
+          pass
+
+    events = 0
+    if capacity > 0: events |= _READ
+    if pending > 0: events |= _WRITE
+    if events != channel.events:
+      if not channel.events:
+        self._selector.register(channel.socket, events, channel)
+      elif not events:
+        self._selector.unregister(channel.socket)
+      else:
+        self._selector.modify(channel.socket, events, channel)
+      channel.events = events
+
+    if deadline and deadline != channel.deadline:
+      channel.deadline = deadline
+      self._timers.push(deadline, channel)
+
+  def process(self):
+    """
+    Dispatches the pending events, then updates the I/O interest and
+    deadline of each connection touched since the last call.
+    """
+    now = time.time()
+    channels = self._channels
+    while True:
+      for event in self.collector.drain():
+        if event.clazz == "pn_transport":
+          connection = event.context.connection
+        else:
+          connection = event.connection
+        channel = channels.get(connection)
+        if channel is not None:
+          self._dirty.add(channel)
+        event.dispatch(self.handler)
+      if not self._dirty:
+        break
+      dirty = self._dirty
+      self._dirty = set()
+      for channel in dirty:
+        if channel.connection in channels:
+          self._update(channel, now)
+
+  def run_once(self, timeout=None):
+    """
+    Waits up to I{timeout} seconds (forever if None) for I/O or a
+    deadline, performs the I/O that is ready and dispatches the
+    resulting events.
+    """
+    self.process()
+    timeout = self._timers.timeout(time.time(), timeout)
+
+    for key, events in self._selector.select(timeout):
+      channel = key.data
+      if channel is None:
+        self._accept(key.fileobj)
+        continue
+      if events & _READ:
+        self._readable(channel)
+      if events & _WRITE:
+        self._writable(channel)
+
+    for deadline, channel in self._timers.expired(time.time()):
+      # the channel may have moved its deadline since this was queued
+      if channel.deadline == deadline:
+        channel.deadline = 0
+        self._dirty.add(channel)
+    self.process()
+
+  def run(self):
+    """
+    Runs until L{stop} is called or there are no connections or
+    listening sockets left.
+    """
+    self._stopped = False
+    self.process()
+    while not self._stopped and (self._channels or self._listeners):
+      self.run_once()
+
+  def stop(self):
+    self._stopped = True
+
+  def close(self):
+    """
+    Closes the listening sockets and the sockets of all connections,
+    and releases the selector.
+    """
+    for sock in self._listeners:
+      self._selector.unregister(sock)
+      sock.close()
+    self._listeners.clear()
+    for channel in list(self._channels.values()):
+      self._close(channel)
+    self._timers.clear()
+    self._dirty.clear()
+    self._selector.close()
+
+class AmqpProtocol(object):
+  """
+  An asyncio protocol that carries a L{Connection} over an asyncio
+  transport. Bytes received are pushed into the connection's
+  L{Transport} as its capacity allows, and its output is written to the
+  asyncio transport until that transport asks the protocol to pause
+  writing (its write buffer is above the high watermark). Deadlines of
+  the L{Transport} are scheduled with the loop's call_at.
+
+  If a I{handler} is given, the events of the connection are collected
+  and dispatched to it. Changes made to the connection from outside a
+  handler take effect on the next call to L{process}.
+
+  The loop may be an asyncio event loop (the default where asyncio is
+  available) or a L{SelectLoop}.
+  """
+
+  def __init__(self, connection=None, handler=None, loop=None):
+    if connection is None:
+      connection = Connection()
+    if loop is None:
+      import asyncio
+      loop = asyncio.get_event_loop()
+    self.connection = connection
+    self.transport = Transport()
+    self.handler = handler
+    self.loop = loop
+    if handler is None:
+      self.collector = None
+    else:
+      self.collector = Collector()
+      connection.collect(self.collector)
+    self._io = None
+    self._input = None
+    self._eof = False
+    self._reading = True
+    self._paused = False
+    self._timer = None
+    self._deadline = 0
+
+  def connection_made(self, transport):
+    self._io = transport
+    self.transport.bind(self.connection)
+    self.process()
+
+  def data_received(self, data):
+    if self._input:
+      self._input += data
+    else:
+      self._input = data
+    self.process()
+
+  def eof_received(self):
+    self._eof = True
+    self.process()
+    # the transport is closed once the output is done
+    return True
+
+  def connection_lost(self, exc):
+    self._io = None
+    self._input = None
+    if self.transport.capacity() >= 0:
+      self.transport.close_tail()
+    if self.transport.pending() >= 0:
+      self.transport.close_head()
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    self.transport.unbind()
+    while self._dispatch():
+      pass
+
+  def pause_writing(self):
+    self._paused = True
+
+  def resume_writing(self):
+    self._paused = False
+    self.process()
+
+  def _dispatch(self):
+    if self.collector is None:
+      return False
+    events = self.collector.drain()
+    for event in events:
+      event.dispatch(self.handler)
+    return bool(events)
+
+  def _push(self):
+    transport = self.transport
+    capacity = transport.capacity()
+    if self._input:
+      if capacity < 0:
+        # the tail is closed, nothing more will be read
+        self._input = None
+      elif capacity > 0:
+        transport.push(self._input[:capacity])
+        self._input = self._input[capacity:]
+        capacity = transport.capacity()
+    if self._input:
+      if self._reading:
+        self._io.pause_reading()
+        self._reading = False
+    else:
+      if self._eof and capacity >= 0:
+        transport.close_tail()
+      elif not self._reading and capacity > 0:
+        self._io.resume_reading()
+        self._reading = True
+
+  def _flush(self):
+    transport = self.transport
+    while not self._paused and self._io is not None:
+      pending = transport.pending()
+      if pending > 0:
+        data = transport.peek(pending)
+        transport.pop(len(data))
+        # may call pause_writing
+        self._io.write(data)
+      else:
+        if pending < 0:
+          if transport.capacity() < 0:
+            self._io.close()
+          elif self._io.can_write_eof():
+            self._io.write_eof()
+        return
+
+  def _expired(self):
+    self._timer = None
+    self._deadline = 0
+    # ticking may generate output, such as a keepalive frame, which
+    # process then writes before scheduling the next deadline
+    self.transport.tick(self.loop.time())
+    self.process()
+
+  def _schedule(self):
+    deadline = self.transport.tick(self.loop.time())
+    if deadline != self._deadline:
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+      if deadline:
+        self._timer = self.loop.call_at(deadline, self._expired)
+      self._deadline = deadline
+
+  def process(self):
+    """
+    Dispatches pending events, pushes buffered input, writes pending
+    output and reschedules the transport's deadline.
+    """
+    while self._io is not None:
+      self._dispatch()
+      self._push()
+      self._flush()
+      self._schedule()
+      if self.collector is None or self.collector.peek() is None:
+        break
 
 ###
 # Driver
@@ -3651,22 +5823,22 @@ class Listener(object):
   def close(self):
     pn_listener_close(self._lsnr)
 
+def _free_driver(driver, connectors, listeners):
+  # freeing the driver will release all child objects in the C Engine, so
+  # clean up their references in the corresponding Python objects
+  for c in connectors:
+    c._release()
+  for l in listeners:
+    l._release()
+  pn_driver_free(driver)
+
 class Driver(object):
   def __init__(self):
     self._driver = pn_driver()
     self._listeners = set()
     self._connectors = set()
-
-  def __del__(self):
-    # freeing the driver will release all child objects in the C Engine, so
-    # clean up their references in the corresponding Python objects
-    for c in self._connectors:
-      c._release()
-    for l in self._listeners:
-      l._release()
-    if hasattr(self, "_driver") and self._driver:
-      pn_driver_free(self._driver)
-      del self._driver
+    self._finalizer = _Finalizer(self, _free_driver, self._driver,
+                                 self._connectors, self._listeners)
 
   def wait(self, timeout_sec):
     if timeout_sec is None or timeout_sec < 0.0:
@@ -3760,6 +5932,7 @@ class Url(object):
       if not self._url: raise ValueError("Invalid URL '%s'" % url)
     else:
       self._url = pn_url()
+    self._finalizer = _Finalizer(self, pn_url_free, self._url)
     for k in kwargs:            # Let kwargs override values parsed from url
       getattr(self, k)          # Check for invalid kwargs
       setattr(self, k, kwargs[k])
@@ -3791,10 +5964,6 @@ class Url(object):
 
   def __repr__(self): return "Url(%r)" % str(self)
 
-  def __del__(self):
-    pn_url_free(self._url);
-    self._url = None
-
   def defaults(self):
     """
     Fill in missing values (scheme, host or port) with defaults
@@ -3817,11 +5986,18 @@ __all__ = [
            "RELEASED",
            "SETTLED",
            "UNDESCRIBED",
+           "AdaptivePrefetch",
+           "AmqpProtocol",
            "Array",
+           "AsyncMessenger",
+           "BytePrefetch",
+           "ChainHandler",
            "Collector",
            "Condition",
            "Connection",
            "Connector",
+           "CreditHandler",
+           "CreditPolicy",
            "Data",
            "Delivery",
            "Disposition",
@@ -3830,18 +6006,23 @@ __all__ = [
            "DriverException",
            "Endpoint",
            "Event",
+           "FanoutHandler",
            "Handler",
            "Link",
+           "LinkException",
            "Listener",
            "Message",
            "MessageException",
            "Messenger",
            "MessengerException",
+           "Prefetch",
            "ProtonException",
            "VERSION_MAJOR",
            "VERSION_MINOR",
+           "Reactor",
            "Receiver",
            "SASL",
+           "SelectLoop",
            "Sender",
            "Session",
            "SSL",
@@ -3856,6 +6037,8 @@ __all__ = [
            "TransportException",
            "Url",
            "char",
+           "decode",
+           "encode",
            "symbol",
            "timestamp",
            "ulong"
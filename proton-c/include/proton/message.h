@@ -793,6 +793,23 @@ PN_EXTERN pn_data_t *pn_message_body(pn_message_t *msg);
  */
 PN_EXTERN int pn_message_decode(pn_message_t *msg, const char *bytes, size_t size);
 
+/**
+ * Decode only the header fields and annotations of a message from
+ * AMQP formatted binary data.
+ *
+ * This behaves like ::pn_message_decode, except that decoding stops at
+ * the first section that is not a header, delivery annotations,
+ * message annotations or properties section. The application
+ * properties, body and footer are not decoded and are left empty, so
+ * the cost does not depend on the size of the body.
+ *
+ * @param[in] msg a message object
+ * @param[in] bytes the start of the encoded AMQP data
+ * @param[in] size the size of the encoded AMQP data
+ * @return zero on success or an error code on failure
+ */
+PN_EXTERN int pn_message_decode_headers(pn_message_t *msg, const char *bytes, size_t size);
+
 /**
  * Encode/save message content as AMQP formatted binary data.
  *
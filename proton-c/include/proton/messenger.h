@@ -331,6 +331,35 @@ PN_EXTERN bool pn_messenger_is_passive(pn_messenger_t *messenger);
  */
 PN_EXTERN int pn_messenger_set_passive(pn_messenger_t *messenger, bool passive);
 
+/**
+ * Check if a messenger sends messages at most once.
+ *
+ * A messenger in at-most-once mode sends every outgoing message
+ * pre-settled, so the receiver sends no disposition for it and the
+ * message is lost if the connection fails before it is delivered.
+ * Outgoing messages are not tracked: ::pn_messenger_put does not
+ * update ::pn_messenger_outgoing_tracker and each message is freed as
+ * soon as it has been written to its link.
+ *
+ * @param[in] messenger a messenger object
+ * @return true if the messenger is in at-most-once mode, false otherwise
+ */
+PN_EXTERN bool pn_messenger_is_at_most_once(pn_messenger_t *messenger);
+
+/**
+ * Set the at-most-once mode for a messenger.
+ *
+ * See ::pn_messenger_is_at_most_once() for details. Links opened
+ * while the mode is set advertise that they only send settled
+ * messages, so the mode is best set before any messages are sent.
+ *
+ * @param[in] messenger a messenger object
+ * @param[in] at_most_once true to enable at-most-once mode, false to
+ * disable it
+ * @return an error code or zero on success
+ */
+PN_EXTERN int pn_messenger_set_at_most_once(pn_messenger_t *messenger, bool at_most_once);
+
 /** Frees a Messenger.
  *
  * @param[in] messenger the messenger to free (or NULL), no longer
@@ -536,6 +565,67 @@ PN_EXTERN const char *pn_subscription_address(pn_subscription_t *sub);
  */
 PN_EXTERN int pn_messenger_put(pn_messenger_t *messenger, pn_message_t *msg);
 
+/**
+ * Puts a batch of messages onto the messenger's outgoing queue. This
+ * is equivalent to calling ::pn_messenger_put for each message in
+ * turn, and like ::pn_messenger_put it will not block.
+ *
+ * The messages are assigned contiguous outgoing trackers. After this
+ * call ::pn_messenger_outgoing_tracker identifies the last message of
+ * the batch. If an error occurs, the messages preceding the failed
+ * message remain on the outgoing queue.
+ *
+ * @param[in] messenger a messenger object
+ * @param[in] msgs an array of messages to put on the outgoing queue
+ * @param[in] count the number of messages in the array
+ * @return an error code or zero on success
+ * @see error.h
+ */
+PN_EXTERN int pn_messenger_put_many(pn_messenger_t *messenger,
+                                    pn_message_t **msgs, size_t count);
+
+/**
+ * Puts one message onto the messenger's outgoing queue once for each
+ * of the given addresses. This is equivalent to setting the address of
+ * the message and calling ::pn_messenger_put for each address in turn,
+ * but the header, annotations, application properties and body are
+ * encoded only once and copied for every address. Only the small
+ * properties section, which carries the address, is encoded per
+ * address. Like ::pn_messenger_put this call will not block.
+ *
+ * The copies are assigned contiguous outgoing trackers in the order of
+ * the addresses. After this call ::pn_messenger_outgoing_tracker
+ * identifies the copy sent to the last address. If an error occurs,
+ * the copies preceding the failed address remain on the outgoing
+ * queue. The address of the message is left unchanged.
+ *
+ * @param[in] messenger a messenger object
+ * @param[in] msg the message to send
+ * @param[in] addresses an array of addresses to send the message to
+ * @param[in] count the number of addresses in the array
+ * @return an error code or zero on success
+ * @see error.h
+ */
+PN_EXTERN int pn_messenger_put_fanout(pn_messenger_t *messenger, pn_message_t *msg,
+                                      const char **addresses, size_t count);
+
+/**
+ * Puts an already encoded message onto the messenger's outgoing queue
+ * for the given address. The bytes are copied onto the queue as they
+ * are, without being decoded: unlike ::pn_messenger_put, the address
+ * and reply-to fields inside the encoded message are neither rewritten
+ * nor expanded. Like ::pn_messenger_put this call will not block.
+ *
+ * @param[in] messenger a messenger object
+ * @param[in] address the address to send the message to
+ * @param[in] bytes the encoded message
+ * @param[in] size the size of the encoded message
+ * @return an error code or zero on success
+ * @see error.h
+ */
+PN_EXTERN int pn_messenger_put_raw(pn_messenger_t *messenger, const char *address,
+                                   const char *bytes, size_t size);
+
 /**
  * Track the status of a delivery.
  *
@@ -719,6 +809,26 @@ PN_EXTERN int pn_messenger_receiving(pn_messenger_t *messenger);
  */
 PN_EXTERN int pn_messenger_get(pn_messenger_t *messenger, pn_message_t *message);
 
+/**
+ * Get the encoded form of the next message from the head of a
+ * messenger's incoming queue, without decoding it.
+ *
+ * If bytes is NULL or the message is larger than *size, this
+ * operation sets *size to the size of the encoded message and returns
+ * ::PN_OVERFLOW, leaving the message on the queue. Otherwise the
+ * message is copied into bytes, *size is set to its size, and the
+ * message is removed from the queue as with ::pn_messenger_get. This
+ * operation will return ::PN_EOS if there are no messages left on the
+ * incoming queue.
+ *
+ * @param[in] messenger a messenger object
+ * @param[out] bytes a buffer for the encoded message, or NULL
+ * @param[in,out] size the size of the buffer, then of the message
+ * @return an error code or zero on success
+ * @see error.h
+ */
+PN_EXTERN int pn_messenger_get_raw(pn_messenger_t *messenger, char *bytes, size_t *size);
+
 /**
  * Get a tracker for the message most recently retrieved by
  * ::pn_messenger_get().
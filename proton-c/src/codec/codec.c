@@ -1156,7 +1156,7 @@ pn_handle_t pn_data_point(pn_data_t *data)
   if (data->current) {
     return data->current;
   } else {
-    return -data->parent;
+    return -((pn_shandle_t) data->parent);
   }
 }
 
@@ -27,7 +27,7 @@
 #include "decoder.h"
 #include "encoder.h"
 
-typedef uint16_t pni_nid_t;
+typedef uint32_t pni_nid_t;
 
 typedef struct {
   char *start;
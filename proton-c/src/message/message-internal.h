@@ -0,0 +1,36 @@
+#ifndef _PROTON_MESSAGE_INTERNAL_H
+#define _PROTON_MESSAGE_INTERNAL_H 1
+
+/*
+ *
+ * Licensed to the Apache Software Foundation (ASF) under one
+ * or more contributor license agreements.  See the NOTICE file
+ * distributed with this work for additional information
+ * regarding copyright ownership.  The ASF licenses this file
+ * to you under the Apache License, Version 2.0 (the
+ * "License"); you may not use this file except in compliance
+ * with the License.  You may obtain a copy of the License at
+ *
+ *   http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing,
+ * software distributed under the License is distributed on an
+ * "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+ * KIND, either express or implied.  See the License for the
+ * specific language governing permissions and limitations
+ * under the License.
+ *
+ */
+
+#include <proton/message.h>
+
+// An encoded message is the concatenation of its head (header and
+// annotations), its properties and its tail (application properties
+// and body). Each part may be encoded on its own so that the parts
+// that do not change between sends are only encoded once. These
+// follow the conventions of pn_message_encode.
+int pni_message_encode_head(pn_message_t *msg, char *bytes, size_t *size);
+int pni_message_encode_properties(pn_message_t *msg, char *bytes, size_t *size);
+int pni_message_encode_tail(pn_message_t *msg, char *bytes, size_t *size);
+
+#endif /* message-internal.h */
@@ -29,6 +29,8 @@
 #include <stdio.h>
 #include <assert.h>
 #include "protocol.h"
+#include "encodings.h"
+#include "message-internal.h"
 #include "util.h"
 #include "platform_fmt.h"
 
@@ -651,13 +653,49 @@ int pn_message_set_reply_to_group_id(pn_message_t *msg, const char *reply_to_gro
   return pn_string_set(msg->reply_to_group_id, reply_to_group_id);
 }
 
-int pn_message_decode(pn_message_t *msg, const char *bytes, size_t size)
+// reads the descriptor of the section at the start of bytes without
+// decoding the section
+static bool pni_section_descriptor(const char *bytes, size_t size, uint64_t *desc)
+{
+  const uint8_t *b = (const uint8_t *) bytes;
+  if (size >= 3 && b[0] == PNE_DESCRIPTOR && b[1] == PNE_SMALLULONG) {
+    *desc = b[2];
+    return true;
+  } else if (size >= 10 && b[0] == PNE_DESCRIPTOR && b[1] == PNE_ULONG) {
+    *desc = 0;
+    for (int i = 2; i < 10; i++) {
+      *desc = (*desc << 8) | b[i];
+    }
+    return true;
+  } else {
+    return false;
+  }
+}
+
+static bool pni_header_section(const char *bytes, size_t size)
+{
+  uint64_t desc;
+  if (!pni_section_descriptor(bytes, size, &desc)) return false;
+  switch (desc) {
+  case HEADER:
+  case DELIVERY_ANNOTATIONS:
+  case MESSAGE_ANNOTATIONS:
+  case PROPERTIES:
+    return true;
+  default:
+    return false;
+  }
+}
+
+static int pni_message_decode(pn_message_t *msg, const char *bytes, size_t size,
+                              bool headers)
 {
   assert(msg && bytes && size);
 
   pn_message_clear(msg);
 
   while (size) {
+    if (headers && !pni_header_section(bytes, size)) break;
     pn_data_clear(msg->data);
     ssize_t used = pn_data_decode(msg->data, bytes, size);
     if (used < 0) return pn_error_format(msg->error, used, "data error: %s",
@@ -751,12 +789,19 @@ int pn_message_decode(pn_message_t *msg, const char *bytes, size_t size)
   return 0;
 }
 
-int pn_message_encode(pn_message_t *msg, char *bytes, size_t *size)
+int pn_message_decode(pn_message_t *msg, const char *bytes, size_t size)
 {
-  if (!msg || !bytes || !size || !*size) return PN_ARG_ERR;
+  return pni_message_decode(msg, bytes, size, false);
+}
 
-  pn_data_clear(msg->data);
+int pn_message_decode_headers(pn_message_t *msg, const char *bytes, size_t size)
+{
+  return pni_message_decode(msg, bytes, size, true);
+}
 
+// the sections that precede the properties: header and annotations
+static int pni_message_fill_head(pn_message_t *msg)
+{
   int err = pn_data_fill(msg->data, "DL[oB?IoI]", HEADER, msg->durable,
                          msg->priority, msg->ttl, msg->ttl, msg->first_acquirer,
                          msg->delivery_count);
@@ -788,30 +833,40 @@ int pn_message_encode(pn_message_t *msg, char *bytes, size_t *size)
     pn_data_exit(msg->data);
   }
 
-  err = pn_data_fill(msg->data, "DL[CzSSSCssttSIS]", PROPERTIES,
-                     msg->id,
-                     pn_string_size(msg->user_id), pn_string_get(msg->user_id),
-                     pn_string_get(msg->address),
-                     pn_string_get(msg->subject),
-                     pn_string_get(msg->reply_to),
-                     msg->correlation_id,
-                     pn_string_get(msg->content_type),
-                     pn_string_get(msg->content_encoding),
-                     msg->expiry_time,
-                     msg->creation_time,
-                     pn_string_get(msg->group_id),
-                     msg->group_sequence,
-                     pn_string_get(msg->reply_to_group_id));
+  return 0;
+}
+
+static int pni_message_fill_properties(pn_message_t *msg)
+{
+  int err = pn_data_fill(msg->data, "DL[CzSSSCssttSIS]", PROPERTIES,
+                         msg->id,
+                         pn_string_size(msg->user_id), pn_string_get(msg->user_id),
+                         pn_string_get(msg->address),
+                         pn_string_get(msg->subject),
+                         pn_string_get(msg->reply_to),
+                         msg->correlation_id,
+                         pn_string_get(msg->content_type),
+                         pn_string_get(msg->content_encoding),
+                         msg->expiry_time,
+                         msg->creation_time,
+                         pn_string_get(msg->group_id),
+                         msg->group_sequence,
+                         pn_string_get(msg->reply_to_group_id));
   if (err)
     return pn_error_format(msg->error, err, "data error: %s",
                            pn_data_error(msg->data));
+  return 0;
+}
 
+// the sections that follow the properties: application properties and body
+static int pni_message_fill_tail(pn_message_t *msg)
+{
   if (pn_data_size(msg->properties)) {
     pn_data_put_described(msg->data);
     pn_data_enter(msg->data);
     pn_data_put_ulong(msg->data, APPLICATION_PROPERTIES);
     pn_data_rewind(msg->properties);
-    err = pn_data_append(msg->data, msg->properties);
+    int err = pn_data_append(msg->data, msg->properties);
     if (err)
       return pn_error_format(msg->error, err, "data error: %s",
                              pn_data_error(msg->data));
@@ -844,6 +899,12 @@ int pn_message_encode(pn_message_t *msg, char *bytes, size_t *size)
     pn_data_append(msg->data, msg->body);
   }
 
+  return 0;
+}
+
+// encodes whatever has been filled into msg->data
+static int pni_message_encode_data(pn_message_t *msg, char *bytes, size_t *size)
+{
   size_t remaining = *size;
   ssize_t encoded = pn_data_encode(msg->data, bytes, remaining);
   if (encoded < 0) {
@@ -865,6 +926,52 @@ int pn_message_encode(pn_message_t *msg, char *bytes, size_t *size)
   return 0;
 }
 
+int pn_message_encode(pn_message_t *msg, char *bytes, size_t *size)
+{
+  if (!msg || !bytes || !size || !*size) return PN_ARG_ERR;
+
+  pn_data_clear(msg->data);
+
+  int err = pni_message_fill_head(msg);
+  if (err) return err;
+  err = pni_message_fill_properties(msg);
+  if (err) return err;
+  err = pni_message_fill_tail(msg);
+  if (err) return err;
+
+  return pni_message_encode_data(msg, bytes, size);
+}
+
+int pni_message_encode_head(pn_message_t *msg, char *bytes, size_t *size)
+{
+  if (!msg || !bytes || !size || !*size) return PN_ARG_ERR;
+
+  pn_data_clear(msg->data);
+  int err = pni_message_fill_head(msg);
+  if (err) return err;
+  return pni_message_encode_data(msg, bytes, size);
+}
+
+int pni_message_encode_properties(pn_message_t *msg, char *bytes, size_t *size)
+{
+  if (!msg || !bytes || !size || !*size) return PN_ARG_ERR;
+
+  pn_data_clear(msg->data);
+  int err = pni_message_fill_properties(msg);
+  if (err) return err;
+  return pni_message_encode_data(msg, bytes, size);
+}
+
+int pni_message_encode_tail(pn_message_t *msg, char *bytes, size_t *size)
+{
+  if (!msg || !bytes || !size || !*size) return PN_ARG_ERR;
+
+  pn_data_clear(msg->data);
+  int err = pni_message_fill_tail(msg);
+  if (err) return err;
+  return pni_message_encode_data(msg, bytes, size);
+}
+
 pn_format_t pn_message_get_format(pn_message_t *msg)
 {
   return msg ? msg->format : PN_AMQP;
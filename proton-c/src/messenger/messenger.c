@@ -42,6 +42,7 @@
 #include "transform.h"
 #include "subscription.h"
 #include "selectable.h"
+#include "message/message-internal.h"
 
 typedef struct pn_link_ctx_t pn_link_ctx_t;
 
@@ -77,6 +78,8 @@ struct pn_messenger_t {
   pn_socket_t ctrl[2];
   pn_list_t *listeners;
   pn_list_t *connections;
+  pn_map_t *connection_index;  // address key -> connection
+  pn_map_t *container_index;   // remote container -> connection
   pn_selector_t *selector;
   pn_collector_t *collector;
   pn_list_t *credited;
@@ -95,6 +98,7 @@ struct pn_messenger_t {
   pn_string_t *original;
   pn_string_t *rewritten;
   pn_string_t *domain;
+  pn_string_t *connection_key;
   int timeout;
   int send_threshold;
   pn_link_credit_mode_t credit_mode;
@@ -111,6 +115,7 @@ struct pn_messenger_t {
   pn_ssl_verify_mode_t ssl_peer_authentication_mode;
   bool blocking;
   bool passive;
+  bool at_most_once;
   bool interrupted;
   bool worked;
 };
@@ -142,6 +147,7 @@ typedef struct {
   char *host;
   char *port;
   pn_listener_ctx_t *listener;
+  pn_map_t *links;  // direction and terminus address -> active link
 } pn_connection_ctx_t;
 
 static pn_connection_ctx_t *pni_context(pn_selectable_t *sel)
@@ -440,7 +446,8 @@ static void pn_listener_ctx_free(pn_messenger_t *messenger, pn_listener_ctx_t *c
   free(ctx->host);
   free(ctx->port);
   pn_ssl_domain_free(ctx->domain);
-  pn_free(ctx);
+  // connections accepted by the listener may still refer to it
+  pn_decref(ctx);
 }
 
 static pn_connection_ctx_t *pn_connection_ctx(pn_messenger_t *messenger,
@@ -474,7 +481,8 @@ static pn_connection_ctx_t *pn_connection_ctx(pn_messenger_t *messenger,
   ctx->pass = pn_strdup(pass);
   ctx->host = pn_strdup(host);
   ctx->port = pn_strdup(port);
-  ctx->listener = lnr;
+  ctx->listener = (pn_listener_ctx_t *) pn_incref(lnr);
+  ctx->links = pn_map(PN_OBJECT, PN_WEAKREF, 0, 0.75);
   pn_connection_set_context(conn, ctx);
 
   return ctx;
@@ -490,11 +498,83 @@ static void pn_connection_ctx_free(pn_connection_t *conn)
     free(ctx->pass);
     free(ctx->host);
     free(ctx->port);
+    pn_free(ctx->links);
+    pn_decref(ctx->listener);
     free(ctx);
     pn_connection_set_context(conn, NULL);
   }
 }
 
+static const char *pni_link_terminus(pn_link_t *link)
+{
+  return pn_link_is_sender(link) ?
+    pn_terminus_get_address(pn_link_target(link)) :
+    pn_terminus_get_address(pn_link_source(link));
+}
+
+// builds the key a link is indexed under in its connection
+static pn_string_t *pni_link_key(pn_messenger_t *messenger, bool sender,
+                                 const char *terminus)
+{
+  pn_string_t *key = messenger->connection_key;
+  pn_string_set(key, sender ? "S" : "R");
+  if (terminus) {
+    pn_string_addf(key, ":%s", terminus);
+  }
+  return key;
+}
+
+static pn_connection_ctx_t *pni_link_connection_ctx(pn_link_t *link)
+{
+  pn_connection_t *conn = pn_session_connection(pn_link_session(link));
+  return (pn_connection_ctx_t *) pn_connection_get_context(conn);
+}
+
+// finds the first active link with the given direction and terminus
+static pn_link_t *pni_link_scan(pn_connection_t *connection, bool sender,
+                                const char *terminus, pn_link_t *exclude)
+{
+  pn_link_t *link = pn_link_head(connection, PN_LOCAL_ACTIVE);
+  while (link) {
+    if (link != exclude && pn_link_is_sender(link) == sender &&
+        pn_streq(terminus, pni_link_terminus(link))) {
+      return link;
+    }
+    link = pn_link_next(link, PN_LOCAL_ACTIVE);
+  }
+  return NULL;
+}
+
+// indexes a newly opened link unless an active link already has its key
+static void pni_link_index(pn_messenger_t *messenger, pn_link_t *link)
+{
+  pn_connection_ctx_t *ctx = pni_link_connection_ctx(link);
+  pn_string_t *key = pni_link_key(messenger, pn_link_is_sender(link),
+                                  pni_link_terminus(link));
+  pn_link_t *indexed = (pn_link_t *) pn_map_get(ctx->links, key);
+  if (!indexed || !(pn_link_state(indexed) & PN_LOCAL_ACTIVE)) {
+    pn_string_t *copy = pn_string(pn_string_get(key));
+    pn_map_put(ctx->links, copy, link);
+    pn_decref(copy);
+  }
+}
+
+static void pni_link_unindex(pn_messenger_t *messenger, pn_link_t *link)
+{
+  pn_connection_ctx_t *ctx = pni_link_connection_ctx(link);
+  if (!ctx) return;
+  bool sender = pn_link_is_sender(link);
+  const char *terminus = pni_link_terminus(link);
+  pn_string_t *key = pni_link_key(messenger, sender, terminus);
+  if (pn_map_get(ctx->links, key) == link) {
+    pn_map_del(ctx->links, key);
+    pn_link_t *next = pni_link_scan(ctx->connection, sender, terminus, link);
+    if (next) {
+      pni_link_index(messenger, next);
+    }
+  }
+}
+
 #define OUTGOING (0x0000000000000000)
 #define INCOMING (0x1000000000000000)
 
@@ -610,6 +690,7 @@ pn_messenger_t *pn_messenger(const char *name)
     m->timeout = -1;
     m->blocking = true;
     m->passive = false;
+    m->at_most_once = false;
     m->io = pn_io();
     m->pending = pn_list(PN_WEAKREF, 0);
     m->interruptor = pni_selectable
@@ -628,6 +709,8 @@ pn_messenger_t *pn_messenger(const char *name)
     pni_selectable_set_context(m->interruptor, m);
     m->listeners = pn_list(PN_WEAKREF, 0);
     m->connections = pn_list(PN_WEAKREF, 0);
+    m->connection_index = pn_map(PN_OBJECT, PN_WEAKREF, 0, 0.75);
+    m->container_index = pn_map(PN_OBJECT, PN_WEAKREF, 0, 0.75);
     m->selector = pn_io_selector(m->io);
     m->collector = pn_collector();
     m->credit_mode = LINK_CREDIT_EXPLICIT;
@@ -653,6 +736,7 @@ pn_messenger_t *pn_messenger(const char *name)
     m->original = pn_string(NULL);
     m->rewritten = pn_string(NULL);
     m->domain = pn_string(NULL);
+    m->connection_key = pn_string(NULL);
     m->connection_error = 0;
     m->flags = 0;
     m->snd_settle_mode = PN_SND_SETTLED;
@@ -759,6 +843,19 @@ int pn_messenger_set_passive(pn_messenger_t *messenger, bool passive)
   return 0;
 }
 
+bool pn_messenger_is_at_most_once(pn_messenger_t *messenger)
+{
+  assert(messenger);
+  return messenger->at_most_once;
+}
+
+int pn_messenger_set_at_most_once(pn_messenger_t *messenger, bool at_most_once)
+{
+  if (!messenger) return PN_ARG_ERR;
+  messenger->at_most_once = at_most_once;
+  return 0;
+}
+
 pn_selectable_t *pn_messenger_selectable(pn_messenger_t *messenger)
 {
   assert(messenger);
@@ -814,6 +911,10 @@ void pn_messenger_free(pn_messenger_t *messenger)
     pn_close(messenger->io, messenger->ctrl[1]);
     pn_free(messenger->listeners);
     pn_free(messenger->connections);
+    pn_free(messenger->connection_index);
+    pn_free(messenger->container_index);
+    // used by pni_reclaim to unindex the connections
+    pn_free(messenger->connection_key);
     pn_selector_free(messenger->selector);
     pn_collector_free(messenger->collector);
     pn_error_free(messenger->error);
@@ -1073,12 +1174,83 @@ void pni_messenger_reclaim_link(pn_messenger_t *messenger, pn_link_t *link)
   }
 
   link_ctx_release(messenger, link);
+  pni_link_unindex(messenger, link);
+}
+
+// builds the key a connection is indexed under, each part is length
+// prefixed so that absent and empty parts are distinct
+static pn_string_t *pni_connection_key(pn_messenger_t *messenger,
+                                       const char *scheme, const char *user,
+                                       const char *pass, const char *host,
+                                       const char *port)
+{
+  const char *parts[] = {scheme, user, pass, host, port};
+  pn_string_t *key = messenger->connection_key;
+  pn_string_set(key, "");
+  for (size_t i = 0; i < sizeof(parts)/sizeof(parts[0]); i++) {
+    if (parts[i]) {
+      pn_string_addf(key, "%i:%s", (int) strlen(parts[i]), parts[i]);
+    } else {
+      pn_string_addf(key, "-");
+    }
+  }
+  return key;
+}
+
+static pn_string_t *pni_connection_ctx_key(pn_messenger_t *messenger,
+                                           pn_connection_ctx_t *ctx)
+{
+  return pni_connection_key(messenger, ctx->scheme, ctx->user, ctx->pass,
+                            ctx->host, ctx->port);
+}
+
+// puts a copy of key in the index, the index holds the only reference
+static void pni_index_put(pn_map_t *index, pn_string_t *key, pn_connection_t *conn)
+{
+  pn_string_t *copy = pn_string(pn_string_get(key));
+  pn_map_put(index, copy, conn);
+  pn_decref(copy);
+}
+
+// removes conn from the indexes, the next connection in the list with
+// the same key (if any) takes its place
+static void pni_connection_unindex(pn_messenger_t *messenger, pn_connection_t *conn)
+{
+  pn_connection_ctx_t *ctx = (pn_connection_ctx_t *) pn_connection_get_context(conn);
+  pn_string_t *key = pn_string(pn_string_get(pni_connection_ctx_key(messenger, ctx)));
+  if (pn_map_get(messenger->connection_index, key) == conn) {
+    pn_map_del(messenger->connection_index, key);
+    for (size_t i = 0; i < pn_list_size(messenger->connections); i++) {
+      pn_connection_t *c = (pn_connection_t *) pn_list_get(messenger->connections, i);
+      pn_connection_ctx_t *cctx = (pn_connection_ctx_t *) pn_connection_get_context(c);
+      if (c != conn && pn_equals(key, pni_connection_ctx_key(messenger, cctx))) {
+        pni_index_put(messenger->connection_index, key, c);
+        break;
+      }
+    }
+  }
+
+  const char *container = pn_connection_remote_container(conn);
+  pn_string_set(key, container);
+  if (container && pn_map_get(messenger->container_index, key) == conn) {
+    pn_map_del(messenger->container_index, key);
+    for (size_t i = 0; i < pn_list_size(messenger->connections); i++) {
+      pn_connection_t *c = (pn_connection_t *) pn_list_get(messenger->connections, i);
+      if (c != conn && pn_streq(container, pn_connection_remote_container(c))) {
+        pni_index_put(messenger->container_index, key, c);
+        break;
+      }
+    }
+  }
+  pn_free(key);
 }
 
 void pni_messenger_reclaim(pn_messenger_t *messenger, pn_connection_t *conn)
 {
   if (!conn) return;
 
+  pni_connection_unindex(messenger, conn);
+
   pn_link_t *link = pn_link_head(conn, 0);
   while (link) {
     pni_messenger_reclaim_link(messenger, link);
@@ -1109,6 +1281,10 @@ pn_connection_t *pn_messenger_connection(pn_messenger_t *messenger,
   pn_connection_set_hostname(connection, host);
 
   pn_list_add(messenger->connections, connection);
+  pn_string_t *key = pni_connection_key(messenger, scheme, user, pass, host, port);
+  if (!pn_map_get(messenger->connection_index, key)) {
+    pni_index_put(messenger->connection_index, key, connection);
+  }
 
   return connection;
 }
@@ -1118,6 +1294,17 @@ void pn_messenger_process_connection(pn_messenger_t *messenger, pn_event_t *even
   pn_connection_t *conn = pn_event_connection(event);
   pn_connection_ctx_t *ctx = (pn_connection_ctx_t *) pn_connection_get_context(conn);
 
+  if (pn_event_type(event) == PN_CONNECTION_REMOTE_OPEN) {
+    // index the connection by the peer's container for pn_messenger_resolve
+    const char *container = pn_connection_remote_container(conn);
+    if (container) {
+      pn_string_set(messenger->connection_key, container);
+      if (!pn_map_get(messenger->container_index, messenger->connection_key)) {
+        pni_index_put(messenger->container_index, messenger->connection_key, conn);
+      }
+    }
+  }
+
   if (pn_connection_state(conn) & PN_LOCAL_UNINIT) {
     pn_connection_open(conn);
   }
@@ -1167,6 +1354,7 @@ void pn_messenger_process_link(pn_messenger_t *messenger, pn_event_t *event)
     pn_terminus_copy(pn_link_target(link), pn_link_remote_target(link));
     link_ctx_setup( messenger, conn, link );
     pn_link_open(link);
+    pni_link_index(messenger, link);
     if (pn_link_is_receiver(link)) {
       pn_listener_ctx_t *lnr = ctx->listener;
       ((pn_link_ctx_t *)pn_link_get_context(link))->subscription = lnr ? lnr->subscription : NULL;
@@ -1637,18 +1825,14 @@ pn_connection_t *pn_messenger_resolve(pn_messenger_t *messenger, const char *add
     pn_string_addf(domain, ":%s", port);
   }
 
-  for (size_t i = 0; i < pn_list_size(messenger->connections); i++) {
-    pn_connection_t *connection = (pn_connection_t *) pn_list_get(messenger->connections, i);
-    pn_connection_ctx_t *ctx = (pn_connection_ctx_t *) pn_connection_get_context(connection);
-    if (pn_streq(scheme, ctx->scheme) && pn_streq(user, ctx->user) &&
-        pn_streq(pass, ctx->pass) && pn_streq(host, ctx->host) &&
-        pn_streq(port, ctx->port)) {
-      return connection;
-    }
-    const char *container = pn_connection_remote_container(connection);
-    if (pn_streq(container, pn_string_get(domain))) {
-      return connection;
-    }
+  pn_connection_t *existing = (pn_connection_t *)
+    pn_map_get(messenger->connection_index,
+               pni_connection_key(messenger, scheme, user, pass, host, port));
+  if (!existing) {
+    existing = (pn_connection_t *) pn_map_get(messenger->container_index, domain);
+  }
+  if (existing) {
+    return existing;
   }
 
   pn_socket_t sock = pn_connect(messenger->io, host, port ? port : default_port(scheme));
@@ -1681,18 +1865,16 @@ PN_EXTERN pn_link_t *pn_messenger_get_link(pn_messenger_t *messenger,
   pn_connection_t *connection = pn_messenger_resolve(messenger, address, &name);
   if (!connection) return NULL;
 
-  pn_link_t *link = pn_link_head(connection, PN_LOCAL_ACTIVE);
-  while (link) {
-    if (pn_link_is_sender(link) == sender) {
-      const char *terminus = pn_link_is_sender(link) ?
-        pn_terminus_get_address(pn_link_target(link)) :
-        pn_terminus_get_address(pn_link_source(link));
-      if (pn_streq(name, terminus))
-        return link;
+  pn_connection_ctx_t *ctx = (pn_connection_ctx_t *) pn_connection_get_context(connection);
+  pn_link_t *link = (pn_link_t *) pn_map_get(ctx->links, pni_link_key(messenger, sender, name));
+  if (link && !(pn_link_state(link) & PN_LOCAL_ACTIVE)) {
+    // the indexed link has since been closed
+    link = pni_link_scan(connection, sender, name, NULL);
+    if (link) {
+      pni_link_index(messenger, link);
     }
-    link = pn_link_next(link, PN_LOCAL_ACTIVE);
   }
-  return NULL;
+  return link;
 }
 
 pn_link_t *pn_messenger_link(pn_messenger_t *messenger, const char *address,
@@ -1721,8 +1903,11 @@ pn_link_t *pn_messenger_link(pn_messenger_t *messenger, const char *address,
     }
   }
 
-  if ((sender && pn_messenger_get_outgoing_window(messenger)) ||
-      (!sender && pn_messenger_get_incoming_window(messenger))) {
+  if (sender && messenger->at_most_once) {
+    // every delivery on the link is sent pre-settled
+    pn_link_set_snd_settle_mode(link, PN_SND_SETTLED);
+  } else if ((sender && pn_messenger_get_outgoing_window(messenger)) ||
+             (!sender && pn_messenger_get_incoming_window(messenger))) {
     // use required settlement (defaults to sending pre-settled messages)
     pn_link_set_snd_settle_mode(link, messenger->snd_settle_mode);
     pn_link_set_rcv_settle_mode(link, messenger->rcv_settle_mode);
@@ -1754,6 +1939,7 @@ pn_link_t *pn_messenger_link(pn_messenger_t *messenger, const char *address,
                                         cctx->port);
   }
   pn_link_open(link);
+  pni_link_index(messenger, link);
   return link;
 }
 
@@ -1879,7 +2065,9 @@ int pni_pump_out(pn_messenger_t *messenger, const char *address, pn_link_t *send
   uint64_t next = messenger->next_tag++;
   *((uint64_t *) ptr) = next;
   pn_delivery_t *d = pn_delivery(sender, pn_dtag(tag, 8));
-  pni_entry_set_delivery(entry, d);
+  if (!messenger->at_most_once) {
+    pni_entry_set_delivery(entry, d);
+  }
   ssize_t n = pn_link_send(sender, encoded, size);
   if (n < 0) {
     pni_entry_free(entry);
@@ -1887,6 +2075,10 @@ int pni_pump_out(pn_messenger_t *messenger, const char *address, pn_link_t *send
                            pn_error_text(pn_link_error(sender)));
   } else {
     pn_link_advance(sender);
+    if (messenger->at_most_once) {
+      // nothing waits on the outcome, so the delivery goes out settled
+      pn_delivery_settle(d);
+    }
     pni_entry_free(entry);
     return 0;
   }
@@ -1934,6 +2126,32 @@ static void pni_restore(pn_messenger_t *messenger, pn_message_t *msg)
   pn_message_set_address(msg, pn_string_get(messenger->original));
 }
 
+// at most once entries are not tracked, so they are freed once sent
+static void pni_track_out(pn_messenger_t *messenger, pni_entry_t *entry)
+{
+  if (!messenger->at_most_once) {
+    messenger->outgoing_tracker = pn_tracker(OUTGOING, pni_entry_track(entry));
+  }
+}
+
+// sends the head of the outgoing queue for address, if it has a link
+static int pni_put_out(pn_messenger_t *messenger, const char *address)
+{
+  pn_link_t *sender = pn_messenger_target(messenger, address, 0);
+  if (!sender) {
+    int err = pn_error_code(messenger->error);
+    if (err) {
+      return err;
+    } else if (messenger->connection_error) {
+      return pni_bump_out(messenger, address);
+    } else {
+      return 0;
+    }
+  } else {
+    return pni_pump_out(messenger, address, sender);
+  }
+}
+
 int pn_messenger_put(pn_messenger_t *messenger, pn_message_t *msg)
 {
   if (!messenger) return PN_ARG_ERR;
@@ -1945,7 +2163,7 @@ int pn_messenger_put(pn_messenger_t *messenger, pn_message_t *msg)
   if (!entry)
     return pn_error_format(messenger->error, PN_ERR, "store error");
 
-  messenger->outgoing_tracker = pn_tracker(OUTGOING, pni_entry_track(entry));
+  pni_track_out(messenger, entry);
   pn_buffer_t *buf = pni_entry_bytes(entry);
 
   pni_rewrite(messenger, msg);
@@ -1967,25 +2185,144 @@ int pn_messenger_put(pn_messenger_t *messenger, pn_message_t *msg)
     } else {
       pni_restore(messenger, msg);
       pn_buffer_append(buf, encoded, size); // XXX
-      pn_link_t *sender = pn_messenger_target(messenger, address, 0);
-      if (!sender) {
-        int err = pn_error_code(messenger->error);
-        if (err) {
-          return err;
-        } else if (messenger->connection_error) {
-          return pni_bump_out(messenger, address);
-        } else {
-          return 0;
-        }
-      } else {
-        return pni_pump_out(messenger, address, sender);
-      }
+      // rewriting may have reallocated the address read above
+      return pni_put_out(messenger, pn_message_get_address(msg));
     }
   }
 
   return PN_ERR;
 }
 
+int pn_messenger_put_raw(pn_messenger_t *messenger, const char *address,
+                         const char *bytes, size_t size)
+{
+  if (!messenger) return PN_ARG_ERR;
+  if (!bytes || !size) return pn_error_set(messenger->error, PN_ARG_ERR, "no encoded message");
+
+  pni_entry_t *entry = pni_store_put(messenger->outgoing, address);
+  if (!entry)
+    return pn_error_format(messenger->error, PN_ERR, "store error");
+
+  pni_track_out(messenger, entry);
+  int err = pn_buffer_append(pni_entry_bytes(entry), bytes, size);
+  if (err) {
+    pni_entry_free(entry);
+    return pn_error_format(messenger->error, err, "put: error growing buffer");
+  }
+
+  return pni_put_out(messenger, address);
+}
+
+typedef int (*pni_encoder_t)(pn_message_t *, char *, size_t *);
+
+// encodes part of msg into buf, replacing its contents
+static int pni_encode_part(pn_messenger_t *messenger, pn_message_t *msg,
+                           pni_encoder_t encoder, pn_buffer_t *buf)
+{
+  pn_buffer_clear(buf);
+  while (true) {
+    char *encoded = pn_buffer_memory(buf).start;
+    size_t size = pn_buffer_capacity(buf);
+    int err = encoder(msg, encoded, &size);
+    if (err == PN_OVERFLOW) {
+      err = pn_buffer_ensure(buf, 2*pn_buffer_capacity(buf));
+      if (err) return pn_error_format(messenger->error, err, "put: error growing buffer");
+    } else if (err) {
+      return pn_error_format(messenger->error, err, "encode error: %s",
+                             pn_message_error(msg));
+    } else {
+      pn_buffer_append(buf, encoded, size); // XXX
+      return 0;
+    }
+  }
+}
+
+static int pni_append_part(pn_buffer_t *dst, pn_buffer_t *part)
+{
+  pn_bytes_t bytes = pn_buffer_bytes(part);
+  return pn_buffer_append(dst, bytes.start, bytes.size);
+}
+
+static int pni_put_fanout(pn_messenger_t *messenger, pn_message_t *msg,
+                          const char **addresses, size_t count,
+                          pn_buffer_t *head, pn_buffer_t *props, pn_buffer_t *tail)
+{
+  int err = pni_encode_part(messenger, msg, pni_message_encode_head, head);
+  if (err) return err;
+  err = pni_encode_part(messenger, msg, pni_message_encode_tail, tail);
+  if (err) return err;
+
+  for (size_t i = 0; i < count; i++) {
+    const char *address = addresses[i];
+    pn_message_set_address(msg, address);
+    pni_rewrite(messenger, msg);
+    err = pni_encode_part(messenger, msg, pni_message_encode_properties, props);
+    if (err) return err;
+
+    pni_entry_t *entry = pni_store_put(messenger->outgoing, address);
+    if (!entry)
+      return pn_error_format(messenger->error, PN_ERR, "store error");
+
+    pni_track_out(messenger, entry);
+    pn_buffer_t *buf = pni_entry_bytes(entry);
+    err = pni_append_part(buf, head);
+    if (!err) err = pni_append_part(buf, props);
+    if (!err) err = pni_append_part(buf, tail);
+    if (err) {
+      pni_entry_free(entry);
+      return pn_error_format(messenger->error, err, "put: error growing buffer");
+    }
+
+    err = pni_put_out(messenger, address);
+    if (err) return err;
+  }
+
+  return 0;
+}
+
+int pn_messenger_put_fanout(pn_messenger_t *messenger, pn_message_t *msg,
+                            const char **addresses, size_t count)
+{
+  if (!messenger) return PN_ARG_ERR;
+  if (!msg) return pn_error_set(messenger->error, PN_ARG_ERR, "null message");
+  if (count && !addresses) return pn_error_set(messenger->error, PN_ARG_ERR, "null addresses");
+  if (!count) return 0;
+
+  outward_munge(messenger, msg);
+  pn_string_t *original = pn_string(pn_message_get_address(msg));
+  pn_buffer_t *head = pn_buffer(1024);
+  pn_buffer_t *props = pn_buffer(256);
+  pn_buffer_t *tail = pn_buffer(1024);
+
+  int err;
+  if (!original || !head || !props || !tail) {
+    err = pn_error_set(messenger->error, PN_ERR, "put: allocation failed");
+  } else {
+    err = pni_put_fanout(messenger, msg, addresses, count, head, props, tail);
+    pn_message_set_address(msg, pn_string_get(original));
+  }
+
+  pn_buffer_free(tail);
+  pn_buffer_free(props);
+  pn_buffer_free(head);
+  pn_free(original);
+  return err;
+}
+
+int pn_messenger_put_many(pn_messenger_t *messenger, pn_message_t **msgs,
+                          size_t count)
+{
+  if (!messenger) return PN_ARG_ERR;
+  if (count && !msgs) return pn_error_set(messenger->error, PN_ARG_ERR, "null messages");
+
+  for (size_t i = 0; i < count; i++) {
+    int err = pn_messenger_put(messenger, msgs[i]);
+    if (err) return err;
+  }
+
+  return 0;
+}
+
 pn_tracker_t pn_messenger_outgoing_tracker(pn_messenger_t *messenger)
 {
   assert(messenger);
@@ -2227,6 +2564,27 @@ int pn_messenger_get(pn_messenger_t *messenger, pn_message_t *msg)
   }
 }
 
+int pn_messenger_get_raw(pn_messenger_t *messenger, char *bytes, size_t *size)
+{
+  if (!messenger || !size) return PN_ARG_ERR;
+
+  pni_entry_t *entry = pni_store_get(messenger->incoming, NULL);
+  if (!entry) return PN_EOS;
+
+  pn_bytes_t encoded = pn_buffer_bytes(pni_entry_bytes(entry));
+  if (!bytes || encoded.size > *size) {
+    *size = encoded.size;
+    return PN_OVERFLOW;
+  }
+
+  messenger->incoming_tracker = pn_tracker(INCOMING, pni_entry_track(entry));
+  messenger->incoming_subscription = (pn_subscription_t *) pni_entry_get_context(entry);
+  memmove(bytes, encoded.start, encoded.size);
+  *size = encoded.size;
+  pni_entry_free(entry);
+  return 0;
+}
+
 pn_tracker_t pn_messenger_incoming_tracker(pn_messenger_t *messenger)
 {
   assert(messenger);
@@ -35,6 +35,9 @@ typedef struct pni_stream_t pni_stream_t;
 
 struct pni_store_t {
   pni_stream_t *streams;
+  pni_stream_t *streams_tail;
+  pn_map_t *index;
+  pn_string_t *key;
   pni_entry_t *store_head;
   pni_entry_t *store_tail;
   pn_hash_t *tracked;
@@ -84,6 +87,9 @@ pni_store_t *pni_store()
 
   store->size = 0;
   store->streams = NULL;
+  store->streams_tail = NULL;
+  store->index = pn_map(PN_OBJECT, PN_VOID, 0, 0.75);
+  store->key = pn_string(NULL);
   store->store_head = NULL;
   store->store_tail = NULL;
   store->window = 0;
@@ -105,14 +111,10 @@ pni_stream_t *pni_stream(pni_store_t *store, const char *address, bool create)
   assert(store);
   assert(address);
 
-  pni_stream_t *prev = NULL;
-  pni_stream_t *stream = store->streams;
-  while (stream) {
-    if (!strcmp(pn_string_get(stream->address), address)) {
-      return stream;
-    }
-    prev = stream;
-    stream = stream->next;
+  pn_string_set(store->key, address);
+  pni_stream_t *stream = (pni_stream_t *) pn_map_get(store->index, store->key);
+  if (stream) {
+    return stream;
   }
 
   if (create) {
@@ -123,11 +125,13 @@ pni_stream_t *pni_stream(pni_store_t *store, const char *address, bool create)
     stream->stream_tail = NULL;
     stream->next = NULL;
 
-    if (prev) {
-      prev->next = stream;
+    if (store->streams_tail) {
+      store->streams_tail->next = stream;
     } else {
       store->streams = stream;
     }
+    store->streams_tail = stream;
+    pn_map_put(store->index, stream->address, stream);
   }
 
   return stream;
@@ -176,6 +180,9 @@ void pni_store_free(pni_store_t *store)
 {
   if (!store) return;
   pn_free(store->tracked);
+  // the index holds references to the stream addresses
+  pn_free(store->index);
+  pn_free(store->key);
   pni_stream_t *stream = store->streams;
   while (stream) {
     pni_stream_t *next = stream->next;
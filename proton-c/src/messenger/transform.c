@@ -19,9 +19,11 @@
  *
  */
 
+#include <stdlib.h>
 #include <string.h>
 #include <assert.h>
 #include <ctype.h>
+#include "util.h"
 #include "transform.h"
 
 typedef struct {
@@ -41,8 +43,42 @@ typedef struct {
   pn_string_t *substitution;
 } pn_rule_t;
 
+// Rules are indexed in a trie keyed on the literal prefix of their
+// pattern (everything up to the first wildcard), so an address is only
+// matched against the rules whose prefix it starts with. Each node
+// holds the indexes of the rules ending there in ascending order.
+typedef struct pni_trie_t pni_trie_t;
+
+struct pni_trie_t {
+  pni_trie_t *child;
+  pni_trie_t *sibling;
+  size_t *rules;
+  size_t size;
+  size_t capacity;
+  char c;
+};
+
+// a resolved address, the cache list runs from least to most recently
+// used
+typedef struct pni_cached_t pni_cached_t;
+
+struct pni_cached_t {
+  pn_string_t *address;
+  pn_string_t *result;
+  pni_cached_t *cache_next;
+  pni_cached_t *cache_prev;
+  bool matched;
+};
+
+#define PNI_CACHE_SIZE (1024)
+
 struct pn_transform_t {
   pn_list_t *rules;
+  pni_trie_t *trie;
+  pn_map_t *cache;
+  pni_cached_t *cache_head;
+  pni_cached_t *cache_tail;
+  pn_string_t *key;
   pn_matcher_t matcher;
   bool matched;
 };
@@ -69,9 +105,87 @@ pn_rule_t *pn_rule(const char *pattern, const char *substitution)
   return rule;
 }
 
+static void pni_trie_free(pni_trie_t *node)
+{
+  while (node) {
+    pni_trie_t *sibling = node->sibling;
+    pni_trie_free(node->child);
+    free(node->rules);
+    free(node);
+    node = sibling;
+  }
+}
+
+static pni_trie_t *pni_trie_child(pni_trie_t *node, char c, bool create)
+{
+  pni_trie_t *child = node->child;
+  while (child) {
+    if (child->c == c) return child;
+    child = child->sibling;
+  }
+
+  if (create) {
+    child = (pni_trie_t *) calloc(1, sizeof(pni_trie_t));
+    child->c = c;
+    child->sibling = node->child;
+    node->child = child;
+  }
+
+  return child;
+}
+
+static void pni_trie_add(pni_trie_t *node, const char *pattern, size_t rule)
+{
+  for (const char *c = pattern; *c && *c != '%' && *c != '*'; c++) {
+    node = pni_trie_child(node, *c, true);
+  }
+
+  PN_ENSURE(node->rules, node->capacity, node->size + 1, size_t);
+  node->rules[node->size++] = rule;
+}
+
+static void pni_cached_finalize(void *object)
+{
+  pni_cached_t *cached = (pni_cached_t *) object;
+  pn_free(cached->address);
+  pn_free(cached->result);
+}
+
+#define CID_pni_cached CID_pn_object
+#define pni_cached_initialize NULL
+#define pni_cached_hashcode NULL
+#define pni_cached_compare NULL
+#define pni_cached_inspect NULL
+
+static pni_cached_t *pni_cached(const char *address, const char *result, bool matched)
+{
+  static const pn_class_t clazz = PN_CLASS(pni_cached);
+  pni_cached_t *cached = (pni_cached_t *) pn_class_new(&clazz, sizeof(pni_cached_t));
+  cached->address = pn_string(address);
+  cached->result = pn_string(result);
+  cached->cache_next = NULL;
+  cached->cache_prev = NULL;
+  cached->matched = matched;
+  return cached;
+}
+
+// drops the compiled rules and resolved addresses, these are rebuilt
+// as needed when the transform is next applied
+static void pni_transform_invalidate(pn_transform_t *transform)
+{
+  pni_trie_free(transform->trie);
+  transform->trie = NULL;
+  pn_free(transform->cache);
+  transform->cache = NULL;
+  transform->cache_head = NULL;
+  transform->cache_tail = NULL;
+}
+
 static void pn_transform_finalize(void *object)
 {
   pn_transform_t *transform = (pn_transform_t *) object;
+  pni_transform_invalidate(transform);
+  pn_free(transform->key);
   pn_free(transform->rules);
 }
 
@@ -86,6 +200,11 @@ pn_transform_t *pn_transform()
   static const pn_class_t clazz = PN_CLASS(pn_transform);
   pn_transform_t *transform = (pn_transform_t *) pn_class_new(&clazz, sizeof(pn_transform_t));
   transform->rules = pn_list(PN_OBJECT, 0);
+  transform->trie = NULL;
+  transform->cache = NULL;
+  transform->cache_head = NULL;
+  transform->cache_tail = NULL;
+  transform->key = pn_string(NULL);
   transform->matched = false;
   return transform;
 }
@@ -97,6 +216,7 @@ void pn_transform_rule(pn_transform_t *transform, const char *pattern,
   pn_rule_t *rule = pn_rule(pattern, substitution);
   pn_list_add(transform->rules, rule);
   pn_decref(rule);
+  pni_transform_invalidate(transform);
 }
 
 static void pni_sub(pn_matcher_t *matcher, size_t group, const char *text, size_t matched)
@@ -206,28 +326,62 @@ static size_t pni_substitute(pn_matcher_t *matcher, const char *pattern, char *d
   return result;
 }
 
-int pn_transform_apply(pn_transform_t *transform, const char *src,
-                       pn_string_t *dst)
+// finds the first rule matching src, leaving its groups in the matcher
+static pn_rule_t *pni_transform_match(pn_transform_t *transform, const char *src)
 {
-  for (size_t i = 0; i < pn_list_size(transform->rules); i++)
-  {
-    pn_rule_t *rule = (pn_rule_t *) pn_list_get(transform->rules, i);
-    if (pni_match(&transform->matcher, pn_string_get(rule->pattern), src)) {
-      transform->matched = true;
-      if (!pn_string_get(rule->substitution)) {
-        return pn_string_set(dst, NULL);
+  size_t size = pn_list_size(transform->rules);
+  if (!transform->trie) {
+    transform->trie = (pni_trie_t *) calloc(1, sizeof(pni_trie_t));
+    for (size_t i = 0; i < size; i++) {
+      pn_rule_t *rule = (pn_rule_t *) pn_list_get(transform->rules, i);
+      pni_trie_add(transform->trie, pn_string_get(rule->pattern), i);
+    }
+  }
+
+  const char *text = src ? src : "";
+  size_t best = size;
+  pni_trie_t *node = transform->trie;
+  while (node) {
+    for (size_t i = 0; i < node->size && node->rules[i] < best; i++) {
+      pn_rule_t *rule = (pn_rule_t *) pn_list_get(transform->rules, node->rules[i]);
+      if (pni_match(&transform->matcher, pn_string_get(rule->pattern), src)) {
+        best = node->rules[i];
+        break;
       }
+    }
+    if (!*text) break;
+    node = pni_trie_child(node, *text++, false);
+  }
 
-      while (true) {
-        size_t capacity = pn_string_capacity(dst);
-        size_t n = pni_substitute(&transform->matcher,
-                                  pn_string_get(rule->substitution),
-                                  pn_string_buffer(dst), capacity);
-        int err = pn_string_resize(dst, n);
-        if (err) return err;
-        if (n <= capacity) {
-          return 0;
-        }
+  if (best == size) {
+    return NULL;
+  }
+
+  // later candidates may have overwritten the groups of the best match
+  pn_rule_t *rule = (pn_rule_t *) pn_list_get(transform->rules, best);
+  pni_match(&transform->matcher, pn_string_get(rule->pattern), src);
+  return rule;
+}
+
+static int pni_transform_apply(pn_transform_t *transform, const char *src,
+                               pn_string_t *dst)
+{
+  pn_rule_t *rule = pni_transform_match(transform, src);
+  if (rule) {
+    transform->matched = true;
+    if (!pn_string_get(rule->substitution)) {
+      return pn_string_set(dst, NULL);
+    }
+
+    while (true) {
+      size_t capacity = pn_string_capacity(dst);
+      size_t n = pni_substitute(&transform->matcher,
+                                pn_string_get(rule->substitution),
+                                pn_string_buffer(dst), capacity);
+      int err = pn_string_resize(dst, n);
+      if (err) return err;
+      if (n <= capacity) {
+        return 0;
       }
     }
   }
@@ -236,6 +390,44 @@ int pn_transform_apply(pn_transform_t *transform, const char *src,
   return pn_string_set(dst, src);
 }
 
+int pn_transform_apply(pn_transform_t *transform, const char *src,
+                       pn_string_t *dst)
+{
+  if (!pn_list_size(transform->rules)) {
+    transform->matched = false;
+    return pn_string_set(dst, src);
+  }
+
+  if (!transform->cache) {
+    transform->cache = pn_map(PN_OBJECT, PN_OBJECT, 0, 0.75);
+  }
+
+  pn_string_set(transform->key, src);
+  pni_cached_t *cached = (pni_cached_t *) pn_map_get(transform->cache, transform->key);
+  if (cached) {
+    if (cached != transform->cache_tail) {
+      LL_REMOVE(transform, cache, cached);
+      LL_ADD(transform, cache, cached);
+    }
+    transform->matched = cached->matched;
+    return pn_string_set(dst, pn_string_get(cached->result));
+  }
+
+  int err = pni_transform_apply(transform, src, dst);
+  if (err) return err;
+
+  if (pn_map_size(transform->cache) >= PNI_CACHE_SIZE) {
+    pni_cached_t *oldest = transform->cache_head;
+    LL_POP(transform, cache, pni_cached_t);
+    pn_map_del(transform->cache, oldest->address);
+  }
+  cached = pni_cached(src, pn_string_get(dst), transform->matched);
+  pn_map_put(transform->cache, cached->address, cached);
+  pn_decref(cached);
+  LL_ADD(transform, cache, cached);
+  return 0;
+}
+
 bool pn_transform_matched(pn_transform_t *transform)
 {
   return transform->matched;
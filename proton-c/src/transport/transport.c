@@ -1053,6 +1053,16 @@ static void pni_maybe_post_closed(pn_transport_t *transport)
   }
 }
 
+static void pni_post_head_closed(pn_transport_t *transport)
+{
+  if (!transport->posted_head_closed) {
+    pn_collector_t *collector = pni_transport_collector(transport);
+    pn_collector_put(collector, PN_OBJECT, transport, PN_TRANSPORT_HEAD_CLOSED);
+    transport->posted_head_closed = true;
+    pni_maybe_post_closed(transport);
+  }
+}
+
 // process pending input until none remaining or EOS
 static ssize_t transport_consume(pn_transport_t *transport)
 {
@@ -2182,12 +2192,8 @@ void pn_transport_pop(pn_transport_t *transport, size_t size)
                transport->output_pending );
     }
 
-    if (!transport->output_pending && pn_transport_pending(transport) < 0 &&
-        !transport->posted_head_closed) {
-      pn_collector_t *collector = pni_transport_collector(transport);
-      pn_collector_put(collector, PN_OBJECT, transport, PN_TRANSPORT_HEAD_CLOSED);
-      transport->posted_head_closed = true;
-      pni_maybe_post_closed(transport);
+    if (!transport->output_pending && pn_transport_pending(transport) < 0) {
+      pni_post_head_closed(transport);
     }
   }
 }
@@ -2195,6 +2201,9 @@ void pn_transport_pop(pn_transport_t *transport, size_t size)
 int pn_transport_close_head(pn_transport_t *transport)
 {
   transport->head_closed = true;
+  // whatever output is left can no longer be written
+  transport->output_pending = 0;
+  pni_post_head_closed(transport);
   return 0;
 }
 
@@ -288,8 +288,22 @@ def pn_data_encode(data, size):
     return len(enc), enc
 
 def pn_data_decode(data, encoded):
+  if not isinstance(encoded, str):
+    encoded = str(bytearray(encoded))
   return data.decode(ByteBuffer.wrap(array(encoded, 'b')))
 
+def pn_pycodec_init(classes):
+  pass
+
+def pn_data_put_pyobject(data, obj, types, fallback):
+  # there is no native walker here, so every object is put through the
+  # python mappings
+  fallback(obj)
+  return 0
+
+def pn_data_get_pyobject(data, fallback):
+  return fallback()
+
 def pn_data_narrow(data):
   data.narrow()
 
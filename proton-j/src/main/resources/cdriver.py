@@ -23,6 +23,9 @@ from org.apache.qpid.proton import Proton
 def pn_driver():
   return Proton.driver()
 
+def pn_driver_free(drv):
+  pass
+
 def pn_driver_wait(drv, t):
   drv.doWait(t)
 
@@ -32,6 +32,7 @@ from jarray import array, zeros
 
 from cerror import *
 from ccodec import *
+import weakref
 
 # from proton/engine.h
 PN_LOCAL_UNINIT = 1
@@ -77,6 +78,18 @@ PN_TRACE_RAW = Transport.TRACE_RAW
 PN_TRACE_FRM = Transport.TRACE_FRM
 PN_TRACE_DRV = Transport.TRACE_DRV
 
+# the python wrappers own their engine objects, so as in C an engine
+# object refers to its python wrapper without keeping it alive
+def _ref(ctx):
+  if ctx is None:
+    return None
+  return weakref.ref(ctx)
+
+def _deref(ref):
+  if ref is None:
+    return None
+  return ref()
+
 def wrap(obj, wrapper):
   if obj:
     ctx = obj.getContext()
@@ -215,10 +228,10 @@ def pn_connection_remote_desired_capabilities(conn):
   return array2dat(conn.impl.getRemoteDesiredCapabilities(), PN_SYMBOL)
 
 def pn_connection_get_context(conn):
-  return conn.context
+  return _deref(conn.context)
 
 def pn_connection_set_context(conn, ctx):
-  conn.context = ctx
+  conn.context = _ref(ctx)
 
 def pn_connection_set_container(conn, name):
   conn.impl.setContainer(name)
@@ -261,10 +274,10 @@ def pn_session(conn):
   return wrap(conn.impl.session(), pn_session_wrapper)
 
 def pn_session_get_context(ssn):
-  return ssn.context
+  return _deref(ssn.context)
 
 def pn_session_set_context(ssn, ctx):
-  ssn.context = ctx
+  ssn.context = _ref(ctx)
 
 def pn_session_state(ssn):
   return endpoint_state(ssn.impl)
@@ -523,10 +536,10 @@ class pn_link_wrapper(endpoint_wrapper):
     self.impl.setTarget(self.target.encode())
 
 def pn_link_get_context(link):
-  return link.context
+  return _deref(link.context)
 
 def pn_link_set_context(link, ctx):
-  link.context = ctx
+  link.context = _ref(ctx)
 
 def pn_link_source(link):
   link.source.decode(link.impl.getSource())
@@ -814,10 +827,10 @@ def pn_delivery_tag(dlv):
   return dlv.impl.getTag().tostring()
 
 def pn_delivery_get_context(dlv):
-  return dlv.context
+  return _deref(dlv.context)
 
 def pn_delivery_set_context(dlv, ctx):
-  dlv.context = ctx
+  dlv.context = _ref(ctx)
 
 def pn_delivery_partial(dlv):
   return dlv.impl.isPartial()
@@ -868,10 +881,14 @@ class pn_transport_wrapper:
   def __init__(self, impl):
     self.impl = impl
     self.condition = pn_condition()
+    self.tail = None
 
 def pn_transport():
   return wrap(Proton.transport(), pn_transport_wrapper)
 
+def pn_transport_free(trans):
+  pass
+
 def pn_transport_get_max_frame(trans):
   return trans.impl.getMaxFrameSize()
 
@@ -934,6 +951,41 @@ def pn_transport_push(trans, input):
   trans.impl.process()
   return len(input)
 
+def pn_transport_push_from(trans, buf, offset, length):
+  if offset > len(buf) or length > len(buf) - offset:
+    return PN_ARG_ERR
+  return pn_transport_push(trans, str(bytearray(buf[offset:offset + length])))
+
+def pn_transport_peek_into(trans, buf, offset):
+  if offset > len(buf):
+    return PN_ARG_ERR
+  pending = trans.impl.pending()
+  if pending < 0:
+    return pending
+  cd, out = pn_transport_peek(trans, len(buf) - offset)
+  buf[offset:offset + len(out)] = out
+  return len(out)
+
+# the java transport's buffers cannot be exposed to python, so the views
+# are copies and pn_transport_process pushes what was read into the tail
+def pn_transport_tail_view(trans):
+  capacity = trans.impl.capacity()
+  if capacity <= 0:
+    return None
+  trans.tail = bytearray(capacity)
+  return trans.tail
+
+def pn_transport_process(trans, size):
+  tail = trans.tail
+  trans.tail = None
+  return min(0, pn_transport_push(trans, str(tail[:size])))
+
+def pn_transport_head_view(trans):
+  pending = trans.impl.pending()
+  if pending <= 0:
+    return None
+  return pn_transport_peek(trans, pending)[1]
+
 def pn_transport_close_head(trans):
   trans.impl.close_head()
   return 0
@@ -993,6 +1045,10 @@ def pn_collector_peek(coll):
 def pn_collector_pop(coll):
   coll.pop()
 
+def pn_collector_drain(coll, max):
+  # no bulk path, Collector.drain falls back to peek/pop
+  return []
+
 def pn_collector_free(coll):
   pass
 
@@ -23,6 +23,9 @@ from org.apache.qpid.proton.message import MessageFormat
 
 from ccodec import *
 from cerror import *
+from cengine import pn_delivery, pn_link_send, pn_link_advance, \
+  pn_link_current, pn_link_recv, pn_delivery_readable, pn_delivery_partial, \
+  pn_delivery_pending
 
 # from proton/message.h
 PN_DATA = 0
@@ -81,6 +84,9 @@ class pn_message_wrapper:
 def pn_message():
   return pn_message_wrapper()
 
+def pn_message_free(msg):
+  pass
+
 def pn_message_id(msg):
   return msg.id
 
@@ -203,6 +209,56 @@ def pn_message_set_user_id(msg, uid):
   msg.impl.setUserId(uid)
   return 0
 
+HEADER_GETTERS = {
+  "durable": pn_message_is_durable,
+  "priority": pn_message_get_priority,
+  "ttl": pn_message_get_ttl,
+  "first_acquirer": pn_message_is_first_acquirer,
+  "delivery_count": pn_message_get_delivery_count,
+  "user_id": pn_message_get_user_id,
+  "address": pn_message_get_address,
+  "subject": pn_message_get_subject,
+  "reply_to": pn_message_get_reply_to,
+  "content_type": pn_message_get_content_type,
+  "content_encoding": pn_message_get_content_encoding,
+  "expiry_time": pn_message_get_expiry_time,
+  "creation_time": pn_message_get_creation_time,
+  "group_id": pn_message_get_group_id,
+  "group_sequence": pn_message_get_group_sequence,
+  "reply_to_group_id": pn_message_get_reply_to_group_id
+}
+
+HEADER_SETTERS = {
+  "durable": pn_message_set_durable,
+  "priority": pn_message_set_priority,
+  "ttl": pn_message_set_ttl,
+  "first_acquirer": pn_message_set_first_acquirer,
+  "delivery_count": pn_message_set_delivery_count,
+  "user_id": pn_message_set_user_id,
+  "address": pn_message_set_address,
+  "subject": pn_message_set_subject,
+  "reply_to": pn_message_set_reply_to,
+  "content_type": pn_message_set_content_type,
+  "content_encoding": pn_message_set_content_encoding,
+  "expiry_time": pn_message_set_expiry_time,
+  "creation_time": pn_message_set_creation_time,
+  "group_id": pn_message_set_group_id,
+  "group_sequence": pn_message_set_group_sequence,
+  "reply_to_group_id": pn_message_set_reply_to_group_id
+}
+
+def pn_message_get_header_fields(msg, id_fallback, correlation_id_fallback):
+  fields = dict((name, get(msg)) for name, get in HEADER_GETTERS.items())
+  fields["id"] = pn_data_get_pyobject(msg.id, id_fallback)
+  fields["correlation_id"] = pn_data_get_pyobject(msg.correlation_id,
+                                                  correlation_id_fallback)
+  return fields
+
+def pn_message_set_header_fields(msg, fields):
+  for name, value in fields.items():
+    HEADER_SETTERS[name](msg, value)
+  return 0
+
 def pn_message_instructions(msg):
   return msg.instructions
 
@@ -215,11 +271,24 @@ def pn_message_properties(msg):
 def pn_message_body(msg):
   return msg.body
 
-def pn_message_decode(msg, data, n):
+def pn_message_decode(msg, data):
+  if not isinstance(data, str):
+    data = str(bytearray(data))
   n = msg.impl.decode(array(data, 'b'), 0, len(data))
   msg.post_decode()
   return n
 
+def pn_message_decode_headers(msg, data):
+  # the java codec has no partial decode, so the skipped sections are
+  # decoded and then dropped
+  if not isinstance(data, str):
+    data = str(bytearray(data))
+  n = msg.impl.decode(array(data, 'b'), 0, len(data))
+  msg.impl.setApplicationProperties(None)
+  msg.impl.setBody(None)
+  msg.post_decode()
+  return n
+
 from java.nio import BufferOverflowException
 
 def pn_message_encode(msg, size):
@@ -235,6 +304,50 @@ def pn_message_encode(msg, size):
   except BufferOverflowException, e:
     return PN_OVERFLOW, None
 
+def pn_link_send_message(link, msg, tag):
+  size = 1024
+  while True:
+    result = pn_message_encode(msg, size)
+    if not isinstance(result, tuple):
+      return None
+    err, data = result
+    if err != PN_OVERFLOW:
+      break
+    size *= 2
+  if err < 0:
+    return None
+  dlv = pn_delivery(link, tag)
+  pn_link_send(link, data)
+  pn_link_advance(link)
+  return dlv
+
+def pn_link_recv_message(link, msg):
+  dlv = pn_link_current(link)
+  if not dlv or not pn_delivery_readable(dlv) or pn_delivery_partial(dlv):
+    return 0
+  n, data = pn_link_recv(link, pn_delivery_pending(dlv))
+  if n < 0:
+    return n
+  n = pn_message_decode(msg, data)
+  if n < 0:
+    return n
+  pn_link_advance(link)
+  return 1
+
+def pn_message_encode_into(msg, buf, offset):
+  if offset > len(buf):
+    return PN_ARG_ERR
+  msg.pre_encode()
+  size = len(buf) - offset
+  ba = zeros(size, 'b')
+  try:
+    n = msg.impl.encode(ba, 0, size)
+  except BufferOverflowException, e:
+    return PN_OVERFLOW
+  if n >= 0:
+    buf[offset:offset + n] = ba[:n].tostring()
+  return n
+
 
 MESSAGE_FORMAT_J2P = {
   MessageFormat.DATA: PN_DATA,
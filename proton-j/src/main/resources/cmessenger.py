@@ -19,6 +19,8 @@
 from org.apache.qpid.proton import Proton
 from org.apache.qpid.proton.messenger import Messenger, Status
 from org.apache.qpid.proton import InterruptException, TimeoutException
+from java.nio import BufferOverflowException
+from jarray import array, zeros
 
 from cerror import *
 
@@ -46,6 +48,9 @@ def pn_messenger(name):
   else:
     return pn_messenger_wrapper(Proton.messenger(name))
 
+def pn_messenger_free(m):
+  pass
+
 def pn_messenger_error(m):
   return m.error
 
@@ -133,6 +138,34 @@ def pn_messenger_put(m, msg):
   m.impl.put(msg.impl)
   return 0
 
+def pn_messenger_put_many(m, msgs):
+  for msg in msgs:
+    pn_messenger_put(m, msg)
+  return 0
+
+def pn_messenger_put_fanout(m, msg, addresses):
+  original = msg.impl.getAddress()
+  try:
+    for address in addresses:
+      msg.impl.setAddress(address)
+      pn_messenger_put(m, msg)
+  finally:
+    msg.impl.setAddress(original)
+  return 0
+
+def pn_messenger_put_raw(m, address, data):
+  # the java messenger only sends message objects, so the raw message
+  # is decoded and re-encoded on the way out
+  if not isinstance(data, str):
+    data = str(bytearray(data))
+  if not data:
+    return PN_ARG_ERR
+  impl = Proton.message()
+  impl.decode(array(data, 'b'), 0, len(data))
+  impl.setAddress(address)
+  m.impl.put(impl)
+  return 0
+
 def pn_messenger_outgoing_tracker(m):
   return m.impl.outgoingTracker()
 
@@ -169,6 +202,19 @@ def pn_messenger_get(m, msg):
     msg.decode(mimpl)
   return 0
 
+def pn_messenger_get_raw(m):
+  impl = m.impl.get()
+  if impl is None:
+    return PN_EOS, None
+  size = 1024
+  while True:
+    ba = zeros(size, 'b')
+    try:
+      n = impl.encode(ba, 0, size)
+      return 0, ba[:n].tostring()
+    except BufferOverflowException, e:
+      size *= 2
+
 def pn_messenger_incoming_tracker(m):
   return m.impl.incomingTracker()
 
@@ -221,5 +267,11 @@ def pn_messenger_status(m, tracker):
 def pn_messenger_set_passive(m, passive):
   raise Skipped()
 
+def pn_messenger_is_at_most_once(m):
+  return False
+
+def pn_messenger_set_at_most_once(m, at_most_once):
+  raise Skipped()
+
 def pn_messenger_selectable(m):
   raise Skipped()
@@ -26,6 +26,12 @@ def pn_void2py(obj):
 def pn_py2void(obj):
     return obj
 
+def pn_incref(obj):
+  return obj
+
+def pn_decref(obj):
+  pass
+
 def pn_cast_pn_connection(obj):
     return obj
 
@@ -21,6 +21,7 @@ import proton_tests.codec
 import proton_tests.engine
 import proton_tests.message
 import proton_tests.messenger
+import proton_tests.reactor
 import proton_tests.sasl
 import proton_tests.transport
 import proton_tests.ssl
@@ -17,7 +17,8 @@
 # under the License.
 #
 
-import os, common
+import os, common, array
+from common import Skipped
 from proton import *
 try:
   from uuid import uuid4
@@ -301,6 +302,191 @@ class DataTest(Test):
     copy = data.get_object()
     assert copy == obj, (copy, obj)
 
+  def testEncode(self):
+    self.data.put_list()
+    self.data.enter()
+    self.data.put_long(1)
+    self.data.put_string("two")
+    self.data.put_map()
+    self.data.enter()
+    self.data.put_symbol("three")
+    self.data.put_ulong(3)
+    self.data.exit()
+    self.data.put_described()
+    self.data.enter()
+    self.data.put_symbol("four")
+    self.data.put_timestamp(4)
+    self.data.exit()
+    self.data.put_array(False, Data.INT)
+    self.data.enter()
+    self.data.put_int(5)
+    self.data.exit()
+    self.data.exit()
+    expected = self.data.encode()
+
+    obj = [1, u"two", {symbol("three"): ulong(3)},
+           Described(symbol("four"), timestamp(4)),
+           Array(UNDESCRIBED, Data.INT, 5)]
+    assert encode(obj) == expected, (encode(obj), expected)
+
+  def testPutObjectFallback(self):
+    class Mapped(dict):
+      pass
+    class Unmapped(object):
+      pass
+
+    Data.put_mappings[Mapped] = Data.put_dict
+    try:
+      self.data.put_object([Mapped(key=u"value")])
+    finally:
+      del Data.put_mappings[Mapped]
+    self.data.rewind()
+    self.data.next()
+    assert self.data.get_object() == [{u"key": u"value"}]
+
+    try:
+      self.data.put_object([Unmapped()])
+      assert False, "expected a KeyError"
+    except KeyError:
+      pass
+
+  def testPutObjectOverflow(self):
+    try:
+      self.data.put_object([ulong(-1)])
+      assert False, "expected an OverflowError"
+    except OverflowError:
+      pass
+
+  def testGetObjectTypes(self):
+    u = uuid4()
+    self.data.put_list()
+    self.data.enter()
+    self.data.put_ubyte(255)
+    self.data.put_byte(-128)
+    self.data.put_ushort(65535)
+    self.data.put_short(-32768)
+    self.data.put_uint(4294967295)
+    self.data.put_int(-2147483648)
+    self.data.put_long(-9223372036854775808)
+    self.data.put_ulong(18446744073709551615)
+    self.data.put_timestamp(1234)
+    self.data.put_float(1.5)
+    self.data.put_double(2.25)
+    self.data.put_decimal64(18446744073709551615)
+    self.data.put_char(u"c")
+    self.data.put_uuid(u)
+    self.data.put_binary("bin\x00ary")
+    self.data.put_string(u"str\u00e9ing")
+    self.data.put_symbol("sym")
+    self.data.put_null()
+    self.data.exit()
+
+    self.data.rewind()
+    self.data.next()
+    obj = self.data.get_object()
+    expected = [(255, int), (-128, int), (65535, int), (-32768, int),
+                (4294967295, int), (-2147483648, int),
+                (-9223372036854775808, int), (18446744073709551615, ulong),
+                (1234, timestamp), (1.5, float), (2.25, float),
+                (18446744073709551615, long), (u"c", char), (u, type(u)),
+                ("bin\x00ary", str), (u"str\u00e9ing", unicode),
+                ("sym", symbol), (None, type(None))]
+    assert len(obj) == len(expected), obj
+    for o, (v, t) in zip(obj, expected):
+      assert o == v and type(o) is t, (o, type(o), v, t)
+
+  def testGetObjectEmpty(self):
+    assert self.data.get_object() is None
+    self.data.put_map()
+    self.data.put_list()
+    self.data.put_described()
+    self.data.enter()
+    self.data.put_symbol("desc")
+    self.data.put_map()
+    self.data.enter()
+    self.data.put_string("no value")
+    self.data.exit()
+    self.data.exit()
+    self.data.rewind()
+    assert self.data.next()
+    assert self.data.get_object() == {}
+    assert self.data.next()
+    assert self.data.get_object() == []
+    assert self.data.next()
+    assert self.data.get_object() == Described(symbol("desc"), {u"no value": None})
+
+  def testDecode(self):
+    obj = {symbol("key"): [Described(symbol("url"), u"http://example.org"),
+                           Array(symbol("arr"), Data.LONG, 1, 2, 3),
+                           Array(UNDESCRIBED, Data.LIST)],
+           u"uuid": uuid4()}
+    enc = encode(obj)
+    assert decode(enc) == obj, (decode(enc), obj)
+    assert decode(bytearray(enc)) == obj
+    assert decode(memoryview(enc)) == obj
+
+  def testNumericArrays(self):
+    values = [0, 1, 2, 100, 127]
+    for atype in (Data.BYTE, Data.UBYTE, Data.SHORT, Data.USHORT, Data.INT,
+                  Data.UINT, Data.LONG, Data.ULONG, Data.TIMESTAMP):
+      arr = Array(UNDESCRIBED, atype, array.array("b", values))
+      assert tuple(arr.elements) == tuple(values), arr.elements
+      enc = encode(arr)
+      # tuples of elements encode identically
+      assert encode(Array(UNDESCRIBED, atype, *values)) == enc
+      dec = decode(enc)
+      assert dec == arr, (dec, arr)
+      assert isinstance(dec.elements, tuple), dec.elements
+      assert encode(dec) == enc
+      dec = decode(enc, buffer_arrays=True)
+      assert dec == arr, (dec, arr)
+      if atype in (Data.ULONG, Data.TIMESTAMP):
+        assert isinstance(dec.elements, tuple), dec.elements
+      else:
+        assert isinstance(dec.elements, array.array), dec.elements
+      assert encode(dec) == enc
+
+    for atype in (Data.FLOAT, Data.DOUBLE):
+      arr = Array(symbol("floats"), atype, array.array("f", [0.5, -1.25, 3.0]))
+      for buffer_arrays in (False, True):
+        dec = decode(encode(arr), buffer_arrays)
+        assert dec == arr, (dec, arr)
+        assert dec == Array(symbol("floats"), atype, 0.5, -1.25, 3.0)
+
+  def testNumericArrayElements(self):
+    for atype, cls in ((Data.ULONG, ulong), (Data.TIMESTAMP, timestamp)):
+      for buffer_arrays in (False, True):
+        dec = decode(encode(Array(UNDESCRIBED, atype, 1, 2)), buffer_arrays)
+        assert [e.__class__ for e in dec.elements] == [cls, cls], dec.elements
+    msg = Message(body=Array(UNDESCRIBED, Data.INT, 1, 2, 3))
+    received = Message()
+    received.decode(msg.encode())
+    assert received.body.elements == (1, 2, 3), received.body
+    received = Message()
+    received.buffer_arrays = True
+    received.decode(msg.encode())
+    assert received.body.elements == array.array("i", [1, 2, 3]), received.body
+
+  def testLargeArray(self):
+    arr = Array(UNDESCRIBED, Data.DOUBLE,
+                array.array("d", [i/4.0 for i in xrange(1000000)]))
+    dec = decode(encode(arr), buffer_arrays=True)
+    assert dec.elements == arr.elements
+    self.data.put_object(Array(UNDESCRIBED, Data.INT, *range(100000)))
+    self.data.rewind()
+    assert self.data.next() == Data.ARRAY
+    assert self.data.get_array() == (100000, False, Data.INT)
+
+  def testNumpyArray(self):
+    try:
+      import numpy
+    except ImportError:
+      raise Skipped("numpy not available")
+    values = numpy.arange(0, 1000, 0.5)
+    arr = Array(UNDESCRIBED, Data.FLOAT, values[::2])
+    dec = decode(encode(arr))
+    assert tuple(dec.elements) == tuple(values[::2]), dec.elements
+
   def testLookup(self):
     obj = {symbol("key"): u"value",
            symbol("pi"): 3.14159,
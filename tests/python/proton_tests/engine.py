@@ -765,6 +765,118 @@ class TransferTest(Test):
     assert sd.local_state == rd.remote_state == Delivery.ACCEPTED
     sd.settle()
 
+  def test_send_message(self):
+    self.rcv.flow(3)
+    msg = Message()
+    tags = []
+    for i in range(3):
+      msg.body = u"message-%s" % i
+      sd = self.snd.send_message(msg, settled=(i == 2))
+      if not sd.released:
+        tags.append(sd.tag)
+    assert sd.released
+    assert self.snd.current is None
+
+    self.pump()
+
+    for i in range(3):
+      rd = self.rcv.current
+      if i < 2:
+        assert rd.tag == tags[i], (rd.tag, tags[i])
+      else:
+        assert rd.tag not in tags, (rd.tag, tags)
+      assert not rd.partial
+      received = Message()
+      received.decode(self.rcv.recv(rd.pending))
+      assert received.body == u"message-%s" % i, received.body
+      assert rd.settled == (i == 2), rd.settled
+      self.rcv.advance()
+
+  def test_send_message_tag(self):
+    self.rcv.flow(1)
+    sd = self.snd.send_message(Message(body=u"x"*5000), tag="custom")
+    assert sd.tag == "custom", sd.tag
+    self.pump()
+    rd = self.rcv.current
+    assert rd.tag == "custom", rd.tag
+    received = Message()
+    received.decode(self.rcv.recv(rd.pending))
+    assert received.body == u"x"*5000
+
+  def test_send_message_current(self):
+    sd = self.snd.delivery("manual")
+    try:
+      self.snd.send_message(Message(body=u"x"))
+      assert False, "expected a LinkException"
+    except LinkException:
+      pass
+    assert self.snd.current == sd
+    assert sd.pending == 0, sd.pending
+
+  def test_send_message_large(self):
+    self.rcv.flow(2)
+    bodies = [u"z"*200000, u"small"]
+    for body in bodies:
+      self.snd.send_message(Message(body=body))
+    self.pump()
+    for body in bodies:
+      received = Message()
+      received.decode(self.rcv.recv(self.rcv.current.pending))
+      assert received.body == body
+      self.rcv.advance()
+
+  def test_recv_message(self):
+    self.rcv.flow(2)
+    for i in range(2):
+      self.snd.send_message(Message(body=u"message-%s" % i))
+    self.pump()
+    msg = Message()
+    for i in range(2):
+      received, rd = self.rcv.recv_message(msg)
+      assert received is msg
+      assert msg.body == u"message-%s" % i, msg.body
+      assert rd.tag == "%x" % (i + 1), rd.tag
+    assert self.rcv.recv_message() is None
+
+  def test_recv_message_partial(self):
+    self.rcv.flow(1)
+    encoded = Message(body=u"y"*10000).encode()
+    self.snd.delivery("tag")
+    self.snd.send(encoded[:4000])
+    self.pump()
+    assert self.rcv.current.partial
+    assert self.rcv.recv_message() is None
+    self.snd.send(encoded[4000:])
+    self.snd.advance()
+    self.pump()
+    received, rd = self.rcv.recv_message()
+    assert received.body == u"y"*10000
+    assert rd.tag == "tag", rd.tag
+    assert self.rcv.current is None
+
+  def test_recv_message_garbage(self):
+    self.rcv.flow(1)
+    self.snd.delivery("tag")
+    self.snd.send("garbage")
+    self.snd.advance()
+    self.pump()
+    try:
+      self.rcv.recv_message()
+      assert False, "expected a decode error"
+    except MessageException, e:
+      assert "data error" in str(e), str(e)
+    assert self.rcv.current.tag == "tag"
+
+  def test_recv_message_large(self):
+    self.rcv.flow(2)
+    bodies = [u"z"*200000, u"small"]
+    for body in bodies:
+      self.snd.send_message(Message(body=body))
+    self.pump()
+    for body in bodies:
+      received, rd = self.rcv.recv_message()
+      assert received.body == body
+
   def test_delivery_id_ordering(self):
     self.rcv.flow(1024)
     self.pump(buffer_size=64*1024)
@@ -1495,6 +1607,81 @@ class CreditTest(Test):
 
 
 
+class CreditPolicyTest(Test):
+
+  def setup(self):
+    self.snd, self.rcv = self.link("test-link")
+    self.snd.open()
+    self.rcv.open()
+    self.pump()
+
+  def teardown(self):
+    self.cleanup()
+    self.snd = None
+    self.rcv = None
+
+  def send(self, count, body=u"x"):
+    for i in range(count):
+      self.snd.send_message(Message(body=body), settled=True)
+    self.pump()
+
+  def testPrefetch(self):
+    self.rcv.credit_policy = Prefetch(10, 4)
+    assert self.rcv.credit == 10, self.rcv.credit
+    self.send(5)
+    assert self.rcv.queued == 5, self.rcv.queued
+    # queued messages hold on to their credit until they are read
+    self.rcv.replenish()
+    assert self.rcv.credit == 10, self.rcv.credit
+    msg = Message()
+    for i in range(5):
+      assert self.rcv.recv_message(msg) is not None
+    assert self.rcv.credit == 5, self.rcv.credit
+    self.send(2)
+    # reading down to the low water mark tops the window up again
+    assert self.rcv.recv_message(msg) is not None
+    assert self.rcv.credit == 10, self.rcv.credit
+    assert self.rcv.queued == 1, self.rcv.queued
+
+  def testBytePrefetch(self):
+    policy = BytePrefetch(4096, estimate=512)
+    assert policy.window == 8, policy.window
+    for i in range(100):
+      policy.received(self.rcv, 2048)
+    assert policy.window == 2, policy.window
+    self.rcv.credit_policy = policy
+    assert self.rcv.credit == 2, self.rcv.credit
+
+  def testAdaptivePrefetch(self):
+    policy = AdaptivePrefetch(min_window=2, max_window=100, horizon=0)
+    self.rcv.credit_policy = policy
+    assert self.rcv.credit == 2, self.rcv.credit
+    self.send(2)
+    msg = Message()
+    while self.rcv.recv_message(msg):
+      pass
+    assert 2 <= policy.window <= 100, policy.window
+    assert 0 < self.rcv.credit <= 100, self.rcv.credit
+
+  def testCreditHandler(self):
+    collector = Collector()
+    self.rcv.connection.collect(collector)
+    self.rcv.credit_policy = Prefetch(4, 2)
+    handler = CreditHandler()
+    self.send(2)
+    for ev in collector:
+      ev.dispatch(handler)
+    assert self.rcv.credit == 4, self.rcv.credit
+    # read without replenishing, so that the handler has to top up
+    for i in range(2):
+      self.rcv.recv(1024)
+      self.rcv.advance()
+    assert self.rcv.credit == 2, self.rcv.credit
+    self.send(2)
+    for ev in collector:
+      ev.dispatch(handler)
+    assert self.rcv.credit == 4, self.rcv.credit
+
 class SessionCreditTest(Test):
 
   def teardown(self):
@@ -1718,6 +1905,69 @@ class SettlementTest(Test):
     for rd in unsettled:
       rd.settle()
 
+  def testAdvanceSettled(self):
+    self.rcv.flow(1)
+    self.pump()
+    sd = self.snd.delivery("tag")
+    self.snd.send("x")
+    assert self.snd.advance()
+    sd.settle()
+    self.pump()
+
+    rd = self.rcv.current
+    assert rd.settled
+    self.rcv.recv(rd.pending)
+    rd.update(Delivery.ACCEPTED)
+    assert self.rcv.advance()
+    # the link no longer holds it, but it is up to the application to settle
+    assert not rd.released
+    assert not self.rcv._deliveries, self.rcv._deliveries
+    assert self.rcv.unsettled == 1, self.rcv.unsettled
+    rd.settle()
+    assert rd.released
+    assert rd.settled
+    assert rd.local_state == Delivery.ACCEPTED, rd.local_state
+    assert self.rcv.unsettled == 0, self.rcv.unsettled
+
+  def testAdvanceSettledCollected(self):
+    self.rcv.flow(1)
+    self.pump()
+    sd = self.snd.delivery("tag")
+    self.snd.send("x")
+    assert self.snd.advance()
+    sd.settle()
+    self.pump()
+
+    self.rcv.recv(self.rcv.current.pending)
+    assert self.rcv.advance()
+    gc.collect()
+    # a passed delivery nobody holds is settled as its wrapper goes
+    assert self.rcv.unsettled == 0, self.rcv.unsettled
+
+  def testPrune(self, count=3000):
+    self.rcv.flow(count)
+    self.pump()
+    delivered = []
+    for i in range(count):
+      self.snd.delivery("tag%s" % i)
+      self.snd.send("x")
+      assert self.snd.advance()
+      self.pump()
+      rd = self.rcv.current
+      self.rcv.recv(rd.pending)
+      rd.update(Delivery.ACCEPTED)
+      assert self.rcv.advance()
+      self.pump()
+      # the sender settles only after the receiver has passed the delivery
+      for sd in list(self.snd._deliveries):
+        sd.settle()
+      self.pump()
+      delivered.append(rd)
+    assert len(self.rcv._deliveries) <= 2048, len(self.rcv._deliveries)
+    assert self.snd.unsettled == 0, self.snd.unsettled
+    for rd in delivered:
+      rd.settle()
+
   def testMultipleUnsettled2K1K(self):
     self.testMultipleUnsettled(2048, 1024)
 
@@ -2318,6 +2568,168 @@ class EventTest(CollectorTest):
 
     self.expect_until(Event.LINK_REMOTE_DETACH)
 
+  def testPeekPop(self):
+    c = Connection()
+    c.collect(self.collector)
+    ev = self.collector.peek()
+    assert ev is self.collector.peek()
+    assert ev.type == Event.CONNECTION_INIT and ev.context is c, ev
+    self.collector.pop()
+    assert self.collector.peek() is None
+    self.collector.put(c, Event.TRANSPORT.number)
+    assert self.collector.peek().type == Event.TRANSPORT
+
+  def testDrain(self):
+    c1, c2 = self.connection()
+    c1.collect(self.collector)
+    c2.open()
+    ssn = c2.session()
+    snd = ssn.sender("sender")
+    ssn.open()
+    snd.open()
+    self.pump()
+    # the remote session and link get their wrappers as they are drained
+    events = self.collector.drain()
+    assert [e.type for e in events] == \
+        [Event.CONNECTION_INIT, Event.CONNECTION_REMOTE_OPEN,
+         Event.SESSION_INIT, Event.SESSION_REMOTE_OPEN,
+         Event.LINK_INIT, Event.LINK_REMOTE_OPEN], events
+    assert events[0].context is c1 and events[1].context is c1, events
+    assert events[2].context is events[3].context, events
+    assert events[4].context is events[5].context, events
+    assert events[5].context.session is events[2].context, events
+    assert self.collector.peek() is None
+
+  def testDrainLimit(self):
+    c = Connection()
+    c.collect(self.collector)
+    ssn = c.session()
+    snd = ssn.sender("sender")
+    c.open()
+    ssn.open()
+    snd.open()
+    self.collector.put(ssn, Event.TRANSPORT.number)
+    expected = [(Event.CONNECTION_INIT, c), (Event.SESSION_INIT, ssn),
+                (Event.LINK_INIT, snd), (Event.CONNECTION_LOCAL_OPEN, c),
+                (Event.SESSION_LOCAL_OPEN, ssn), (Event.LINK_LOCAL_OPEN, snd),
+                (Event.TRANSPORT, ssn)]
+    events = []
+    while True:
+      batch = self.collector.drain(2)
+      assert len(batch) <= 2, batch
+      if not batch:
+        break
+      events.extend(batch)
+    assert [(e.type, e.context) for e in events] == expected, events
+
+  def testIterate(self):
+    c = Connection()
+    c.collect(self.collector)
+    c.open()
+    types = [e.type for e in self.collector]
+    assert types == [Event.CONNECTION_INIT, Event.CONNECTION_LOCAL_OPEN], types
+    assert self.collector.drain() == []
+
+class RecordingHandler(Handler):
+
+  def __init__(self, name, log):
+    self.name = name
+    self.log = log
+
+  def on_unhandled(self, event):
+    self.log.append((self.name, "unhandled", event.type))
+
+class OpenHandler(RecordingHandler):
+
+  def on_connection_local_open(self, event):
+    self.log.append((self.name, "open", event.type))
+
+class DispatchTest(CollectorTest):
+
+  def events(self):
+    c = Connection()
+    c.collect(self.collector)
+    c.open()
+    return self.drain()
+
+  def testDispatch(self):
+    log = []
+    for e in self.events():
+      e.dispatch(OpenHandler("h", log))
+    assert log == [("h", "unhandled", Event.CONNECTION_INIT),
+                   ("h", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testOldStyleHandler(self):
+    log = []
+    class Old:
+      def on_connection_init(self, event):
+        log.append(event.type)
+    Event(None, None, Event.CONNECTION_INIT).dispatch(Old())
+    assert log == [Event.CONNECTION_INIT], log
+
+  def testProxyHandler(self):
+    log = []
+    class Proxy(Handler):
+      def __init__(self, target):
+        self.target = target
+      def __getattr__(self, name):
+        return getattr(self.target, name)
+    for e in self.events():
+      e.dispatch(Proxy(OpenHandler("p", log)))
+    assert log == [("p", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testInstanceMethods(self):
+    log = []
+    handler = RecordingHandler("h", log)
+    handler.on_connection_init = lambda event: log.append(("h", "init"))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("h", "init"),
+                   ("h", "unhandled", Event.CONNECTION_LOCAL_OPEN)], log
+
+    del log[:]
+    handler = OpenHandler("h", log)
+    handler.on_unhandled = lambda event: log.append(("h", "instance"))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("h", "instance"),
+                   ("h", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testChainInstanceMethods(self):
+    log = []
+    first = RecordingHandler("a", log)
+    first.on_connection_init = lambda event: log.append(("a", "init"))
+    handler = ChainHandler(first, OpenHandler("b", log))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("a", "init"), ("b", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testFanout(self):
+    log = []
+    handler = FanoutHandler(OpenHandler("a", log), RecordingHandler("b", log))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("a", "unhandled", Event.CONNECTION_INIT),
+                   ("b", "unhandled", Event.CONNECTION_INIT),
+                   ("a", "open", Event.CONNECTION_LOCAL_OPEN),
+                   ("b", "unhandled", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testChain(self):
+    log = []
+    handler = ChainHandler(RecordingHandler("a", log), OpenHandler("b", log))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("b", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
+  def testNested(self):
+    log = []
+    handler = ChainHandler(FanoutHandler(OpenHandler("a", log)),
+                           OpenHandler("b", log))
+    for e in self.events():
+      e.dispatch(handler)
+    assert log == [("a", "unhandled", Event.CONNECTION_INIT),
+                   ("a", "open", Event.CONNECTION_LOCAL_OPEN)], log
+
 class PeerTest(CollectorTest):
 
   def setup(self):
@@ -2407,3 +2819,53 @@ class TeardownLeakTest(PeerTest):
 
   def testLeak(self):
     self.doLeak(False, False)
+
+class CycleTest(Test):
+
+  def cycles(self):
+    conn = Connection()
+    trans = Transport()
+    trans.bind(conn)
+    conn._transport = trans
+    coll = Collector()
+    conn.collect(coll)
+    coll.connection = conn
+    ssn = conn.session()
+    ssn.parent = conn
+    snd = ssn.sender("sender")
+    snd.parent = ssn
+    snd.delivery("tag")
+    SASL(trans).parent = trans
+    msg = Message(body=u"cycle")
+    msg.parent = msg
+    data = Data()
+    data.parent = data
+    url = Url("amqp://localhost")
+    url.parent = url
+
+  def testCollected(self):
+    import proton
+    gc.collect()
+    pending = len(proton._Finalizer._registry)
+    self.cycles()
+    gc.collect()
+    assert not gc.garbage, gc.garbage
+    assert len(proton._Finalizer._registry) == pending
+
+  def testSoak(self):
+    try:
+      import resource
+    except ImportError:
+      raise Skipped()
+    count = int(self.default("cycles", 2000, fast=200, valgrind=20))
+    for i in xrange(count/10):
+      self.cycles()
+    gc.collect()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for i in xrange(count):
+      self.cycles()
+    gc.collect()
+    assert not gc.garbage, gc.garbage
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    # ru_maxrss is in kilobytes
+    assert growth < 10*1024, growth
@@ -103,6 +103,91 @@ class AccessorsTest(Test):
   def testReplyToGroupId(self):
     self._test_str("reply_to_group_id")
 
+class HeaderFieldsTest(Test):
+
+  FIELDS = {"durable": True,
+            "priority": 7,
+            "ttl": 1000,
+            "first_acquirer": True,
+            "delivery_count": 3,
+            "user_id": "user\x00id",
+            "address": "address",
+            "subject": "subject",
+            "reply_to": "reply-to",
+            "content_type": "text/plain",
+            "content_encoding": "utf-8",
+            "expiry_time": 123456789,
+            "creation_time": 987654321,
+            "group_id": "group",
+            "group_sequence": -10,
+            "reply_to_group_id": "reply-to-group"}
+
+  def testDefaults(self):
+    fields = self.msg.get_header_fields()
+    assert len(fields) == len(self.FIELDS) + 2, fields
+    for name, value in fields.items():
+      assert value == getattr(self.msg, name), (name, value)
+
+  def testGet(self):
+    for name, value in self.FIELDS.items():
+      setattr(self.msg, name, value)
+    self.msg.id = 123
+    self.msg.correlation_id = uuid4()
+    fields = self.msg.get_header_fields()
+    for name, value in fields.items():
+      assert value == getattr(self.msg, name), (name, value)
+
+  def testUpdate(self):
+    cid = uuid4()
+    self.msg.update(id=u"id", correlation_id=cid, body=u"body", **self.FIELDS)
+    for name, value in self.FIELDS.items():
+      assert getattr(self.msg, name) == value, (name, getattr(self.msg, name))
+    assert self.msg.id == u"id"
+    assert self.msg.correlation_id == cid
+    assert self.msg.body == u"body"
+
+  def testUpdateNone(self):
+    self.msg.update(address="address", subject="subject")
+    self.msg.update(address=None, subject=None)
+    assert self.msg.address is None
+    assert self.msg.subject is None
+
+  def testUpdateUserId(self):
+    # the same values as the user_id setter
+    for value, expected in ((u"unicode", "unicode"), ("bytes", "bytes"),
+                            (None, "")):
+      assert Message(user_id=value).user_id == expected, value
+      self.msg.user_id = value
+      assert self.msg.user_id == expected, value
+    try:
+      Message(user_id=5)
+      assert False, "expected TypeError"
+    except TypeError:
+      pass
+
+  def testConstructor(self):
+    msg = Message(body=u"body", **self.FIELDS)
+    assert msg.get_header_fields() == Message(**self.FIELDS).get_header_fields()
+    for name, value in self.FIELDS.items():
+      assert getattr(msg, name) == value, (name, getattr(msg, name))
+
+  def testUpdateInvalid(self):
+    try:
+      self.msg.update(no_such_field=1)
+      assert False, "expected AttributeError"
+    except AttributeError:
+      pass
+    try:
+      self.msg.update(priority="high")
+      assert False, "expected TypeError"
+    except TypeError:
+      pass
+    try:
+      self.msg.update(priority=256)
+      assert False, "expected OverflowError"
+    except OverflowError:
+      pass
+
 class CodecTest(Test):
 
   def testRoundTrip(self):
@@ -127,6 +212,183 @@ class CodecTest(Test):
     assert self.msg.subject == msg2.subject, (self.msg.subject, msg2.subject)
     assert self.msg.body == msg2.body, (self.msg.body, msg2.body)
 
+  def testLazySections(self):
+    self.msg.instructions = {"instruction": 1}
+    self.msg.annotations = {symbol("annotation"): 2}
+    self.msg.properties = {"key": "value"}
+    self.msg.body = {"one": [1, 2, 3], "two": {"nested": True}}
+
+    msg2 = Message()
+    msg2.decode(self.msg.encode())
+
+    # only touch the properties before re-encoding
+    msg2.properties["key"] = "changed"
+    msg2.properties["other"] = 3
+
+    msg3 = Message()
+    msg3.decode(msg2.encode())
+
+    assert msg3.properties == {"key": "changed", "other": 3}, msg3.properties
+    assert msg3.instructions == self.msg.instructions, msg3.instructions
+    assert msg3.annotations == self.msg.annotations, msg3.annotations
+    assert msg3.body == self.msg.body, msg3.body
+
+    msg3.clear()
+    assert msg3.instructions is None
+    assert msg3.annotations is None
+    assert msg3.properties is None
+    assert msg3.body is None
+
+  def _reencode(self):
+    msg2 = Message()
+    msg2.decode(self.msg.encode())
+    return msg2
+
+  def testDirtySections(self):
+    self.msg.properties = dict(("key%s" % i, i) for i in range(30))
+    self.msg.body = "one"
+    msg2 = self._reencode()
+    assert msg2.properties == self.msg.properties, msg2.properties
+    assert msg2.body == "one", msg2.body
+
+    self.msg.body = "two"
+    msg2 = self._reencode()
+    assert msg2.properties == self.msg.properties, msg2.properties
+    assert msg2.body == "two", msg2.body
+
+    self.msg.properties["key0"] = "changed"
+    del self.msg.properties["key1"]
+    msg2 = self._reencode()
+    assert msg2.properties["key0"] == "changed", msg2.properties
+    assert "key1" not in msg2.properties, msg2.properties
+    assert msg2.properties == self.msg.properties, msg2.properties
+
+    self.msg.properties.update(key2=2.5)
+    msg2 = self._reencode()
+    assert msg2.properties["key2"] == 2.5, msg2.properties
+
+  def testDirtyNestedSections(self):
+    self.msg.body = {"list": [1, 2]}
+    self._reencode()
+    self.msg.body["list"].append(3)
+    msg2 = self._reencode()
+    assert msg2.body == {"list": [1, 2, 3]}, msg2.body
+
+    self.msg.body = [1, 2]
+    self._reencode()
+    self.msg.body.append(3)
+    self.msg.body[0] = 0
+    msg2 = self._reencode()
+    assert msg2.body == [0, 2, 3], msg2.body
+
+  def testDirtySharedSection(self):
+    props = {"key": "value"}
+    self.msg.properties = props
+    assert self.msg.properties is props
+    msg2 = Message()
+    msg2.properties = props
+    self.msg.encode()
+    msg2.encode()
+    props["key"] = "changed"
+    for msg in self.msg, msg2:
+      msg3 = Message()
+      msg3.decode(msg.encode())
+      assert msg3.properties == {"key": "changed"}, msg3.properties
+
+    # a decoded section shared with a message that did not decode it
+    received = self._reencode()
+    self.msg.properties = received.properties
+    self.msg.encode()
+    received.properties["key"] = "again"
+    received.encode()
+    msg3 = Message()
+    msg3.decode(self.msg.encode())
+    assert msg3.properties == {"key": "again"}, msg3.properties
+
+  def testMarkClean(self):
+    props = dict(("key%s" % i, i) for i in range(30))
+    self.msg.properties = props
+    self.msg.mark_clean("properties")
+    self.msg.body = "one"
+    msg2 = self._reencode()
+    assert msg2.properties == props, msg2.properties
+
+    # a marked section is not encoded again, even if changed in place
+    props["key0"] = "changed"
+    self.msg.body = "two"
+    msg2 = self._reencode()
+    assert msg2.properties["key0"] == 0, msg2.properties
+    assert msg2.body == "two", msg2.body
+
+    # until it is assigned again
+    self.msg.properties = props
+    msg2 = self._reencode()
+    assert msg2.properties["key0"] == "changed", msg2.properties
+
+    try:
+      self.msg.mark_clean("header")
+      assert False, "expected a KeyError"
+    except KeyError:
+      pass
+
+  def testEncodeInto(self):
+    self.msg.address = "address"
+    self.msg.body = u"Hello World!"
+    data = self.msg.encode()
+
+    buf = bytearray(len(data) + 10)
+    n = self.msg.encode_into(buf)
+    assert n == len(data), (n, len(data))
+    assert buf[:n] == data
+
+    n = self.msg.encode_into(buf, 10)
+    assert n == len(data), (n, len(data))
+    assert buf[10:] == data
+
+    try:
+      self.msg.encode_into(buf, 11)
+      assert False, "expected an overflow"
+    except MessageException:
+      pass
+
+  def testDecodeBuffer(self):
+    self.msg.address = "address"
+    self.msg.body = u"Hello World!"
+    data = self.msg.encode()
+    ring = bytearray("xxxx") + bytearray(data) + bytearray("yyyy")
+
+    for encoded in (bytearray(data), memoryview(ring)[4:-4], buffer(data)):
+      msg2 = Message()
+      msg2.decode(encoded)
+      assert msg2.address == "address", msg2.address
+      assert msg2.body == u"Hello World!", msg2.body
+
+  def testDecodeHeaders(self):
+    self.msg.address = "address"
+    self.msg.subject = "subject"
+    self.msg.instructions = {"instruction": 1}
+    self.msg.annotations = {symbol("annotation"): 2}
+    self.msg.properties = {"key": "value"}
+    self.msg.body = u"Hello World!"
+    data = self.msg.encode()
+
+    msg2 = Message()
+    msg2.body = u"stale"
+    msg2.decode_headers(data)
+    assert msg2.address == "address", msg2.address
+    assert msg2.subject == "subject", msg2.subject
+    assert msg2.instructions == self.msg.instructions, msg2.instructions
+    assert msg2.annotations == self.msg.annotations, msg2.annotations
+    assert msg2.properties is None, msg2.properties
+    assert msg2.body is None, msg2.body
+
+  def testLoadBody(self):
+    self.msg.format = Message.AMQP
+    self.msg.load("[1, 2]")
+    assert self.msg.body == [1, 2], self.msg.body
+    msg2 = self._reencode()
+    assert msg2.body == [1, 2], msg2.body
+
 class LoadSaveTest(Test):
 
   def _test(self, fmt, *bodies):
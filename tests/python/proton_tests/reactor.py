@@ -0,0 +1,283 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+
+import sys
+from time import time
+from proton import *
+from common import Test, Skipped
+
+class EchoServer(Handler):
+
+  def __init__(self):
+    self.senders = {}
+
+  def on_connection_remote_open(self, event):
+    event.connection.open()
+
+  def on_session_remote_open(self, event):
+    event.session.open()
+
+  def on_link_remote_open(self, event):
+    link = event.link
+    link.source.copy(link.remote_source)
+    link.target.copy(link.remote_target)
+    link.open()
+    if link.is_receiver:
+      link.flow(100)
+    else:
+      self.senders[link.connection] = link
+
+  def on_delivery(self, event):
+    dlv = event.delivery
+    rcv = dlv.link
+    if not rcv.is_receiver or dlv.partial:
+      return
+    body = rcv.recv(dlv.pending)
+    rcv.advance()
+    dlv.settle()
+    rcv.flow(1)
+    snd = self.senders[rcv.connection]
+    reply = snd.delivery(dlv.tag)
+    snd.send(body)
+    snd.advance()
+    reply.settle()
+
+  def on_connection_remote_close(self, event):
+    event.connection.close()
+
+class EchoClient(Handler):
+
+  def __init__(self, reactor, port):
+    self.reactor = reactor
+    self.port = port
+    self.remaining = {}
+    self.received = {}
+
+  def connect(self, count):
+    conn = Connection()
+    conn.open()
+    ssn = conn.session()
+    ssn.open()
+    snd = ssn.sender("echo-in")
+    snd.target.address = "echo"
+    snd.open()
+    rcv = ssn.receiver("echo-out")
+    rcv.source.address = "echo"
+    rcv.open()
+    rcv.flow(count)
+    self.remaining[conn] = count
+    self.received[conn] = []
+    return self.reactor.connect("127.0.0.1", self.port, conn)
+
+  def on_link_flow(self, event):
+    snd = event.link
+    conn = snd.connection
+    while snd.is_sender and snd.credit > 0 and self.remaining[conn] > 0:
+      self.remaining[conn] -= 1
+      dlv = snd.delivery("tag-%s" % self.remaining[conn])
+      snd.send("message-%s" % self.remaining[conn])
+      snd.advance()
+      dlv.settle()
+
+  def on_delivery(self, event):
+    dlv = event.delivery
+    rcv = dlv.link
+    if not rcv.is_receiver or dlv.partial:
+      return
+    self.received[rcv.connection].append(rcv.recv(dlv.pending))
+    rcv.advance()
+    dlv.settle()
+    if rcv.credit == 0:
+      rcv.connection.close()
+
+class Recorder(Handler):
+
+  def __init__(self):
+    self.types = []
+
+  def on_unhandled(self, event):
+    self.types.append(event.type)
+
+class ReactorTest(Test):
+
+  def setup(self):
+    if "java" in sys.platform:
+      raise Skipped()
+    self.server = Reactor(EchoServer())
+    self.port = self.server.listen("127.0.0.1", 0).getsockname()[1]
+    self.reactor = Reactor()
+    self.reactor.handler = EchoClient(self.reactor, self.port)
+
+  def teardown(self):
+    self.server.close()
+    self.reactor.close()
+
+  def run_until(self, predicate):
+    deadline = time() + self.timeout
+    while not predicate():
+      assert time() < deadline, "timed out"
+      self.reactor.run_once(0.01)
+      self.server.run_once(0.01)
+
+  def testEcho(self):
+    conn = self.reactor.handler.connect(10)
+    self.run_until(lambda: self.reactor.transport(conn) is None)
+    received = self.reactor.handler.received[conn]
+    assert sorted(received) == \
+        sorted(["message-%s" % i for i in range(10)]), received
+
+  def testManyConnections(self):
+    client = self.reactor.handler
+    conns = [client.connect(5) for i in range(50)]
+    self.run_until(lambda: sum([len(r) for r in client.received.values()]) == 250)
+    for conn in conns:
+      assert len(client.received[conn]) == 5, client.received[conn]
+
+  def testTransportEvents(self):
+    recorder = Recorder()
+    self.reactor.handler = recorder
+    conn = self.reactor.connect("127.0.0.1", self.port)
+    conn.open()
+    self.run_until(lambda: Event.CONNECTION_REMOTE_OPEN in recorder.types)
+    conn.close()
+    self.run_until(lambda: Event.CONNECTION_UNBOUND in recorder.types)
+    assert Event.CONNECTION_BOUND in recorder.types, recorder.types
+    assert Event.TRANSPORT_CLOSED in recorder.types, recorder.types
+    assert self.reactor.transport(conn) is None
+
+  def testRefused(self):
+    self.server.close()
+    recorder = Recorder()
+    self.reactor.handler = recorder
+    conn = self.reactor.connect("127.0.0.1", self.port)
+    conn.open()
+    self.reactor.run()
+    assert Event.TRANSPORT_CLOSED in recorder.types, recorder.types
+    assert self.reactor.transport(conn) is None
+
+class Pipe(object):
+  """
+  Stands in for an asyncio transport, buffering what the protocol
+  writes until the test passes it on.
+  """
+
+  def __init__(self, protocol, high_water=None):
+    self.protocol = protocol
+    self.high_water = high_water
+    self.buffer = ""
+    self.eof = False
+    self.closed = False
+    self.reading = True
+
+  def write(self, data):
+    self.buffer += data
+    if self.high_water is not None and len(self.buffer) > self.high_water:
+      self.protocol.pause_writing()
+
+  def drain(self):
+    data = self.buffer
+    self.buffer = ""
+    if self.high_water is not None:
+      self.protocol.resume_writing()
+    return data
+
+  def can_write_eof(self):
+    return True
+
+  def write_eof(self):
+    self.eof = True
+
+  def close(self):
+    self.closed = True
+
+  def pause_reading(self):
+    self.reading = False
+
+  def resume_reading(self):
+    self.reading = True
+
+class AmqpProtocolTest(Test):
+
+  def setup(self):
+    self.loop = SelectLoop()
+    self.client = AmqpProtocol(loop=self.loop)
+    self.server = AmqpProtocol(handler=EchoServer(), loop=self.loop)
+    self.client_io = Pipe(self.client)
+    self.server_io = Pipe(self.server)
+    self.client.connection_made(self.client_io)
+    self.server.connection_made(self.server_io)
+
+  def pump(self):
+    while self.client_io.buffer or self.server_io.buffer:
+      if self.client_io.buffer:
+        self.server.data_received(self.client_io.drain())
+      if self.server_io.buffer:
+        self.client.data_received(self.server_io.drain())
+      if self.client_io.eof:
+        self.server.eof_received()
+      if self.server_io.eof:
+        self.client.eof_received()
+
+  def testOpenClose(self):
+    conn = self.client.connection
+    conn.open()
+    self.client.process()
+    self.pump()
+    assert conn.state == Endpoint.LOCAL_ACTIVE | Endpoint.REMOTE_ACTIVE, conn.state
+    conn.close()
+    self.client.process()
+    self.pump()
+    assert conn.state == Endpoint.LOCAL_CLOSED | Endpoint.REMOTE_CLOSED, conn.state
+    for io in self.client_io, self.server_io:
+      assert io.closed or io.eof
+
+  def testBackpressure(self):
+    conn = self.client.connection
+    conn.open()
+    self.client_io.high_water = 0
+    self.client.process()
+    sent = self.client_io.buffer
+    assert sent
+    self.client_io.buffer = ""
+    ssn = conn.session()
+    ssn.open()
+    self.client.process()
+    # writing stays paused until the buffer drains
+    assert self.client_io.buffer == "", self.client_io.buffer
+    self.client_io.high_water = None
+    self.client.resume_writing()
+    assert self.client_io.buffer
+    self.client_io.buffer = sent + self.client_io.buffer
+    self.pump()
+    assert ssn.state == Endpoint.LOCAL_ACTIVE | Endpoint.REMOTE_ACTIVE, ssn.state
+
+  def testTick(self):
+    self.client.transport.idle_timeout = 0.01
+    self.client.connection.open()
+    self.client.process()
+    self.pump()
+    frames = self.client.transport.frames_input
+    # the server's keepalive is due first; the loop may wake up a little
+    # early, so wait for its timer to fire
+    deadline = self.server._deadline
+    while self.server._deadline == deadline:
+      self.loop.run_once(1)
+    self.pump()
+    assert self.client.transport.frames_input > frames
@@ -161,3 +161,48 @@ class TransportTest(Test):
     self.peer.push(dat1)
     self.peer.push(dat2[len(dat1):])
     self.peer.push(dat3)
+
+  def open(self, container):
+    conn = Connection()
+    conn.container = container
+    self.transport.bind(conn)
+    conn.open()
+    return conn
+
+  def testPushFrom(self):
+    conn = self.open("test-container")
+    out = self.transport.peek(1024)
+    buf = bytearray("XXXX" + out + "YYYY")
+    self.peer.push_from(buf, 4, len(out))
+    assert self.conn.remote_container == "test-container", \
+        self.conn.remote_container
+
+  def testPeekInto(self):
+    out = self.transport.peek(1024)
+    buf = bytearray(2 + len(out))
+    n = self.transport.peek_into(buf, 2)
+    assert n == len(out), (n, len(out))
+    assert str(buf[2:]) == out, (buf, out)
+    self.transport.pop(n)
+    self.transport.close_head()
+    assert self.transport.peek_into(buf) is None
+
+  def testSocket(self):
+    import socket
+    if not hasattr(socket, "socketpair"):
+      raise common.Skipped()
+    conn = self.open("test-container")
+    left, right = socket.socketpair()
+    try:
+      pending = self.transport.pending()
+      assert self.transport.send_to_socket(left) == pending
+      assert self.transport.pending() == 0
+      assert self.peer.recv_from_socket(right) == pending
+      assert self.conn.remote_container == "test-container", \
+          self.conn.remote_container
+      left.close()
+      assert self.peer.recv_from_socket(right) is None
+      assert self.peer.capacity() < 0
+    finally:
+      left.close()
+      right.close()
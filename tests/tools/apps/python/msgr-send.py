@@ -37,6 +37,7 @@ Usage: msgr-send [OPTIONS]
  -W # \tIncoming window size [0]
  -B # \tArgument to Messenger::recv(n) [-1]
  -N <name> \tSet the container name to <name>
+ -M # \tEnqueue messages using Messenger::put_many() in groups of # [0=use put()]
  -V \tEnable debug logging"""
 
 
@@ -53,6 +54,7 @@ def parse_options( argv ):
     parser.add_option("-W", dest="incoming_window", type="int")
     parser.add_option("-B", dest="recv_count", type="int", default=-1)
     parser.add_option("-N", dest="name", type="string")
+    parser.add_option("-M", dest="put_batch", type="int", default=0)
     parser.add_option("-V", dest="verbose", action="store_true")
 
     return parser.parse_args(args=argv)
@@ -97,7 +99,7 @@ class Statistics(object):
 
 
 
-def process_replies( messenger, message, stats, max_count, log):
+def process_replies( messenger, pool, stats, max_count, log):
     """
     Return the # of reply messages received
     """
@@ -105,12 +107,12 @@ def process_replies( messenger, message, stats, max_count, log):
     log.debug("Calling pn_messenger_recv(%d)", max_count)
     messenger.recv( max_count )
     log.debug("Messages on incoming queue: %d", messenger.incoming)
-    while messenger.incoming > 0:
-        messenger.get( message )
+    for message, tracker in messenger.get_many( pool=pool ):
         received += 1
         # TODO: header decoding?
         stats.msg_received( message )
         # uint64_t id = pn_message_get_correlation_id( message ).u.as_ulong;
+        pool.append( message )
     return received
 
 def main(argv=None):
@@ -133,7 +135,7 @@ def main(argv=None):
     message = Message()
     message.reply_to = "~"
     message.load( "X" * opts.msg_size )
-    reply_message = Message()
+    reply_pool = [Message()]
     messenger = Messenger( opts.name )
 
     if opts.outgoing_window is not None:
@@ -153,24 +155,43 @@ def main(argv=None):
             if y:
                 targets.append(y)
 
+    # when batching puts, each message in a group needs its own Message
+    # object since put_many() encodes the whole group in one call
+    batch = [message]
+    for i in range(1, opts.put_batch):
+        m = Message()
+        m.reply_to = "~"
+        m.load( "X" * opts.msg_size )
+        batch.append(m)
+
     stats.start()
     while opts.msg_count == 0 or sent < opts.msg_count:
-        # send a message
-        message.address = targets[target_index]
-        if target_index == len(targets) - 1:
-            target_index = 0
+        if opts.put_batch:
+            count = opts.put_batch
+            if opts.msg_count:
+                count = min(count, opts.msg_count - sent)
+        else:
+            count = 1
+        for m in batch[:count]:
+            m.address = targets[target_index]
+            if target_index == len(targets) - 1:
+                target_index = 0
+            else:
+                target_index += 1
+            m.correlation_id = sent
+            m.creation_time = long(time.time() * 1000)
+            sent += 1
+        # send the message(s)
+        if opts.put_batch:
+            messenger.put_many( batch[:count] )
         else:
-            target_index += 1
-        message.correlation_id = sent
-        message.creation_time = long(time.time() * 1000)
-        messenger.put( message )
-        sent += 1
+            messenger.put( message )
 
         if opts.send_batch and (messenger.outgoing >= opts.send_batch):
             if opts.get_replies:
                 while received < sent:
                     # this will also transmit any pending sent messages
-                    received += process_replies( messenger, reply_message,
+                    received += process_replies( messenger, reply_pool,
                                                  stats, opts.recv_count, log )
             else:
                 log.debug("Calling pn_messenger_send()")
@@ -181,7 +202,7 @@ def main(argv=None):
     if opts.get_replies:
         # wait for the last of the replies
         while received < sent:
-            count = process_replies( messenger, reply_message, stats,
+            count = process_replies( messenger, reply_pool, stats,
                                      opts.recv_count, log )
             received += count
             log.debug("Messages received=%d sent=%d", received, sent)